@@ -206,14 +206,12 @@ class AnglePlanesWidget(ScriptedLoadableModuleWidget):
         end = list.GetNumberOfItems()
         for i in range(0,end):
             fidList = list.GetItemAsObject(i)
-            landmarkDescription = self.ShapeQuantifierCore.decodeJSON(fidList.GetAttribute("landmarkDescription"))
+            landmarkDescription = self.ShapeQuantifierCore.getLandmarkDescription(fidList)
             if landmarkDescription:
                 for n in range(fidList.GetNumberOfMarkups()):
                     markupID = fidList.GetNthMarkupID(n)
                     markupLabel = fidList.GetNthMarkupLabel(n)
-                    landmarkDescription[markupID]["landmarkLabel"] = markupLabel
-                print landmarkDescription
-                fidList.SetAttribute("landmarkDescription",self.ShapeQuantifierCore.encodeJSON(landmarkDescription))
+                    landmarkDescription.setLabel(markupID, markupLabel)
 
         onSurface = self.loadLandmarksOnSurfacCheckBox.isChecked()
         self.ShapeQuantifierCore.connectLandmarks(self.inputModelSelector,
@@ -227,10 +225,7 @@ class AnglePlanesWidget(ScriptedLoadableModuleWidget):
         print "-------Model Changed--------"
         if self.ShapeQuantifierCore.selectedModel:
             Model = self.ShapeQuantifierCore.selectedModel
-            try:
-                Model.RemoveObserver(self.ShapeQuantifierCore.decodeJSON(self.ShapeQuantifierCore.selectedModel.GetAttribute("modelModifieTagEvent")))
-            except:
-                pass
+            self.ShapeQuantifierCore.removeObserver(Model, Model.TransformModifiedEvent)
         self.ShapeQuantifierCore.selectedModel = self.inputModelSelector.currentNode()
         self.ShapeQuantifierCore.ModelChanged(self.inputModelSelector, self.inputLandmarksSelector)
         self.inputLandmarksSelector.setCurrentNode(None)
@@ -261,17 +256,16 @@ class AnglePlanesWidget(ScriptedLoadableModuleWidget):
             return
         selectedFidReflID = self.ShapeQuantifierCore.findIDFromLabel(fidList, self.landmarkComboBox.currentText)
         isOnSurface = self.surfaceDeplacementCheckBox.isChecked()
-        landmarkDescription = self.ShapeQuantifierCore.decodeJSON(fidList.GetAttribute("landmarkDescription"))
+        landmarkDescription = self.ShapeQuantifierCore.getLandmarkDescription(fidList)
         if isOnSurface:
             hardenModel = slicer.app.mrmlScene().GetNodeByID(fidList.GetAttribute("hardenModelID"))
-            landmarkDescription[selectedFidReflID]["projection"]["isProjected"] = True
-            landmarkDescription[selectedFidReflID]["projection"]["closestPointIndex"] =\
+            landmarkDescription[selectedFidReflID].isProjected = True
+            landmarkDescription[selectedFidReflID].closestPointIndex =\
                 self.ShapeQuantifierCore.projectOnSurface(hardenModel, fidList, selectedFidReflID)
         else:
-            landmarkDescription[selectedFidReflID]["projection"]["isProjected"] = False
-            landmarkDescription[selectedFidReflID]["projection"]["closestPointIndex"] = None
-            landmarkDescription[selectedFidReflID]["ROIradius"] = 0
-        fidList.SetAttribute("landmarkDescription",self.ShapeQuantifierCore.encodeJSON(landmarkDescription))
+            landmarkDescription[selectedFidReflID].isProjected = False
+            landmarkDescription[selectedFidReflID].closestPointIndex = None
+            landmarkDescription[selectedFidReflID].ROIradius = 0
 
     def onChangeMiddlePointFiducialNode(self):
         key = self.selectPlaneForMidPoint.currentText
@@ -282,6 +276,11 @@ class AnglePlanesWidget(ScriptedLoadableModuleWidget):
         self.ShapeQuantifierCore.updateLandmarkComboBox(fidList, self.landmarkComboBox1MidPoint)
         self.ShapeQuantifierCore.updateLandmarkComboBox(fidList, self.landmarkComboBox2MidPoint)
 
+    def updatePlanesEvent(self, obj, event):
+        for planeControls in self.planeControlsDictionary.values():
+            if planeControls.fidlist is obj:
+                planeControls.update()
+
     def onChangeModelDisplay(self, obj, event):
         self.updateOnSurfaceCheckBoxes()
 
@@ -373,11 +372,10 @@ class AnglePlanesWidget(ScriptedLoadableModuleWidget):
         bound = [maxValue, -maxValue, maxValue, -maxValue, maxValue, -maxValue]
         for i in positionOfVisibleNodes:
             node = slicer.mrmlScene.GetNthNodeByClass(i, "vtkMRMLModelNode")
-            model = self.ShapeQuantifierCore.createIntermediateHardenModel(node)
-            polydata = model.GetPolyData()
-            if polydata is None or not hasattr(polydata, "GetBounds"):
+            # the bounds are computed from the transform, the model is not hardened
+            tempbound = self.ShapeQuantifierCore.getTransformedBounds(node)
+            if tempbound is None:
                 continue
-            tempbound = polydata.GetBounds()
             bound[0] = min(bound[0], tempbound[0])
             bound[2] = min(bound[2], tempbound[2])
             bound[4] = min(bound[4], tempbound[4])
@@ -489,24 +487,23 @@ class AnglePlanesWidget(ScriptedLoadableModuleWidget):
         fidList.AddFiducial(coord[0],coord[1],coord[2])
         fidList.SetNthFiducialSelected(fidList.GetNumberOfMarkups() - 1, False)
         # update of the data structure
-        landmarkDescription = self.ShapeQuantifierCore.decodeJSON(fidList.GetAttribute("landmarkDescription"))
+        landmarkDescription = self.ShapeQuantifierCore.getLandmarkDescription(fidList)
         numOfMarkups = fidList.GetNumberOfMarkups()
         markupID = fidList.GetNthMarkupID(numOfMarkups - 1)
-        landmarkDescription[landmark1ID]["midPoint"]["definedByThisMarkup"].append(markupID)
-        landmarkDescription[landmark2ID]["midPoint"]["definedByThisMarkup"].append(markupID)
-        landmarkDescription[markupID]["midPoint"]["isMidPoint"] = True
-        landmarkDescription[markupID]["midPoint"]["Point1"] = landmark1ID
-        landmarkDescription[markupID]["midPoint"]["Point2"] = landmark2ID
-        landmarkDescription[markupID]["projection"]["isProjected"] = False
-        landmarkDescription[markupID]["projection"]["closestPointIndex"] = None
+        landmarkDescription[landmark1ID].definedByThisMarkup.append(markupID)
+        landmarkDescription[landmark2ID].definedByThisMarkup.append(markupID)
+        landmarkDescription[markupID].isMidPoint = True
+        landmarkDescription[markupID].Point1 = landmark1ID
+        landmarkDescription[markupID].Point2 = landmark2ID
+        landmarkDescription[markupID].isProjected = False
+        landmarkDescription[markupID].closestPointIndex = None
         if self.midPointOnSurfaceCheckBox.isChecked():
-            landmarkDescription[markupID]["projection"]["isProjected"] = True
+            landmarkDescription[markupID].isProjected = True
             hardenModel = slicer.app.mrmlScene().GetNodeByID(fidList.GetAttribute("hardenModelID"))
-            landmarkDescription[markupID]["projection"]["closestPointIndex"] = \
+            landmarkDescription[markupID].closestPointIndex = \
                 self.ShapeQuantifierCore.projectOnSurface(hardenModel, fidList, markupID)
         else:
-            landmarkDescription[markupID]["projection"]["isProjected"] = False
-        fidList.SetAttribute("landmarkDescription",self.ShapeQuantifierCore.encodeJSON(landmarkDescription))
+            landmarkDescription[markupID].isProjected = False
         self.ShapeQuantifierCore.interface.UpdateInterface()
         self.ShapeQuantifierCore.updateLandmarkComboBox(fidList, self.landmarkComboBox, False)
         fidList.SetNthFiducialPositionFromArray(numOfMarkups - 1, coord)
@@ -955,19 +952,19 @@ class AnglePlanesLogic(ScriptedLoadableModuleLogic):
             slider = 1
 
         coord = numpy.zeros(3)
-        landmark1Index = fidList.GetMarkupIndexByID(landmark1ID)
+        landmark1Index = self.ShapeQuantifierCore.getMarkupIndex(fidList, landmark1ID)
         fidList.GetNthFiducialPosition(landmark1Index, coord)
         # print "Landmark1Value: ", coord
         r1 = coord[0]
         a1 = coord[1]
         s1 = coord[2]
-        landmark2Index = fidList.GetMarkupIndexByID(landmark2ID)
+        landmark2Index = self.ShapeQuantifierCore.getMarkupIndex(fidList, landmark2ID)
         fidList.GetNthFiducialPosition(landmark2Index, coord)
         # print "Landmark2Value: ", coord
         r2 = coord[0]
         a2 = coord[1]
         s2 = coord[2]
-        landmark3Index = fidList.GetMarkupIndexByID(landmark3ID)
+        landmark3Index = self.ShapeQuantifierCore.getMarkupIndex(fidList, landmark3ID)
         fidList.GetNthFiducialPosition(landmark3Index, coord)
         # print "Landmark3Value: ", coord
         r3 = coord[0]
@@ -1215,7 +1212,7 @@ class AnglePlanesTest(ScriptedLoadableModuleTest):
         plane = widget.planeControlsDictionary[PlaneName]
         for point in PlanePointsCoords:
             inputMarkupsFiducial.AddFiducial(point[0], point[1], point[2])
-            widget.ShapeQuantifierCore.onPointModifiedEvent(inputMarkupsFiducial,None)
+            widget.ShapeQuantifierCore.processPointModified(inputMarkupsFiducial)
         plane.landmark1ComboBox.setCurrentIndex(0)
         plane.landmark2ComboBox.setCurrentIndex(1)
         plane.landmark3ComboBox.setCurrentIndex(2)
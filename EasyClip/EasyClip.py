@@ -181,13 +181,12 @@ class EasyClipWidget(ScriptedLoadableModuleWidget):
         end = list.GetNumberOfItems()
         for i in range(0,end):
             fidList = list.GetItemAsObject(i)
-            landmarkDescription = self.ShapeQuantifierCore.decodeJSON(fidList.GetAttribute("landmarkDescription"))
+            landmarkDescription = self.ShapeQuantifierCore.getLandmarkDescription(fidList)
             if landmarkDescription:
                 for n in range(fidList.GetNumberOfMarkups()):
                     markupID = fidList.GetNthMarkupID(n)
                     markupLabel = fidList.GetNthMarkupLabel(n)
-                    landmarkDescription[markupID]["landmarkLabel"] = markupLabel
-                fidList.SetAttribute("landmarkDescription",self.ShapeQuantifierCore.encodeJSON(landmarkDescription))
+                    landmarkDescription.setLabel(markupID, markupLabel)
         self.onComputeBox()
 
         self.logic.onCheckBoxClicked('Red', self.red_plane_box, self.radio_red_Neg)
@@ -238,10 +237,10 @@ class EasyClipWidget(ScriptedLoadableModuleWidget):
             fidList.SetAttribute("hardenModelID", value)
         for key,value in self.modelIDdict.iteritems():
             fidList = slicer.mrmlScene.GetNodeByID(key)
-            fidList.SetAttribute("connectedModelID", value)
+            self.ShapeQuantifierCore.setConnectedModel(fidList, slicer.mrmlScene.GetNodeByID(value))
         for key,value in self.landmarkDescriptionDict.iteritems():
             fidList = slicer.mrmlScene.GetNodeByID(key)
-            fidList.SetAttribute("landmarkDescription",value)
+            self.ShapeQuantifierCore.setLandmarkDescription(fidList, value)
 
     def onComputeBox(self):
         #--------------------------- Box around the model --------------------------#
@@ -255,11 +254,10 @@ class EasyClipWidget(ScriptedLoadableModuleWidget):
         bound = [maxValue, -maxValue, maxValue, -maxValue, maxValue, -maxValue]
         for i in positionOfVisibleNodes:
             node = slicer.mrmlScene.GetNthNodeByClass(i, "vtkMRMLModelNode")
-            model = self.ShapeQuantifierCore.createIntermediateHardenModel(node)
-            polydata = model.GetPolyData()
-            if polydata is None or not hasattr(polydata, "GetBounds"):
+            # the bounds are computed from the transform, the model is not hardened
+            tempbound = self.ShapeQuantifierCore.getTransformedBounds(node)
+            if tempbound is None:
                 continue
-            tempbound = polydata.GetBounds()
             bound[0] = min(bound[0], tempbound[0])
             bound[2] = min(bound[2], tempbound[2])
             bound[4] = min(bound[4], tempbound[4])
@@ -465,29 +463,23 @@ class EasyClipLogic(ScriptedLoadableModuleLogic):
             polyDataNew = clipper.GetOutput()
             model.SetAndObservePolyData(polyDataNew)
             # Checking if one ore more fiducial list are connected to this model
-            list = slicer.mrmlScene.GetNodesByClass("vtkMRMLMarkupsFiducialNode")
-            end = list.GetNumberOfItems()
-            for i in range(0,end):
-                fidList = list.GetItemAsObject(i)
-                if fidList.GetAttribute("connectedModelID"):
-                    if fidList.GetAttribute("connectedModelID") == model.GetID():
-                        modelIDdict[fidList.GetID()], hardenModelIDdict[fidList.GetID()], landmarkDescriptionDict[fidList.GetID()] = \
-                            self.unprojectLandmarks(fidList)
+            for fidList in self.ShapeQuantifierCore.getConnectedFiducialLists(model):
+                modelIDdict[fidList.GetID()], hardenModelIDdict[fidList.GetID()], landmarkDescriptionDict[fidList.GetID()] = \
+                    self.unprojectLandmarks(fidList)
         return dictionnaryModel, modelIDdict, hardenModelIDdict, landmarkDescriptionDict
 
     def unprojectLandmarks(self, fidList):
         hardenModelID = fidList.GetAttribute("hardenModelID")
         ModelID = fidList.GetAttribute("connectedModelID")
-        landmarkDescriptioncopy = fidList.GetAttribute("landmarkDescription")
-        fidList.SetAttribute("connectedModelID", None)
+        landmarkDescription = self.ShapeQuantifierCore.getLandmarkDescription(fidList)
+        landmarkDescriptioncopy = landmarkDescription.copy()
+        self.ShapeQuantifierCore.setConnectedModel(fidList, None)
         fidList.SetAttribute("hardenModelID", None)
-        landmarkDescription = self.ShapeQuantifierCore.decodeJSON(fidList.GetAttribute("landmarkDescription"))
         for n in range(fidList.GetNumberOfMarkups()):
             markupID = fidList.GetNthMarkupID(n)
-            landmarkDescription[markupID]["projection"]["isProjected"] = False
-            landmarkDescription[markupID]["projection"]["closestPointIndex"] = None
-            landmarkDescription[markupID]["ROIradius"] = 0
-        fidList.SetAttribute("landmarkDescription",self.ShapeQuantifierCore.encodeJSON(landmarkDescription))
+            landmarkDescription[markupID].isProjected = False
+            landmarkDescription[markupID].closestPointIndex = None
+            landmarkDescription[markupID].ROIradius = 0
         return ModelID, hardenModelID, landmarkDescriptioncopy
 
 
@@ -5,8 +5,11 @@ import csv
 import os
 import sys
 import logging
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 from __main__ import vtk, qt, ctk, slicer
 from random import randint
+from vtk.util import numpy_support
 from slicer.ScriptedLoadableModule import *
 
 class MeshStatistics(ScriptedLoadableModule):
@@ -55,6 +58,8 @@ class MeshStatisticsWidget(ScriptedLoadableModuleWidget):
                                #                               Value = dictionary of shapes
                                #                                             key = name of shapes
                                #                                             value = Statistics store()
+        self.populationDict = dict()  # same structure as ROIDict, the shapes are the whole population
+                                      # and the groups of models ("[Population]", "[Group] <name>")
 
 
 
@@ -105,6 +110,12 @@ class MeshStatisticsWidget(ScriptedLoadableModuleWidget):
         #                          Statistics Table - Export
         # ------------------------------------------------------------------------------------
         self.mainLayout = self.ShapeQuantifierCore.get("mainLayout")
+        # percentiles estimated by chunks with a bounded memory, for the very large fields
+        self.approximatePercentilesCheckBox = qt.QCheckBox('Approximate Percentiles (bounded memory)')
+        self.mainLayout.insertWidget(self.mainLayout.indexOf(self.runButton), self.approximatePercentilesCheckBox)
+        # statistics of all the models together and of each group of models (attribute "MeshStatistics.Group")
+        self.populationStatisticsCheckBox = qt.QCheckBox('Population and Group Statistics')
+        self.mainLayout.insertWidget(self.mainLayout.indexOf(self.runButton), self.populationStatisticsCheckBox)
         self.tabROI = qt.QTabWidget()
         self.tabROI.setTabPosition(0)
         self.tabROI.adjustSize()
@@ -143,6 +154,8 @@ class MeshStatisticsWidget(ScriptedLoadableModuleWidget):
         self.fieldList = list()
         self.ROIList = list()
         self.ROIDict = dict()
+        self.populationDict = dict()
+        self.logic.statisticsCache.clear()
         self.ROIComboBox.clear()
         self.tableField.clearContents()
         self.tableField.setRowCount(0)
@@ -168,23 +181,240 @@ class MeshStatisticsWidget(ScriptedLoadableModuleWidget):
 
     def onRunButton(self):
         self.ROIDict.clear()
+        self.populationDict.clear()
+        self.logic.approximatePercentiles = self.approximatePercentilesCheckBox.isChecked()
+        self.logic.populationStatistics = self.populationStatisticsCheckBox.isChecked()
         if self.modelList:
             self.logic.removeTable(self.mainLayout, self.tabROI)
             self.exportButton.disconnect('clicked()', self.onExportButton)
             self.mainLayout.removeWidget(self.exportButton)
             self.mainLayout.removeItem(self.exportLayout)
-        self.logic.displayStatistics(self.ROICheckBox.isChecked(), self.ROIList, self.ROIDict, self.ROIComboBox,
-                                     self.tableField, self.modelList, self.tabROI, self.mainLayout)
-        self.mainLayout.addLayout(self.exportLayout)
-        self.exportButton.connect('clicked()', self.onExportButton)
+        progressDialog = qt.QProgressDialog("Computing the statistics...", "Cancel", 0, 0, slicer.util.mainWindow())
+        progressDialog.setWindowModality(qt.Qt.WindowModal)
+        progressDialog.setMinimumDuration(500)
+
+        def onProgress(numberOfComputedTasks, numberOfTasks):
+            progressDialog.setMaximum(numberOfTasks)
+            progressDialog.setValue(numberOfComputedTasks)
+            slicer.app.processEvents()
+            return not progressDialog.wasCanceled
+
+        # the interface is restored even if the computation fails
+        try:
+            self.logic.displayStatistics(self.ROICheckBox.isChecked(), self.ROIList, self.ROIDict, self.ROIComboBox,
+                                         self.tableField, self.modelList, self.tabROI, self.mainLayout, onProgress,
+                                         self.populationDict)
+        finally:
+            progressDialog.close()
+            self.mainLayout.addLayout(self.exportLayout)
+            self.exportButton.connect('clicked()', self.onExportButton)
 
 
     def onExportButton(self):
-        self.logic.exportationFunction(self.directoryExport, self.exportCheckBox.isChecked(), self.ROIDict)
+        self.logic.exportationFunction(self.directoryExport, self.exportCheckBox.isChecked(),
+                                       self.logic.addPopulationRows(self.ROIDict, self.populationDict))
         if self.exportPointValueCheckBox.isChecked():
             self.logic.ExportationValueOnEachPoint(self.directoryExport, self.ROIDict)
 
 
+class QuantileSketch(object):
+    # Streaming quantile sketch (KLL) which can be merged with the sketches of other fields.
+    # The values are kept in levels of compactors, a value of the level h stands for 2^h input
+    # values. When a level is full, it is sorted and one value out of two (randomly the odd or
+    # the even ones) goes to the next level. The memory is about 3k values whatever the number
+    # of values added, and the rank error of the quantiles decreases as k increases.
+
+    def __init__(self, k = 200):
+        self.k = k
+        self.levels = [numpy.zeros(0)]
+        self.count = 0
+        self.min = None
+        self.max = None
+        # variance of the rank error (in number of values) added by the compactions
+        self.rankErrorVariance = 0.0
+        self.random = numpy.random.RandomState(0)
+
+    def getCapacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(2, int(math.ceil(self.k * (2.0 / 3.0) ** depth)))
+
+    def update(self, values):
+        values = numpy.asarray(values, dtype = numpy.float64).ravel()
+        if not values.size:
+            return
+        self.count += values.size
+        self.min = values.min() if self.min is None else min(self.min, values.min())
+        self.max = values.max() if self.max is None else max(self.max, values.max())
+        self.levels[0] = numpy.concatenate((self.levels[0], values))
+        self.compress()
+
+    def merge(self, sketch):
+        if not sketch.count:
+            return
+        while len(self.levels) < len(sketch.levels):
+            self.levels.append(numpy.zeros(0))
+        for level, values in enumerate(sketch.levels):
+            self.levels[level] = numpy.concatenate((self.levels[level], values))
+        self.count += sketch.count
+        self.min = sketch.min if self.min is None else min(self.min, sketch.min)
+        self.max = sketch.max if self.max is None else max(self.max, sketch.max)
+        self.rankErrorVariance += sketch.rankErrorVariance
+        self.compress()
+
+    def compress(self):
+        level = 0
+        while level < len(self.levels):
+            if self.levels[level].size >= self.getCapacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append(numpy.zeros(0))
+                values = numpy.sort(self.levels[level])
+                # with an odd number of values, the lowest one stays in the level
+                numberOfKeptValues = values.size % 2
+                promotedValues = values[numberOfKeptValues + self.random.randint(2)::2]
+                self.levels[level + 1] = numpy.concatenate((self.levels[level + 1], promotedValues))
+                self.levels[level] = values[:numberOfKeptValues]
+                # the rank of a value is changed by -2^level or +2^level with the same probability
+                self.rankErrorVariance += 4.0 ** level
+            level += 1
+
+    def getQuantiles(self, percents):
+        # lowest value with a rank of at least count * percent, as computePercentile of MeshStatisticsLogic
+        values = numpy.concatenate(self.levels)
+        weights = numpy.concatenate([numpy.ones(levelValues.size) * 2 ** level
+                                     for level, levelValues in enumerate(self.levels)])
+        order = numpy.argsort(values, kind = 'mergesort')
+        cumulativeWeights = numpy.cumsum(weights[order])
+        ranks = numpy.clip(numpy.ceil(self.count * numpy.array(percents) - 1), 0, self.count - 1) + 1
+        positions = numpy.minimum(numpy.searchsorted(cumulativeWeights, ranks), values.size - 1)
+        return values[order][positions]
+
+    def getRankError(self):
+        # bound of the rank error of the quantiles (at 99%) as a fraction of the number of values
+        if not self.count:
+            return 0.0
+        return 2.576 * math.sqrt(self.rankErrorVariance) / self.count
+
+
+class MaskedField(object):
+    # values of a field selected by a boolean mask (or all the values if mask is None).
+    # If maskBit is given, mask is an array of labels and the values selected are the ones
+    # whose label has the bit maskBit. The selected values are only copied by getValues.
+
+    def __init__(self, values, mask = None, maskBit = None):
+        self.values = values
+        self.mask = mask
+        self.maskBit = maskBit
+
+    def getMask(self):
+        if self.maskBit is None:
+            return self.mask
+        return (self.mask & self.maskBit) != 0
+
+    def __len__(self):
+        if self.mask is None:
+            return self.values.size
+        return int(numpy.count_nonzero(self.getMask()))
+
+    def getValues(self):
+        if self.mask is None:
+            return self.values
+        return self.values[self.getMask()]
+
+
+class FieldChunks(object):
+    # values of a field selected by a boolean mask (or all the values if mask is None),
+    # iterated by chunks of at most chunkSize values to bound the memory used by the copies.
+    # If maskBit is given, mask is an array of labels and the values selected are the ones
+    # whose label has the bit maskBit: the boolean mask is computed for each chunk only.
+
+    def __init__(self, values, mask = None, chunkSize = 65536, maskBit = None):
+        self.values = values
+        self.mask = mask
+        self.chunkSize = chunkSize
+        self.maskBit = maskBit
+
+    def getChunkMask(self, start, stop):
+        if self.maskBit is None:
+            return self.mask[start:stop]
+        return (self.mask[start:stop] & self.maskBit) != 0
+
+    def __len__(self):
+        if self.mask is None:
+            return self.values.size
+        if self.maskBit is None:
+            return int(numpy.count_nonzero(self.mask))
+        return sum(int(numpy.count_nonzero(self.getChunkMask(start, start + self.chunkSize)))
+                   for start in range(0, self.values.size, self.chunkSize))
+
+    def __iter__(self):
+        for start in range(0, self.values.size, self.chunkSize):
+            chunk = self.values[start:start + self.chunkSize]
+            if self.mask is not None:
+                chunk = chunk[self.getChunkMask(start, start + self.chunkSize)]
+            if chunk.size:
+                yield chunk
+
+
+class FieldAggregate(object):
+    # Summary of the values of one or several fields which can be merged with other ones:
+    # number of values, mean, sum of the squared deviations to the mean (the sum of squares
+    # centered on the mean to keep its precision) and quantile sketch (with the min and max).
+
+    def __init__(self, sketchSize = 200):
+        self.count = 0
+        self.mean = 0.0
+        self.squareDeviationSum = 0.0
+        self.sketch = QuantileSketch(sketchSize)
+
+    def update(self, values):
+        if not values.size:
+            return
+        self.sketch.update(values)
+        valuesMean = values.mean(dtype = numpy.float64)
+        deviations = numpy.subtract(values, valuesMean, dtype = numpy.float64)
+        self.addMoments(values.size, valuesMean, numpy.dot(deviations, deviations))
+
+    def merge(self, aggregate):
+        self.sketch.merge(aggregate.sketch)
+        self.addMoments(aggregate.count, aggregate.mean, aggregate.squareDeviationSum)
+
+    def addMoments(self, count, mean, squareDeviationSum):
+        if not count:
+            return
+        delta = mean - self.mean
+        total = self.count + count
+        self.mean += delta * count / total
+        self.squareDeviationSum += squareDeviationSum + delta ** 2 * self.count * count / total
+        self.count = total
+
+    def getStandardDeviation(self):
+        return math.sqrt(self.squareDeviationSum / self.count)
+
+
+class StatisticsCache(object):
+    # Statistics already computed, identified by (model ID, field name, ROI name, MTime of the
+    # field array, MTime of the ROI arrays): a result is used again as long as the field and the
+    # ROI are not modified. Only the latest result of each model, field and ROI is kept.
+    # The results are copied in and out of the cache, the tables never share them with it.
+
+    def __init__(self):
+        self.entries = dict()
+
+    def get(self, key):
+        modelID, fieldName, ROIName, fieldMTime, ROIMTime = key
+        entry = self.entries.get((modelID, fieldName, ROIName))
+        if entry and entry[0] == (fieldMTime, ROIMTime):
+            return entry[1].copy()
+        return None
+
+    def set(self, key, fieldState):
+        modelID, fieldName, ROIName, fieldMTime, ROIMTime = key
+        self.entries[(modelID, fieldName, ROIName)] = ((fieldMTime, ROIMTime), fieldState.copy())
+
+    def clear(self):
+        self.entries.clear()
+
+
 class MeshStatisticsLogic(ScriptedLoadableModuleLogic):
     class StatisticStore(object):
         def __init__(self):
@@ -199,11 +429,36 @@ class MeshStatisticsLogic(ScriptedLoadableModuleLogic):
             self.percentile75 = 0
             self.percentile85 = 0
             self.percentile95 = 0
+            # approximate percentiles: sketch of the values and bound of the error on the
+            # percentiles (in percentile points)
+            self.sketch = None
+            self.percentileError = 0
+            # summary of the values merged in the population and group statistics
+            self.aggregate = None
+
+        def copy(self):
+            # the sketch and the aggregate are shared: they are only read once computed
+            fieldState = MeshStatisticsLogic.StatisticStore()
+            fieldState.__dict__.update(self.__dict__)
+            return fieldState
+
+    # percentiles of the statistics tables, in the order of the columns
+    percents = [0.05, 0.15, 0.25, 0.50, 0.75, 0.85, 0.95]
 
     def __init__(self, interface=None, ShapeQuantifierCore = None):
         self.ShapeQuantifierCore = ShapeQuantifierCore
         self.interface = interface
         self.numberOfDecimals = 3
+        # the statistics are computed in parallel, numpy releases the GIL while sorting the values
+        self.numberOfThreads = multiprocessing.cpu_count()
+        # the approximate percentiles are computed by chunks with a bounded memory
+        self.approximatePercentiles = False
+        self.sketchSize = 200
+        self.chunkSize = 65536
+        # statistics of all the models together and of each group of models
+        self.populationStatistics = False
+        # results of the previous runs, only the missing or modified ones are computed again
+        self.statisticsCache = StatisticsCache()
         system = qt.QLocale().system()
         self.decimalPoint = chr(system.decimalPoint())
 
@@ -216,7 +471,6 @@ class MeshStatisticsLogic(ScriptedLoadableModuleLogic):
         del ROIList[:]
         ROIList.append('Entire Model')
         tableFieldNumRows = 0
-        expression = '_ROI'
         
         if tableField.rowCount == 0:
             tableField.setRowCount(1)
@@ -241,10 +495,13 @@ class MeshStatisticsLogic(ScriptedLoadableModuleLogic):
             fieldModel = list()
 
             del fieldNameOfRefList[:]
+            # the ROIs are read from the label layer of the models, they are not fields
+            ROIInCommon = self.ShapeQuantifierCore.ROILabelLayer(modelOfReference.GetPolyData()).getROINames()
             for i in range(0, numOfArrayOfReference):
-                if PointDataOfReference.GetArray(i).GetNumberOfComponents() == 1:
-                    fieldNameOfRefList.append(PointDataOfReference.GetArray(i).GetName())
-                    fieldInCommon.append(PointDataOfReference.GetArray(i).GetName())
+                arrayName = PointDataOfReference.GetArray(i).GetName()
+                if PointDataOfReference.GetArray(i).GetNumberOfComponents() == 1 and not self.isROIArray(modelOfReference, arrayName):
+                    fieldNameOfRefList.append(arrayName)
+                    fieldInCommon.append(arrayName)
 
             if modelList.__len__() > 1:
                 for model in modelList:
@@ -252,35 +509,55 @@ class MeshStatisticsLogic(ScriptedLoadableModuleLogic):
                     if model.GetID() != modelOfReference.GetID():
                         numOfArray = model.GetPolyData().GetPointData().GetNumberOfArrays()
                         for i in range(0, numOfArray):
-                            if model.GetPolyData().GetPointData().GetArray(i).GetNumberOfComponents() == 1:
-                                fieldModel.append(model.GetPolyData().GetPointData().GetArray(i).GetName())
+                            arrayName = model.GetPolyData().GetPointData().GetArray(i).GetName()
+                            if model.GetPolyData().GetPointData().GetArray(i).GetNumberOfComponents() == 1 and not self.isROIArray(model, arrayName):
+                                fieldModel.append(arrayName)
                         fieldInCommon, tempFieldNotInCommon = self.compareList(fieldInCommon, fieldModel)
+                        ROIModel = self.ShapeQuantifierCore.ROILabelLayer(model.GetPolyData()).getROINames()
+                        ROIInCommon = self.compareList(ROIInCommon, ROIModel)[0]
                         fieldNotInCommon = fieldNotInCommon + tempFieldNotInCommon
 
             for arrayName in set(fieldInCommon):
-                if not re.search(expression, arrayName):
-                    tableFieldNumRows += 1
-                    tableField.setMinimumHeight(tableFieldNumRows*35)
-                    tableField.setRowCount(tableFieldNumRows)
-                    tableField.setCellWidget(tableFieldNumRows - 1, 0, qt.QCheckBox())
-                    label = qt.QLabel(arrayName)
-                    label.setStyleSheet(' QLabel{qproperty-alignment: AlignVCenter | AlignLeft; }')
-                    tableField.setCellWidget(tableFieldNumRows - 1, 1, label)
-                else:
-                    ROIComboBox.addItem(arrayName)
-                    ROIList.append(arrayName)
+                tableFieldNumRows += 1
+                tableField.setMinimumHeight(tableFieldNumRows*35)
+                tableField.setRowCount(tableFieldNumRows)
+                tableField.setCellWidget(tableFieldNumRows - 1, 0, qt.QCheckBox())
+                label = qt.QLabel(arrayName)
+                label.setStyleSheet(' QLabel{qproperty-alignment: AlignVCenter | AlignLeft; }')
+                tableField.setCellWidget(tableFieldNumRows - 1, 1, label)
+
+            for ROIName in ROIInCommon:
+                ROIComboBox.addItem(ROIName)
+                ROIList.append(ROIName)
 
             for arrayName in set(fieldNotInCommon):
-                if not re.search(expression, arrayName):
-                    tableFieldNumRows += 1
-                    tableField.setMinimumHeight(tableFieldNumRows*35)
-                    tableField.setRowCount(tableFieldNumRows)
-                    label = qt.QLabel(arrayName)
-                    label.setStyleSheet(' QLabel{ font-style:oblique; text-decoration:line-through;  }')
-                    tableField.setCellWidget(tableFieldNumRows - 1, 1, label )
+                tableFieldNumRows += 1
+                tableField.setMinimumHeight(tableFieldNumRows*35)
+                tableField.setRowCount(tableFieldNumRows)
+                label = qt.QLabel(arrayName)
+                label.setStyleSheet(' QLabel{ font-style:oblique; text-decoration:line-through;  }')
+                tableField.setCellWidget(tableFieldNumRows - 1, 1, label )
 
         layout.addStretch(1)
 
+    def isROIArray(self, model, arrayName):
+        # arrays of the label layer and ROI arrays written by the previous versions of Pick 'n Paint
+        labelLayer = self.ShapeQuantifierCore.ROILabelLayer(model.GetPolyData())
+        return labelLayer.isLayerArray(arrayName) or arrayName in labelLayer.getLegacyArrayNames()
+
+    def getROIMask(self, polyData, ROIName):
+        # boolean mask of the ROI read from the label layer of the mesh
+        return self.ShapeQuantifierCore.ROILabelLayer(polyData).getMask(ROIName)
+
+    def getROILabels(self, polyData, ROIName):
+        # (labels, bit value) of the ROI if it is in the label layer, its boolean mask otherwise:
+        # the mask of the ROI is not computed for the whole mesh
+        labelLayer = self.ShapeQuantifierCore.ROILabelLayer(polyData)
+        labelsAndBitValue = labelLayer.getLabelsAndBitValue(ROIName)
+        if labelsAndBitValue is not None:
+            return labelsAndBitValue
+        return labelLayer.getMask(ROIName)
+
     def compareList(self, list1, list2):
         ListInCommon = list(set(list1) & set(list2))
         ListNotInCommon = (list(set(list1) - set(list2)) + list(set(list2) - set(list1)))
@@ -294,8 +571,11 @@ class MeshStatisticsLogic(ScriptedLoadableModuleLogic):
         statTable.setMinimumHeight(numberOfRows*35)
         statTable.setMinimumWidth(55)
 
-        statTable.setColumnCount(12)
-        statTable.setHorizontalHeaderLabels(['Model','Min','Max','Mean','SD','Per5','Per15','Per25','Per50','Per75','Per85','Per95'])
+        # the error bound of the percentiles (in percentile points) is shown when they are approximate
+        hasPercentileError = self.hasPercentileError(fieldDictionaryValue)
+        statTable.setColumnCount(13 if hasPercentileError else 12)
+        statTable.setHorizontalHeaderLabels(['Model','Min','Max','Mean','SD','Per5','Per15','Per25','Per50','Per75','Per85','Per95']
+                                            + (['PerError'] if hasPercentileError else []))
         # Add Values:
         for key, value in fieldDictionaryValue.iteritems():
             statTable.setCellWidget(i, 0, qt.QLabel(key))
@@ -321,6 +601,9 @@ class MeshStatisticsLogic(ScriptedLoadableModuleLogic):
             statTable.cellWidget(i,10).setStyleSheet(' QLabel{ qproperty-alignment: AlignCenter;}')
             statTable.setCellWidget(i, 11, qt.QLabel(value.percentile95))
             statTable.cellWidget(i,11).setStyleSheet(' QLabel{ qproperty-alignment: AlignCenter;}')
+            if hasPercentileError:
+                statTable.setCellWidget(i, 12, qt.QLabel(value.percentileError))
+                statTable.cellWidget(i,12).setStyleSheet(' QLabel{ qproperty-alignment: AlignCenter;}')
             i -= 1
         statTable.resizeColumnToContents(0)
         return statTable
@@ -338,7 +621,8 @@ class MeshStatisticsLogic(ScriptedLoadableModuleLogic):
             tabROI.addTab(tab, ROIName)
         layout.addWidget(tabROI)
 
-    def displayStatistics(self, ROICheckBoxState, ROIList, ROIDict, ROIComboBox, tableField, modelList, tabROI, layout):
+    def displayStatistics(self, ROICheckBoxState, ROIList, ROIDict, ROIComboBox, tableField, modelList, tabROI, layout,
+                          progressCallback = None, populationDict = None):
         if ROICheckBoxState:
             for ROIName in ROIList:
                 if not ROIDict.has_key(ROIName):
@@ -354,17 +638,101 @@ class MeshStatisticsLogic(ScriptedLoadableModuleLogic):
                 widget = tableField.cellWidget(i, 0)
                 if widget and widget.isChecked():
                     ROIFieldDict[tableField.cellWidget(i, 1).text.encode('utf-8')] = dict()
+        # the statistics missing from the cache are computed, then the tables are rebuilt from
+        # all the statistics, cached or not
+        tasks = self.defineStatisticsTasks(ROIDict, modelList)
+        computedTasks = self.runStatisticsTasks(tasks, progressCallback)
+        # the statistics which were not computed before a cancellation are not displayed
+        for taskIndex, (ROIName, fieldName, modelName, fieldState, array, cacheKey) in enumerate(tasks):
+            if taskIndex in computedTasks:
+                self.statisticsCache.set(cacheKey, fieldState)
+            else:
+                ROIDict[ROIName][fieldName].pop(modelName, None)
+        if self.populationStatistics and populationDict is not None:
+            populationDict.clear()
+            populationDict.update(self.computePopulationStatistics(ROIDict, modelList))
+        self.updateTable(self.addPopulationRows(ROIDict, populationDict), tabROI, layout)
+
+    def getStatisticsCacheKey(self, model, polyData, fieldArray, fieldName, ROIName):
+        if ROIName == 'Entire Model':
+            ROIMTime = 0
+        else:
+            ROIMTime = self.ShapeQuantifierCore.ROILabelLayer(polyData).getMTime(ROIName)
+        return model.GetID(), fieldName, ROIName, fieldArray.GetMTime(), ROIMTime
+
+    def isCachedStatistics(self, fieldState):
+        #  a result computed in another mode is computed again
+        if (fieldState.sketch is not None) != self.approximatePercentiles:
+            return False
+        return fieldState.aggregate is not None or not self.populationStatistics
+
+    def defineStatisticsTasks(self, ROIDict, modelList):
+        #  One task for each ROI, field and model of ROIDict which is not in the cache:
+        #  (ROIName, fieldName, modelName, StatisticStore, array, cacheKey)
+        #  The arrays are read from the scene here, the tasks themselves only use numpy: the values
+        #  of the ROI are copied by the task, not here, to keep one copy for each thread at most
+        tasks = list()
+        for ROIName, ROIFieldDict in ROIDict.iteritems():
             for fieldName, fieldValue in ROIFieldDict.iteritems():
                 for shape in modelList:
-                    activePointData = shape.GetModelDisplayNode().GetInputPolyData().GetPointData()
-                    fieldArray = activePointData.GetArray(fieldName)
+                    activePolyData = shape.GetModelDisplayNode().GetInputPolyData()
+                    fieldArray = activePolyData.GetPointData().GetArray(fieldName)
+                    cacheKey = self.getStatisticsCacheKey(shape, activePolyData, fieldArray, fieldName, ROIName)
+                    cachedState = self.statisticsCache.get(cacheKey)
+                    if cachedState and self.isCachedStatistics(cachedState):
+                        fieldValue[shape.GetName()] = cachedState
+                        continue
                     fieldValue[shape.GetName()] = self.StatisticStore()
-                    if ROIName == 'Entire Model':
-                        self.computeAll(fieldArray, fieldValue[shape.GetName()], 'None')
+                    if self.approximatePercentiles:
+                        ROIArray = 'None' if ROIName == 'Entire Model' else self.getROILabels(activePolyData, ROIName)
+                        bool, array = self.defineArrayChunks(fieldArray, ROIArray)
                     else:
-                        ROIArray = activePointData.GetArray(ROIName)
-                        self.computeAll(fieldArray, fieldValue[shape.GetName()], ROIArray)
-        self.updateTable(ROIDict, tabROI, layout)
+                        ROIArray = 'None' if ROIName == 'Entire Model' else self.getROIMask(activePolyData, ROIName)
+                        bool, array = self.defineMaskedField(fieldArray, ROIArray)
+                    if bool and len(array) is 0:
+                        slicer.util.errorDisplay("The ROI is empty")
+                    elif bool:
+                        tasks.append((ROIName, fieldName, shape.GetName(), fieldValue[shape.GetName()], array, cacheKey))
+        return tasks
+
+    def runStatisticsTask(self, task):
+        taskIndex, (ROIName, fieldName, modelName, fieldState, array, cacheKey) = task
+        if isinstance(array, FieldChunks):
+            self.computeApproximateStatistics(array, fieldState)
+        else:
+            if isinstance(array, MaskedField):
+                array = array.getValues()
+            self.computeStatistics(array, fieldState)
+            if self.populationStatistics:
+                # the exact statistics of the model are kept, the aggregate is only used by the population
+                fieldState.aggregate = FieldAggregate(self.sketchSize)
+                for chunk in FieldChunks(array, None, self.chunkSize):
+                    fieldState.aggregate.update(chunk)
+        return taskIndex
+
+    def runStatisticsTasks(self, tasks, progressCallback = None):
+        #  Compute the tasks in numberOfThreads threads, return the set of the indexes of the computed tasks
+        #  progressCallback(numberOfComputedTasks, numberOfTasks) is called regularly, the computation
+        #  is cancelled if it returns False
+        computedTasks = set()
+        if not tasks:
+            return computedTasks
+        pool = ThreadPool(max(1, min(self.numberOfThreads, len(tasks))))
+        try:
+            results = pool.imap_unordered(self.runStatisticsTask, enumerate(tasks))
+            while len(computedTasks) < len(tasks):
+                try:
+                    computedTasks.add(results.next(0.1))
+                except multiprocessing.TimeoutError:
+                    pass
+                if progressCallback and not progressCallback(len(computedTasks), len(tasks)):
+                    break
+        finally:
+            # also reached when a task raised an error: the tasks being computed are finished,
+            # the others are dropped
+            pool.terminate()
+            pool.join()
+        return computedTasks
 
     def removeTable(self, layout, tabROI):
         # Remove table if it already exists:
@@ -379,26 +747,66 @@ class MeshStatisticsLogic(ScriptedLoadableModuleLogic):
                 tabWidget.clear()
             tabROI.clear()
 
-    def defineArray(self, fieldArray, ROIArray):
-        #  Define array of value from fieldArray(array with all the distances from ModelToModelDistance)
-        #  using ROIArray as a mask
-        #  Return a numpy.array to be able to use numpy's method to compute statistics
-        valueList = list()
+    def getFieldValuesAndMask(self, fieldArray, ROIArray):
+        #  Values of fieldArray read directly in the VTK buffer and mask of the ROI (None for the
+        #  entire model) with its bit (None for a boolean mask). ROIArray is a vtk array of 0/1,
+        #  a boolean numpy.array or a pair (labels, bit value) read from the label layer, 'None'
+        #  for the entire model or None if the ROI is missing
+        values = numpy.array([])
+        mask = None
+        maskBit = None
         bool = True
-        if ROIArray == 'None':
-            for i in range(0, fieldArray.GetNumberOfTuples()):
-                valueList.append(fieldArray.GetValue(i))
-            valueArray = numpy.array(valueList)
+        if isinstance(ROIArray, tuple):
+            labels, bitValue = ROIArray
+            if labels.size != fieldArray.GetNumberOfTuples():
+                print 'Size of ROIArray and fieldArray are not the same!!!'
+                bool = False
+            else:
+                values = numpy_support.vtk_to_numpy(fieldArray)
+                mask = labels
+                maskBit = bitValue
+        elif isinstance(ROIArray, numpy.ndarray):
+            if ROIArray.size != fieldArray.GetNumberOfTuples():
+                print 'Size of ROIArray and fieldArray are not the same!!!'
+                bool = False
+            else:
+                values = numpy_support.vtk_to_numpy(fieldArray)
+                mask = ROIArray
+        elif ROIArray is None:
+            print 'ROI not found on the model!!!'
+            bool = False
+        elif ROIArray == 'None':
+            values = numpy_support.vtk_to_numpy(fieldArray)
         else:
             if ROIArray.GetNumberOfTuples() != fieldArray.GetNumberOfTuples():
                 print 'Size of ROIArray and fieldArray are not the same!!!'
                 bool = False
             else:
-                for i in range(0, fieldArray.GetNumberOfTuples()):
-                    if ROIArray.GetValue(i) == 1.0:
-                        valueList.append(fieldArray.GetValue(i))
-                valueArray = numpy.array(valueList)
-        return bool, valueArray
+                values = numpy_support.vtk_to_numpy(fieldArray)
+                mask = numpy_support.vtk_to_numpy(ROIArray) == 1.0
+        return bool, values, mask, maskBit
+
+    def defineArray(self, fieldArray, ROIArray):
+        #  Define array of value from fieldArray(array with all the distances from ModelToModelDistance)
+        #  using ROIArray as a mask (vtk array of 0/1 or boolean numpy.array read from the label layer)
+        #  Return a numpy.array to be able to use numpy's method to compute statistics
+        #  The values are read directly in the VTK buffer, the array is a copy only if a mask is applied
+        bool, values, mask, maskBit = self.getFieldValuesAndMask(fieldArray, ROIArray)
+        if maskBit is not None:
+            mask = (mask & maskBit) != 0
+        if mask is not None:
+            values = values[mask]
+        return bool, values
+
+    def defineMaskedField(self, fieldArray, ROIArray):
+        #  Same as defineArray, but the mask is only applied by MaskedField.getValues
+        bool, values, mask, maskBit = self.getFieldValuesAndMask(fieldArray, ROIArray)
+        return bool, MaskedField(values, mask, maskBit)
+
+    def defineArrayChunks(self, fieldArray, ROIArray):
+        #  Same as defineArray, but the values are read by chunks of chunkSize values (FieldChunks)
+        bool, values, mask, maskBit = self.getFieldValuesAndMask(fieldArray, ROIArray)
+        return bool, FieldChunks(values, mask, self.chunkSize, maskBit)
 
     def computeMean(self, valueArray):
         #  valueArray is an array in which values to compute statistics on are stored
@@ -417,27 +825,116 @@ class MeshStatisticsLogic(ScriptedLoadableModuleLogic):
         #  valueArray is an array in which values to compute statistics on are stored
         #  percent is a value between 0 and 1
         #  The lowest value is taken
-        valueArray = numpy.sort(valueArray)
-        index = (valueArray.size * percent) - 1
-        ceilIndex = math.ceil(index)
-        return round(valueArray[ceilIndex], self.numberOfDecimals)
+        return self.computePercentiles(valueArray, [percent])[0]
+
+    def getPercentileIndexes(self, size, percents):
+        #  index of each percentile in the sorted values, the lowest value is taken
+        indexes = numpy.ceil(size * numpy.array(percents) - 1).astype(int)
+        return numpy.clip(indexes, 0, size - 1)
+
+    def computePercentiles(self, valueArray, percents):
+        #  All the percentiles with a single partial sort of a copy of valueArray
+        indexes = self.getPercentileIndexes(valueArray.size, percents)
+        partitionedArray = numpy.partition(valueArray, indexes)
+        return [round(value, self.numberOfDecimals) for value in partitionedArray[indexes]]
 
     def computeAll(self, fieldArray, fieldState, ROIArray):
         bool, array = self.defineArray(fieldArray, ROIArray)
-        if len(array) is 0:
+        if bool and len(array) is 0:
             slicer.util.errorDisplay("The ROI is empty")
             return
         if bool:
-            fieldState.min, fieldState.max = self.computeMinMax(array)
-            fieldState.mean = self.computeMean(array)
-            fieldState.std = self.computeStandardDeviation(array)
-            fieldState.percentile5 = self.computePercentile(array, 0.05)
-            fieldState.percentile15 = self.computePercentile(array, 0.15)
-            fieldState.percentile25 = self.computePercentile(array, 0.25)
-            fieldState.percentile50 = self.computePercentile(array, 0.50)
-            fieldState.percentile75 = self.computePercentile(array, 0.75)
-            fieldState.percentile85 = self.computePercentile(array, 0.85)
-            fieldState.percentile95 = self.computePercentile(array, 0.95)
+            self.computeStatistics(array, fieldState)
+
+    def computeStatistics(self, array, fieldState):
+        #  Fill fieldState with the statistics of the values of array, only numpy is used
+        # min, max and percentiles from one partial sort
+        size = array.size
+        indexes = numpy.concatenate(([0, size - 1], self.getPercentileIndexes(size, self.percents)))
+        values = numpy.partition(array, indexes)[indexes]
+        fieldState.min = round(values[0], self.numberOfDecimals)
+        fieldState.max = round(values[1], self.numberOfDecimals)
+        (fieldState.percentile5, fieldState.percentile15, fieldState.percentile25, fieldState.percentile50,
+         fieldState.percentile75, fieldState.percentile85, fieldState.percentile95) = \
+            [round(value, self.numberOfDecimals) for value in values[2:]]
+        # mean and standard deviation from the sums of one pass, the values are centered on the
+        # median to keep the precision of the sum of squares
+        centeredArray = numpy.subtract(array, values[5], dtype = numpy.float64)
+        centeredSum = centeredArray.sum(dtype = numpy.float64)
+        centeredSquareSum = numpy.dot(centeredArray, centeredArray)
+        centeredMean = centeredSum / size
+        fieldState.mean = round(values[5] + centeredMean, self.numberOfDecimals)
+        fieldState.std = round(math.sqrt(max(centeredSquareSum / size - centeredMean ** 2, 0)), self.numberOfDecimals)
+
+    def computeApproximateStatistics(self, chunks, fieldState):
+        #  Fill fieldState with exact moments and approximate percentiles of the values of chunks
+        #  (FieldChunks), only one chunk is copied at a time
+        aggregate = FieldAggregate(self.sketchSize)
+        for chunk in chunks:
+            aggregate.update(chunk)
+        self.setAggregateStatistics(aggregate, fieldState)
+
+    def setAggregateStatistics(self, aggregate, fieldState):
+        #  Fill fieldState with the statistics of a FieldAggregate, the percentiles are approximate
+        sketch = aggregate.sketch
+        fieldState.min = round(sketch.min, self.numberOfDecimals)
+        fieldState.max = round(sketch.max, self.numberOfDecimals)
+        fieldState.mean = round(aggregate.mean, self.numberOfDecimals)
+        fieldState.std = round(aggregate.getStandardDeviation(), self.numberOfDecimals)
+        (fieldState.percentile5, fieldState.percentile15, fieldState.percentile25, fieldState.percentile50,
+         fieldState.percentile75, fieldState.percentile85, fieldState.percentile95) = \
+            [round(value, self.numberOfDecimals) for value in sketch.getQuantiles(self.percents)]
+        fieldState.sketch = sketch
+        fieldState.percentileError = round(100 * sketch.getRankError(), self.numberOfDecimals)
+        fieldState.aggregate = aggregate
+
+    def getModelGroup(self, model):
+        #  name of the group of the model in the population statistics, None if it is in no group
+        return model.GetAttribute("MeshStatistics.Group")
+
+    def computePopulationStatistics(self, ROIDict, modelList):
+        #  Statistics of all the models of ROIDict together ("[Population]") and of each group of
+        #  models ("[Group] <name>"), with the same structure as ROIDict. Only the aggregates of the
+        #  models are merged, the fields are not read again.
+        groups = dict()
+        for model in modelList:
+            groups[model.GetName()] = self.getModelGroup(model)
+        populationDict = dict()
+        for ROIName, ROIFieldDict in ROIDict.iteritems():
+            populationDict[ROIName] = dict()
+            for fieldName, modelDict in ROIFieldDict.iteritems():
+                aggregates = dict()
+                for modelName, fieldState in modelDict.iteritems():
+                    if fieldState.aggregate is None:
+                        continue
+                    rowNames = ['[Population]']
+                    if groups.get(modelName):
+                        rowNames.append('[Group] ' + groups[modelName])
+                    for rowName in rowNames:
+                        if rowName not in aggregates:
+                            aggregates[rowName] = FieldAggregate(self.sketchSize)
+                        aggregates[rowName].merge(fieldState.aggregate)
+                populationDict[ROIName][fieldName] = dict()
+                for rowName, aggregate in aggregates.iteritems():
+                    populationDict[ROIName][fieldName][rowName] = self.StatisticStore()
+                    self.setAggregateStatistics(aggregate, populationDict[ROIName][fieldName][rowName])
+        return populationDict
+
+    def addPopulationRows(self, ROIDict, populationDict):
+        #  Copy of ROIDict with the rows of the population statistics added to the models
+        if not populationDict:
+            return ROIDict
+        tables = dict()
+        for ROIName, ROIFieldDict in ROIDict.iteritems():
+            tables[ROIName] = dict()
+            for fieldName, modelDict in ROIFieldDict.iteritems():
+                tables[ROIName][fieldName] = dict(modelDict)
+                tables[ROIName][fieldName].update(populationDict.get(ROIName, dict()).get(fieldName, dict()))
+        return tables
+
+    def hasPercentileError(self, modelDict):
+        #  True if the percentiles of the models of modelDict are approximate
+        return any(shapeStats.sketch is not None for shapeStats in modelDict.itervalues())
 
     def writeFieldFile(self, fileWriter, modelDict):
         #  Function defined to export all statistics of a field concidering a file writer (fileWriter)
@@ -454,7 +951,8 @@ class MeshStatisticsLogic(ScriptedLoadableModuleLogic):
                                  shapeStats.percentile50,
                                  shapeStats.percentile75,
                                  shapeStats.percentile85,
-                                 shapeStats.percentile95])
+                                 shapeStats.percentile95]
+                                + ([shapeStats.percentileError] if self.hasPercentileError(modelDict) else []))
 
     def exportAllAsCSV(self, filename, ROIName, ROIDictValue):
         #  Export all fields on the same csv file considering a region
@@ -464,7 +962,8 @@ class MeshStatisticsLogic(ScriptedLoadableModuleLogic):
         cw.writerow([' '])
         for fieldName, shapeDict in sorted(ROIDictValue.iteritems()):
             cw.writerow([fieldName])
-            cw.writerow(['Model','Min','Max','Mean','SD','Per5','Per15','Per25','Per50','Per75','Per85','Per95'])
+            cw.writerow(['Model','Min','Max','Mean','SD','Per5','Per15','Per25','Per50','Per75','Per85','Per95']
+                        + (['PerError'] if self.hasPercentileError(shapeDict) else []))
             self.writeFieldFile(cw, shapeDict)
             cw.writerow([' '])
         file.close()
@@ -477,7 +976,8 @@ class MeshStatisticsLogic(ScriptedLoadableModuleLogic):
         file = open(filename, 'w')
         cw = csv.writer(file, delimiter=',')
         cw.writerow([fieldName])
-        cw.writerow(['Model','Min','Max','Mean','SD','Per5','Per15','Per25','Per50','Per75','Per85','Per95'])
+        cw.writerow(['Model','Min','Max','Mean','SD','Per5','Per15','Per25','Per50','Per75','Per85','Per95']
+                    + (['PerError'] if self.hasPercentileError(shapeDict) else []))
         self.writeFieldFile(cw, shapeDict)
         file.close()
         if self.decimalPoint != '.':
@@ -490,8 +990,9 @@ class MeshStatisticsLogic(ScriptedLoadableModuleLogic):
         file = open(filename, 'w')
         cw = csv.writer(file, delimiter=',')
         bool, arrayToReturn = self.defineArray(fieldArray, ROIArray)
-        if len(arrayToReturn) is 0:
+        if bool and len(arrayToReturn) is 0:
             slicer.util.errorDisplay("The ROI is empty")
+            file.close()
             return
         if bool:
             for value in arrayToReturn:
@@ -593,24 +1094,24 @@ class MeshStatisticsLogic(ScriptedLoadableModuleLogic):
                             if choice == messageBox.NoToAll:
                                 return True
                             if choice == messageBox.Yes:
-                                pointData = slicer.util.getNode(modelName).GetModelDisplayNode().GetInputPolyData().GetPointData()
-                                fieldArray = pointData.GetArray(fieldName)
-                                ROIArray = pointData.GetArray(ROIName)
-                                self.exportPointValueAsCSV(filename, fieldArray, ROIArray)
+                                polyData = slicer.util.getNode(modelName).GetModelDisplayNode().GetInputPolyData()
+                                fieldArray = polyData.GetPointData().GetArray(fieldName)
+                                ROIMask = self.getROIMask(polyData, ROIName)
+                                self.exportPointValueAsCSV(filename, fieldArray, ROIMask)
                             if choice == messageBox.YesToAll:
                                 for fieldName, modelDict in sorted(ROIDictValue.iteritems()):
                                     for modelName in modelDict.iterkeys():
                                         filename = directoryFilename + '/' + modelName + '.csv'
-                                        pointData = slicer.util.getNode(modelName).GetModelDisplayNode().GetInputPolyData().GetPointData()
-                                        fieldArray = pointData.GetArray(fieldName)
-                                        ROIArray = pointData.GetArray(ROIName)
-                                        self.exportPointValueAsCSV(filename, fieldArray, ROIArray)
+                                        polyData = slicer.util.getNode(modelName).GetModelDisplayNode().GetInputPolyData()
+                                        fieldArray = polyData.GetPointData().GetArray(fieldName)
+                                        ROIMask = self.getROIMask(polyData, ROIName)
+                                        self.exportPointValueAsCSV(filename, fieldArray, ROIMask)
                                 return True
                         else:
-                            pointData = slicer.util.getNode(modelName).GetModelDisplayNode().GetInputPolyData().GetPointData()
-                            fieldArray = pointData.GetArray(fieldName)
-                            ROIArray = pointData.GetArray(ROIName)
-                            self.exportPointValueAsCSV(filename, fieldArray, ROIArray)
+                            polyData = slicer.util.getNode(modelName).GetModelDisplayNode().GetInputPolyData()
+                            fieldArray = polyData.GetPointData().GetArray(fieldName)
+                            ROIMask = self.getROIMask(polyData, ROIName)
+                            self.exportPointValueAsCSV(filename, fieldArray, ROIMask)
 
 
 class MeshStatisticsTest(ScriptedLoadableModuleTest):
@@ -636,6 +1137,21 @@ class MeshStatisticsTest(ScriptedLoadableModuleTest):
         self.delayDisplay("Test3: Test storage of Values Function")
         self.assertTrue(self.testStorageValue())
 
+        self.delayDisplay("Test3-1: Test approximate percentiles")
+        self.assertTrue(self.testApproximatePercentiles())
+
+        self.delayDisplay("Test3-2: Test population aggregates")
+        self.assertTrue(self.testPopulationAggregates())
+
+        self.delayDisplay("Test3-3: Test failure of a statistics task")
+        self.assertTrue(self.testStatisticsTaskFailure())
+
+        self.delayDisplay("Test3-4: Test cache of the statistics")
+        self.assertTrue(self.testStatisticsCache())
+
+        self.delayDisplay("Test3-5: Test statistics computed with one partial sort")
+        self.assertTrue(self.testSinglePartitionStatistics())
+
         self.delayDisplay("Test4: Test on entire models")
         self.delayDisplay("Test4-1: Test on T1toT2")
         self.assertTrue(self.testOnMesh(slicer.mrmlScene.GetNodesByName("T1toT2").GetItemAsObject(0),
@@ -768,6 +1284,11 @@ class MeshStatisticsTest(ScriptedLoadableModuleTest):
                 print '        Failed', a, array[a], i, arrayValue.GetValue(i)
                 return False
             a += 1
+        # the task of the statistics applies the same mask in its thread
+        bool, maskedField = logic.defineMaskedField(arrayValue, arrayMask)
+        if len(maskedField) != len(array) or sorted(maskedField.getValues()) != array:
+            print '        Failed: the masked field is different'
+            return False
         print '         Passed'
         return True
             
@@ -821,6 +1342,160 @@ class MeshStatisticsTest(ScriptedLoadableModuleTest):
             print '         Passed! '
         return True
 
+    def testApproximatePercentiles(self):
+        logic = MeshStatisticsLogic()
+        logic.chunkSize = 1000
+        print ' TEST Approximate percentiles '
+        arrayValue = vtk.vtkDoubleArray()
+        for i in range(1, 100001):
+            arrayValue.InsertNextValue(i)
+        exactState = logic.StatisticStore()
+        logic.computeAll(arrayValue, exactState, 'None')
+        bool, chunks = logic.defineArrayChunks(arrayValue, 'None')
+        approximateState = logic.StatisticStore()
+        logic.computeApproximateStatistics(chunks, approximateState)
+        # the values are the ranks, the error on the values is the error on the ranks
+        maximumError = approximateState.percentileError / 100.0 * 100000
+        for attribute in ['percentile5', 'percentile15', 'percentile25', 'percentile50',
+                          'percentile75', 'percentile85', 'percentile95']:
+            if abs(getattr(approximateState, attribute) - getattr(exactState, attribute)) > maximumError:
+                print '         Failed', attribute, getattr(approximateState, attribute), getattr(exactState, attribute)
+                return False
+        if approximateState.min != exactState.min or approximateState.max != exactState.max \
+                or approximateState.mean != exactState.mean or approximateState.std != exactState.std:
+            print '         Failed on min, max, mean or std'
+            return False
+        # the sketches of two halves merged give the percentiles of the whole field
+        firstHalf = QuantileSketch()
+        firstHalf.update(numpy.arange(1, 50001))
+        secondHalf = QuantileSketch()
+        secondHalf.update(numpy.arange(50001, 100001))
+        firstHalf.merge(secondHalf)
+        median = firstHalf.getQuantiles([0.5])[0]
+        if firstHalf.count != 100000 or abs(median - 50000) > firstHalf.getRankError() * 100000:
+            print '         Failed on merged sketches', median
+            return False
+        # the mask of a ROI of the label layer is computed chunk by chunk from the labels
+        labels = numpy.zeros(100000, dtype = numpy.uint32)
+        labels[::3] = 4
+        labels[::5] |= 1
+        chunks = FieldChunks(numpy.arange(100000.0), labels, 1000, numpy.uint32(4))
+        if len(chunks) != labels[::3].size \
+                or not numpy.array_equal(numpy.concatenate(list(chunks)), numpy.arange(0.0, 100000.0, 3)):
+            print '         Failed on the chunks of a ROI of the labels'
+            return False
+        print '         Passed'
+        return True
+
+    def testPopulationAggregates(self):
+        logic = MeshStatisticsLogic()
+        print ' TEST Population aggregates '
+        # the merge of the aggregates of two models gives the statistics of the values of both
+        values = numpy.arange(1, 1001, dtype = numpy.float64)
+        population = FieldAggregate()
+        for modelValues in [values[:300], values[300:]]:
+            modelAggregate = FieldAggregate()
+            modelAggregate.update(modelValues)
+            population.merge(modelAggregate)
+        populationState = logic.StatisticStore()
+        logic.setAggregateStatistics(population, populationState)
+        if population.count != 1000 or populationState.min != 1.0 or populationState.max != 1000.0 \
+                or populationState.mean != 500.5 or populationState.std != 288.675:
+            print '         Failed', populationState.min, populationState.max, populationState.mean, populationState.std
+            return False
+        print '         Passed'
+        return True
+
+    def testStatisticsTaskFailure(self):
+        logic = MeshStatisticsLogic()
+        logic.numberOfThreads = 2
+        print ' TEST Failure of a statistics task '
+        array = self.defineArrays(logic, 1, 1001)
+        # the field of the second task cannot be read
+        tasks = [('None', 'field1', 'model', logic.StatisticStore(), array, None),
+                 ('None', 'field2', 'model', logic.StatisticStore(), None, None)]
+        try:
+            logic.runStatisticsTasks(tasks)
+        except Exception:
+            print '         Passed'
+            return True
+        print '         Failed: the error of the task is not raised'
+        return False
+
+    def testStatisticsCache(self):
+        logic = MeshStatisticsLogic(ShapeQuantifierCore = self.widget.ShapeQuantifierCore)
+        print ' TEST Cache of the statistics '
+        sphereSource = vtk.vtkSphereSource()
+        sphereSource.Update()
+        polyData = sphereSource.GetOutput()
+        fieldArray = vtk.vtkDoubleArray()
+        fieldArray.SetName('TestCacheField')
+        for i in range(polyData.GetNumberOfPoints()):
+            fieldArray.InsertNextValue(i)
+        polyData.GetPointData().AddArray(fieldArray)
+        model = slicer.vtkMRMLModelNode()
+        model.SetName('TestCacheModel')
+        model.SetAndObservePolyData(polyData)
+        slicer.mrmlScene.AddNode(model)
+        modelDisplay = slicer.vtkMRMLModelDisplayNode()
+        slicer.mrmlScene.AddNode(modelDisplay)
+        model.SetAndObserveDisplayNodeID(modelDisplay.GetID())
+        modelDisplay.SetInputPolyDataConnection(sphereSource.GetOutputPort())
+        try:
+            def runStatistics():
+                ROIDict = {'Entire Model': {'TestCacheField': dict()}}
+                tasks = logic.defineStatisticsTasks(ROIDict, [model])
+                for taskIndex in logic.runStatisticsTasks(tasks):
+                    task = tasks[taskIndex]
+                    logic.statisticsCache.set(task[5], task[3])
+                return len(tasks), ROIDict['Entire Model']['TestCacheField']['TestCacheModel']
+            numberOfTasks, firstState = runStatistics()
+            # the second run reuses the result of the first one, in a copy
+            numberOfTasks, secondState = runStatistics()
+            if numberOfTasks != 0 or secondState is firstState or secondState.percentile50 != firstState.percentile50:
+                print '         Failed: the cached statistics are not reused'
+                return False
+            secondState.percentile50 = -1
+            numberOfTasks, thirdState = runStatistics()
+            if thirdState.percentile50 != firstState.percentile50:
+                print '         Failed: the cached statistics are shared with the tables'
+                return False
+            # a modified field is computed again
+            fieldArray.SetValue(0, 1000.0)
+            fieldArray.Modified()
+            numberOfTasks, fourthState = runStatistics()
+            if numberOfTasks != 1 or fourthState.max != 1000.0:
+                print '         Failed: the statistics of the modified field are not computed again'
+                return False
+        finally:
+            slicer.mrmlScene.RemoveNode(model)
+            slicer.mrmlScene.RemoveNode(modelDisplay)
+        print '         Passed'
+        return True
+
+    def testSinglePartitionStatistics(self):
+        logic = MeshStatisticsLogic()
+        print ' TEST Statistics computed with one partial sort '
+        array = numpy.random.RandomState(0).normal(5.0, 2.0, 10001)
+        fieldState = logic.StatisticStore()
+        logic.computeStatistics(array, fieldState)
+        # reference: one full sort for each percentile, as computed before
+        sortedArray = numpy.sort(array)
+        for percent, attribute in zip(logic.percents, ['percentile5', 'percentile15', 'percentile25', 'percentile50',
+                                                       'percentile75', 'percentile85', 'percentile95']):
+            percentile = round(sortedArray[int(math.ceil(sortedArray.size * percent - 1))], logic.numberOfDecimals)
+            if getattr(fieldState, attribute) != percentile:
+                print '         Failed', attribute, getattr(fieldState, attribute), percentile
+                return False
+        min, max = logic.computeMinMax(array)
+        if fieldState.min != min or fieldState.max != max \
+                or abs(fieldState.mean - logic.computeMean(array)) > 0.001 \
+                or abs(fieldState.std - logic.computeStandardDeviation(array)) > 0.001:
+            print '         Failed on min, max, mean or std'
+            return False
+        print '         Passed'
+        return True
+
     def testOnMesh(self, model, indexOfTheRegionConsidered, fieldToCheck, measurements, NameOftheTest):
         self.widget.inputComboBox.setCheckState(model, 2)
         self.widget.ROIComboBox.setCurrentIndex(indexOfTheRegionConsidered)
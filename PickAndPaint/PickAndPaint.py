@@ -4,6 +4,7 @@ from slicer.ScriptedLoadableModule import *
 from slicer.ScriptedLoadableModule import *
 import logging
 import sys
+import numpy
 
 class PickAndPaint(ScriptedLoadableModule):
     def __init__(self, parent):
@@ -64,6 +65,7 @@ class PickAndPaintWidget(ScriptedLoadableModuleWidget):
         self.surfaceDeplacementCheckBox = self.ShapeQuantifierCore.get("surfaceDeplacementCheckBox")
         self.landmarkComboBox = self.ShapeQuantifierCore.get("landmarkComboBox")
         self.radiusDefinitionWidget = self.ShapeQuantifierCore.get("radiusDefinitionWidget")
+        self.ROIModeComboBox = self.ShapeQuantifierCore.get("ROIModeComboBox")
         self.cleanerButton = self.ShapeQuantifierCore.get("cleanerButton")
         self.correspondentShapes = self.ShapeQuantifierCore.get("correspondentShapes")
         self.nonCorrespondentShapes = self.ShapeQuantifierCore.get("nonCorrespondentShapes")
@@ -82,6 +84,7 @@ class PickAndPaintWidget(ScriptedLoadableModuleWidget):
         self.surfaceDeplacementCheckBox.connect('stateChanged(int)', self.onSurfaceDeplacementStateChanged)
         self.landmarkComboBox.connect('currentIndexChanged(QString)', self.onLandmarkComboBoxChanged)
         self.radiusDefinitionWidget.connect('valueChanged(double)', self.onRadiusValueChanged)
+        self.ROIModeComboBox.connect('currentIndexChanged(int)', self.onROIModeChanged)
         self.propagateButton.connect('clicked()', self.onPropagateButton)
 
 
@@ -104,13 +107,12 @@ class PickAndPaintWidget(ScriptedLoadableModuleWidget):
         end = list.GetNumberOfItems()
         for i in range(0,end):
             fidList = list.GetItemAsObject(i)
-            landmarkDescription = self.ShapeQuantifierCore.decodeJSON(fidList.GetAttribute("landmarkDescription"))
+            landmarkDescription = self.ShapeQuantifierCore.getLandmarkDescription(fidList)
             if landmarkDescription:
                 for n in range(fidList.GetNumberOfMarkups()):
                     markupID = fidList.GetNthMarkupID(n)
                     markupLabel = fidList.GetNthMarkupLabel(n)
-                    landmarkDescription[markupID]["landmarkLabel"] = markupLabel
-                fidList.SetAttribute("landmarkDescription",self.ShapeQuantifierCore.encodeJSON(landmarkDescription))
+                    landmarkDescription.setLabel(markupID, markupLabel)
 
         onSurface = self.loadLandmarksOnSurfacCheckBox.isChecked()
         self.ShapeQuantifierCore.connectLandmarks(self.inputModelSelector,
@@ -141,16 +143,22 @@ class PickAndPaintWidget(ScriptedLoadableModuleWidget):
 
         if activeInput:
             # Update values on widgets.
-            landmarkDescription = self.ShapeQuantifierCore.decodeJSON(fidList.GetAttribute("landmarkDescription"))
+            landmarkDescription = self.ShapeQuantifierCore.getLandmarkDescription(fidList)
             if landmarkDescription and selectedFidReflID:
                 activeDictLandmarkValue = landmarkDescription[selectedFidReflID]
-                self.radiusDefinitionWidget.value = activeDictLandmarkValue["ROIradius"]
-                if activeDictLandmarkValue["projection"]["isProjected"]:
+                self.radiusDefinitionWidget.value = activeDictLandmarkValue.ROIradius
+                if activeDictLandmarkValue.isProjected:
                     self.surfaceDeplacementCheckBox.setChecked(True)
                 else:
                     self.surfaceDeplacementCheckBox.setChecked(False)
             else:
                 self.radiusDefinitionWidget.value = 0.0
+            self.ROIModeComboBox.blockSignals(True)
+            if fidList.GetAttribute("ROIMode") == "geodesic":
+                self.ROIModeComboBox.setCurrentIndex(1)
+            else:
+                self.ROIModeComboBox.setCurrentIndex(0)
+            self.ROIModeComboBox.blockSignals(False)
             self.ShapeQuantifierCore.UpdateThreeDView(self.landmarkComboBox.currentText)
 
 
@@ -158,10 +166,7 @@ class PickAndPaintWidget(ScriptedLoadableModuleWidget):
         print "-------Model Changed--------"
         if self.ShapeQuantifierCore.selectedModel:
             Model = self.ShapeQuantifierCore.selectedModel
-            try:
-                Model.RemoveObserver(self.ShapeQuantifierCore.decodeJSON(self.ShapeQuantifierCore.selectedModel.GetAttribute("modelModifieTagEvent")))
-            except:
-                pass
+            self.ShapeQuantifierCore.removeObserver(Model, Model.TransformModifiedEvent)
         self.ShapeQuantifierCore.selectedModel = self.inputModelSelector.currentNode()
         self.ShapeQuantifierCore.ModelChanged(self.inputModelSelector, self.inputLandmarksSelector)
         self.inputLandmarksSelector.setCurrentNode(None)
@@ -213,17 +218,16 @@ class PickAndPaintWidget(ScriptedLoadableModuleWidget):
             return
         selectedFidReflID = self.ShapeQuantifierCore.findIDFromLabel(fidList, self.landmarkComboBox.currentText)
         isOnSurface = self.surfaceDeplacementCheckBox.isChecked()
-        landmarkDescription = self.ShapeQuantifierCore.decodeJSON(fidList.GetAttribute("landmarkDescription"))
+        landmarkDescription = self.ShapeQuantifierCore.getLandmarkDescription(fidList)
         if isOnSurface:
             hardenModel = slicer.app.mrmlScene().GetNodeByID(fidList.GetAttribute("hardenModelID"))
-            landmarkDescription[selectedFidReflID]["projection"]["isProjected"] = True
-            landmarkDescription[selectedFidReflID]["projection"]["closestPointIndex"] =\
+            landmarkDescription[selectedFidReflID].isProjected = True
+            landmarkDescription[selectedFidReflID].closestPointIndex =\
                 self.ShapeQuantifierCore.projectOnSurface(hardenModel, fidList, selectedFidReflID)
         else:
-            landmarkDescription[selectedFidReflID]["projection"]["isProjected"] = False
-            landmarkDescription[selectedFidReflID]["projection"]["closestPointIndex"] = None
-            landmarkDescription[selectedFidReflID]["ROIradius"] = 0
-        fidList.SetAttribute("landmarkDescription",self.ShapeQuantifierCore.encodeJSON(landmarkDescription))
+            landmarkDescription[selectedFidReflID].isProjected = False
+            landmarkDescription[selectedFidReflID].closestPointIndex = None
+            landmarkDescription[selectedFidReflID].ROIradius = 0
 
 
     def onLandmarkComboBoxChanged(self):
@@ -237,18 +241,28 @@ class PickAndPaintWidget(ScriptedLoadableModuleWidget):
             return
         selectedFidReflID = self.ShapeQuantifierCore.findIDFromLabel(fidList, self.landmarkComboBox.currentText)
         if selectedFidReflID:
-            landmarkDescription = self.ShapeQuantifierCore.decodeJSON(fidList.GetAttribute("landmarkDescription"))
+            landmarkDescription = self.ShapeQuantifierCore.getLandmarkDescription(fidList)
             activeLandmarkState = landmarkDescription[selectedFidReflID]
-            activeLandmarkState["ROIradius"] = self.radiusDefinitionWidget.value
-            if not activeLandmarkState["projection"]["isProjected"]:
+            activeLandmarkState.ROIradius = self.radiusDefinitionWidget.value
+            if not activeLandmarkState.isProjected:
                 self.surfaceDeplacementCheckBox.setChecked(True)
                 hardenModel = slicer.app.mrmlScene().GetNodeByID(fidList.GetAttribute("hardenModelID"))
-                landmarkDescription[selectedFidReflID]["projection"]["isProjected"] = True
-                landmarkDescription[selectedFidReflID]["projection"]["closestPointIndex"] =\
+                landmarkDescription[selectedFidReflID].isProjected = True
+                landmarkDescription[selectedFidReflID].closestPointIndex =\
                     self.ShapeQuantifierCore.projectOnSurface(hardenModel, fidList, selectedFidReflID)
-            fidList.SetAttribute("landmarkDescription",self.ShapeQuantifierCore.encodeJSON(landmarkDescription))
             self.ShapeQuantifierCore.findROI(fidList)
 
+    def onROIModeChanged(self):
+        fidList = self.ShapeQuantifierCore.selectedFidList
+        if not fidList:
+            return
+        # the radius is either a number of rings of vertices or a geodesic distance in mm
+        if self.ROIModeComboBox.currentIndex == 1:
+            fidList.SetAttribute("ROIMode", "geodesic")
+        else:
+            fidList.SetAttribute("ROIMode", "rings")
+        self.ShapeQuantifierCore.findROI(fidList)
+
     def onCleanButton(self):
         messageBox = ctk.ctkMessageBox()
         messageBox.setWindowTitle(" /!\ WARNING /!\ ")
@@ -349,24 +363,20 @@ class PickAndPaintLogic(ScriptedLoadableModuleLogic):
             # Define the new ROI:
             selectedLandmarkID = self.ShapeQuantifierCore.findIDFromLabel(fidList, selectedLandmark)
             if selectedLandmarkID:
-                landmarkDescription = self.ShapeQuantifierCore.decodeJSON(fidList.GetAttribute("landmarkDescription"))
-                landmarkDescription[selectedLandmarkID]["projection"]["closestPointIndex"] =\
+                landmarkDescription = self.ShapeQuantifierCore.getLandmarkDescription(fidList)
+                landmarkDescription[selectedLandmarkID].closestPointIndex =\
                     self.ShapeQuantifierCore.projectOnSurface(hardenModel, fidList, selectedLandmarkID)
-                fidList.SetAttribute("landmarkDescription",self.ShapeQuantifierCore.encodeJSON(landmarkDescription))
             fidList.SetAttribute("isClean",self.ShapeQuantifierCore.encodeJSON({"isClean":True}))
             connectedModel = slicer.app.mrmlScene().GetNodeByID(fidList.GetAttribute("connectedModelID"))
             connectedModel.SetAttribute("isClean",self.ShapeQuantifierCore.encodeJSON({"isClean":True}))
 
 
     def propagateCorrespondent(self, referenceInputModel, propagatedInputModel, arrayName):
-        referencePointData = referenceInputModel.GetPolyData().GetPointData()
-        propagatedPointData = propagatedInputModel.GetPolyData().GetPointData()
-        arrayToPropagate = referencePointData.GetArray(arrayName)
-        if arrayToPropagate:
-
-            if propagatedPointData.GetArray(arrayName): # Array already exists
-                propagatedPointData.RemoveArray(arrayName)
-            propagatedPointData.AddArray(arrayToPropagate)
+        # the meshes are in correspondence: the ROI mask of the reference is copied vertex by vertex
+        referenceLabelLayer = self.ShapeQuantifierCore.getROILabelLayer(referenceInputModel.GetPolyData())
+        ROIMask = referenceLabelLayer.getMask(arrayName)
+        if ROIMask is not None:
+            self.ShapeQuantifierCore.addArrayFromIDs(numpy.flatnonzero(ROIMask), propagatedInputModel, arrayName)
             self.ShapeQuantifierCore.displayROI(propagatedInputModel, arrayName)
         else:
             print " NO ROI ARRAY FOUND. PLEASE DEFINE ONE BEFORE."
@@ -375,22 +385,19 @@ class PickAndPaintLogic(ScriptedLoadableModuleLogic):
     def propagateNonCorrespondent(self, fidList, modelToPropagate):
         print modelToPropagate.GetAttribute("hardenModelID")
         hardenModel = slicer.app.mrmlScene().GetNodeByID(modelToPropagate.GetAttribute("hardenModelID"))
-        landmarkDescription = self.ShapeQuantifierCore.decodeJSON(fidList.GetAttribute("landmarkDescription"))
+        landmarkDescription = self.ShapeQuantifierCore.getLandmarkDescription(fidList)
         arrayName = fidList.GetAttribute("arrayName")
-        ROIPointListID = vtk.vtkIdList()
+        ROIPointIDs = [numpy.zeros(0, dtype = numpy.int64)]
         for key,activeLandmarkState in landmarkDescription.iteritems():
-            tempROIPointListID = vtk.vtkIdList()
-            markupsIndex = fidList.GetMarkupIndexByID(key)
+            markupsIndex = self.ShapeQuantifierCore.getMarkupIndex(fidList, key)
             indexClosestPoint = self.ShapeQuantifierCore.getClosestPointIndex(fidList,modelToPropagate.GetPolyData(),markupsIndex)
-            if activeLandmarkState["ROIradius"] != 0:
-                self.ShapeQuantifierCore.defineNeighbor(tempROIPointListID,
+            if activeLandmarkState.ROIradius != 0:
+                ROIPointIDs.append(self.ShapeQuantifierCore.getROINeighborIDs(fidList,
                                     hardenModel.GetPolyData(),
                                     indexClosestPoint,
-                                    activeLandmarkState["ROIradius"])
-            for j in range(0, tempROIPointListID.GetNumberOfIds()):
-                ROIPointListID.InsertUniqueId(tempROIPointListID.GetId(j))
-        listID = ROIPointListID
-        self.ShapeQuantifierCore.addArrayFromIdList(listID, modelToPropagate, arrayName)
+                                    activeLandmarkState.ROIradius))
+        ROIPointIDs = numpy.unique(numpy.concatenate(ROIPointIDs))
+        self.ShapeQuantifierCore.addArrayFromIDs(ROIPointIDs, modelToPropagate, arrayName)
         self.ShapeQuantifierCore.displayROI(modelToPropagate, arrayName)
 
 class PickAndPaintTest(ScriptedLoadableModuleTest):
@@ -486,7 +493,7 @@ class PickAndPaintTest(ScriptedLoadableModuleTest):
         widget.inputLandmarksSelector.setCurrentNode(self.inputMarkupsFiducial)
         for point in PointsCoords:
             self.inputMarkupsFiducial.AddFiducial(point[0], point[1], point[2])
-            widget.ShapeQuantifierCore.onPointModifiedEvent(self.inputMarkupsFiducial,None)
+            widget.ShapeQuantifierCore.processPointModified(self.inputMarkupsFiducial)
             widget.radiusDefinitionWidget.value = 3.0
 
         return self.compare_ROIS(self.inputMarkupsFiducial, Model, FinalModel)
@@ -516,11 +523,12 @@ class PickAndPaintTest(ScriptedLoadableModuleTest):
         return self.compare_ROIS(self.inputMarkupsFiducial, model, finalModel)
 
     def compare_ROIS(self, fidlist, model1, model2):
-        ROI1 = model1.GetPolyData().GetPointData().GetArray(fidlist.GetAttribute("arrayName"))
-        ROI2 = model2.GetPolyData().GetPointData().GetArray(fidlist.GetAttribute("arrayName"))
+        # the reference models store their ROI in a "<model>_ROI" array, read as well by the label layer
+        ROI1 = self.widget.ShapeQuantifierCore.getROILabelLayer(model1.GetPolyData()).getMask(fidlist.GetAttribute("arrayName"))
+        ROI2 = self.widget.ShapeQuantifierCore.getROILabelLayer(model2.GetPolyData()).getMask(fidlist.GetAttribute("arrayName"))
         for i in range(0, 1002):
-            if ROI1.GetTuple(i)[0] != ROI2.GetTuple(i)[0]:
-                print ROI1.GetTuple(i)
-                print ROI2.GetTuple(i)
+            if ROI1[i] != ROI2[i]:
+                print ROI1[i]
+                print ROI2[i]
                 return False
         return True
\ No newline at end of file
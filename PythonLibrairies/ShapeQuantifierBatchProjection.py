@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# Headless projection of landmarks on the surface of their mesh.
+#
+# usage: python ShapeQuantifierBatchProjection.py manifest.csv -o outputDirectory [-p numberOfProcesses]
+#
+# Each line of the manifest is a pair "mesh,fcsv" (paths relative to the manifest are allowed,
+# empty lines and lines starting with '#' are skipped). For each pair, all the landmarks of the
+# fcsv file are moved on the closest vertex of the mesh, like Shape Quantifier does when
+# landmarks are connected "On Surface". The output directory receives:
+#   <fcsv name>_projected.fcsv   the fiducial file with the projected positions
+#   <fcsv name>_indexes.csv      label, markup ID and closest vertex index of each landmark
+# The landmarks and the mesh have to be in the same coordinate system.
+# Only vtk and numpy are needed (scipy is used if it is installed), Slicer is not: the
+# projection is the one of ShapeQuantifierComputation, which has to be next to this script.
+
+import argparse
+import csv
+import multiprocessing
+import os
+import sys
+import numpy
+import vtk
+from ShapeQuantifierComputation import getClosestPointIndexes
+
+
+meshReaders = {'.vtk': vtk.vtkPolyDataReader,
+               '.vtp': vtk.vtkXMLPolyDataReader,
+               '.stl': vtk.vtkSTLReader,
+               '.ply': vtk.vtkPLYReader,
+               '.obj': vtk.vtkOBJReader}
+
+
+def readMesh(filename):
+    extension = os.path.splitext(filename)[1].lower()
+    if extension not in meshReaders:
+        raise ValueError("Unsupported mesh format: " + filename)
+    reader = meshReaders[extension]()
+    reader.SetFileName(filename)
+    reader.Update()
+    polyData = reader.GetOutput()
+    if polyData.GetNumberOfPoints() == 0:
+        raise ValueError("No point read in " + filename)
+    return polyData
+
+
+def readFCSV(filename):
+    # return the comment lines and the rows of the markups of a Slicer fcsv file
+    headerLines = list()
+    rows = list()
+    with open(filename, 'rb') as fcsvFile:
+        for line in fcsvFile:
+            if line.startswith('#'):
+                headerLines.append(line.rstrip('\r\n'))
+            elif line.strip():
+                rows.append(line)
+    rows = list(csv.reader(rows))
+    return headerLines, rows
+
+
+def writeFCSV(filename, headerLines, rows):
+    with open(filename, 'wb') as fcsvFile:
+        for line in headerLines:
+            fcsvFile.write(line + '\n')
+        csv.writer(fcsvFile, lineterminator = '\n').writerows(rows)
+
+
+def projectLandmarks(meshFilename, fcsvFilename, outputDirectory):
+    # project the landmarks of fcsvFilename on the mesh and write the results in outputDirectory
+    polyData = readMesh(meshFilename)
+    headerLines, rows = readFCSV(fcsvFilename)
+    # columns of a markup: id,x,y,z,ow,ox,oy,oz,vis,sel,lock,label,desc,associatedNodeID
+    coords = numpy.array([[float(value) for value in row[1:4]] for row in rows]).reshape(-1, 3)
+    indexesClosestPoint = getClosestPointIndexes(polyData, coords)
+    for row, indexClosestPoint in zip(rows, indexesClosestPoint):
+        row[1:4] = [repr(coord) for coord in polyData.GetPoint(indexClosestPoint)]
+    name = os.path.splitext(os.path.basename(fcsvFilename))[0]
+    projectedFilename = os.path.join(outputDirectory, name + '_projected.fcsv')
+    writeFCSV(projectedFilename, headerLines, rows)
+    indexesFilename = os.path.join(outputDirectory, name + '_indexes.csv')
+    with open(indexesFilename, 'wb') as indexesFile:
+        cw = csv.writer(indexesFile, lineterminator = '\n')
+        cw.writerow(['label', 'markupID', 'closestPointIndex'])
+        for row, indexClosestPoint in zip(rows, indexesClosestPoint):
+            label = row[11] if len(row) > 11 else ''
+            cw.writerow([label, row[0], indexClosestPoint])
+    return projectedFilename, indexesFilename
+
+
+def projectPair(job):
+    # run in the worker processes: the errors are returned instead of stopping the whole batch
+    meshFilename, fcsvFilename, outputDirectory = job
+    try:
+        projectLandmarks(meshFilename, fcsvFilename, outputDirectory)
+        return fcsvFilename, None
+    except Exception as error:
+        return fcsvFilename, str(error)
+
+
+def readManifest(filename):
+    manifestDirectory = os.path.dirname(os.path.abspath(filename))
+    pairs = list()
+    with open(filename, 'rb') as manifestFile:
+        for row in csv.reader(manifestFile):
+            if not row or not row[0].strip() or row[0].strip().startswith('#'):
+                continue
+            if len(row) < 2:
+                raise ValueError("Manifest line without fcsv file: " + ','.join(row))
+            meshFilename, fcsvFilename = [os.path.join(manifestDirectory, path.strip()) for path in row[:2]]
+            pairs.append((meshFilename, fcsvFilename))
+    return pairs
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Project landmarks (fcsv) on the closest vertex of their mesh.")
+    parser.add_argument('manifest', help = "csv file, one 'mesh,fcsv' pair per line")
+    parser.add_argument('-o', '--outputDirectory', default = '.', help = "directory of the projected files")
+    parser.add_argument('-p', '--processes', type = int, default = multiprocessing.cpu_count(),
+                        help = "number of worker processes")
+    args = parser.parse_args(argv)
+    if not os.path.exists(args.outputDirectory):
+        os.makedirs(args.outputDirectory)
+    jobs = [(meshFilename, fcsvFilename, args.outputDirectory)
+            for meshFilename, fcsvFilename in readManifest(args.manifest)]
+    # two fcsv files with the same name would write the same output files
+    names = [os.path.splitext(os.path.basename(job[1]))[0] for job in jobs]
+    if len(set(names)) != len(names):
+        print "Several fcsv files of the manifest have the same name"
+        return 1
+    if args.processes > 1 and len(jobs) > 1:
+        pool = multiprocessing.Pool(min(args.processes, len(jobs)))
+        try:
+            results = pool.map(projectPair, jobs)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [projectPair(job) for job in jobs]
+    numberOfFailures = 0
+    for fcsvFilename, error in results:
+        if error:
+            numberOfFailures += 1
+            print "Failed: " + fcsvFilename + ": " + error
+    print str(len(results) - numberOfFailures) + " of " + str(len(results)) + " landmark files projected"
+    return 1 if numberOfFailures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
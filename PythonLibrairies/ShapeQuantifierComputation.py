@@ -0,0 +1,559 @@
+# Computations of the DCBIA modules that do not need Slicer: they only use vtk and numpy
+# and work on explicit inputs (polydata, arrays of coordinates, point IDs, landmark IDs).
+# Nothing here touches the MRML scene or the Qt widgets, so these functions can run in a
+# worker thread or process and their results be applied to the scene by ShapeQuantifierCore.
+import vtk
+import numpy
+import re
+import collections
+import heapq
+from vtk.util import numpy_support
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+
+def getGeometryKey(polyData):
+    # MTimes of the points and of the cells of polyData. Unlike polyData.GetMTime(), the key does
+    # not change when the point data is modified (e.g. when a ROI is written in the labels).
+    # The MTimes are unique, so replacing the points or the cells also changes the key.
+    key = [polyData.GetPoints().GetMTime() if polyData.GetPoints() else 0]
+    for cellArray in [polyData.GetVerts(), polyData.GetLines(), polyData.GetPolys(), polyData.GetStrips()]:
+        key.append(cellArray.GetMTime() if cellArray else 0)
+    return tuple(key)
+
+
+class PolyDataCache(object):
+    # LRU cache of objects built from a vtkPolyData (point locators, ...)
+    # An entry is identified by the polydata itself and is rebuilt as soon as the points or
+    # the cells of the polydata change. The least recently used entries are evicted when the estimated
+    # size of all the cached objects is higher than memoryBudget (in bytes). An entry keeps its
+    # polydata alive (the locators reference it too), so the size of the polydata is counted in
+    # the entry and remove() has to be called when a polydata is replaced.
+
+    class CacheEntry(object):
+        __slots__ = ('polyData', 'geometryKey', 'value', 'size')
+
+        def __init__(self, polyData, value, size):
+            self.polyData = polyData
+            self.geometryKey = getGeometryKey(polyData)
+            self.value = value
+            self.size = size
+
+    def __init__(self, memoryBudget):
+        self.memoryBudget = memoryBudget
+        self.usedMemory = 0
+        self.entries = collections.OrderedDict()
+
+    def get(self, polyData, builder):
+        # builder(polyData) has to return the object to cache and an estimation of its size
+        key = id(polyData)
+        entry = self.entries.pop(key, None)
+        if entry:
+            if entry.polyData is polyData and entry.geometryKey == getGeometryKey(polyData):
+                self.entries[key] = entry
+                return entry.value
+            self.usedMemory -= entry.size
+        value, size = builder(polyData)
+        # GetActualMemorySize is in kibibytes
+        size += 1024 * polyData.GetActualMemorySize()
+        self.entries[key] = self.CacheEntry(polyData, value, size)
+        self.usedMemory += size
+        # the entry just added is always kept, even if it is bigger than the budget
+        while self.usedMemory > self.memoryBudget and len(self.entries) > 1:
+            key, entry = self.entries.popitem(last=False)
+            self.usedMemory -= entry.size
+        return value
+
+    def remove(self, polyData):
+        entry = self.entries.get(id(polyData))
+        if entry and entry.polyData is polyData:
+            del self.entries[id(polyData)]
+            self.usedMemory -= entry.size
+
+    def clear(self):
+        self.entries.clear()
+        self.usedMemory = 0
+
+    def onCloseScene(self, obj, event):
+        self.clear()
+
+
+class MeshAdjacency(object):
+    # Vertex adjacency of a mesh stored in CSR format: the neighbors of the vertex v are
+    # indices[indptr[v]:indptr[v+1]]. They are sorted like vtkPolyData gives them: cells containing
+    # v in increasing cell ID order, then points in the order of each cell.
+    # edgeLengths[k] is the length (in mm) of the edge between v and indices[k].
+
+    def __init__(self, polyData):
+        numberOfPoints = polyData.GetNumberOfPoints()
+        vertices = list()
+        neighbors = list()
+        # GetPointCells numbers the cells in this order
+        for cellArray in [polyData.GetVerts(), polyData.GetLines(), polyData.GetPolys(), polyData.GetStrips()]:
+            if cellArray is None or cellArray.GetNumberOfCells() == 0:
+                continue
+            cells = self.getCellsPoints(cellArray)
+            for cellPoints in cells:
+                # every point of a cell is connected to all the points of the cell
+                vertices.append(numpy.repeat(cellPoints, cellPoints.shape[-1], axis = -1).ravel())
+                neighbors.append(numpy.tile(cellPoints, cellPoints.shape[-1]).ravel())
+        if vertices:
+            vertices = numpy.concatenate(vertices)
+            neighbors = numpy.concatenate(neighbors)
+        else:
+            vertices = numpy.zeros(0, dtype = numpy.int64)
+            neighbors = numpy.zeros(0, dtype = numpy.int64)
+        # stable sort: the order of the cells and of the points in the cells is kept for each vertex
+        order = numpy.argsort(vertices, kind = 'mergesort')
+        vertices = vertices[order]
+        neighbors = neighbors[order]
+        # remove the vertex itself and the points shared by several cells, keeping the first occurrence
+        keys = vertices.astype(numpy.int64) * numberOfPoints + neighbors
+        unusedKeys, firstOccurrences = numpy.unique(keys, return_index = True)
+        firstOccurrences.sort()
+        vertices = vertices[firstOccurrences]
+        neighbors = neighbors[firstOccurrences]
+        isNotItself = vertices != neighbors
+        vertices = vertices[isNotItself]
+        self.indices = neighbors[isNotItself]
+        self.indptr = numpy.zeros(numberOfPoints + 1, dtype = numpy.int64)
+        numpy.cumsum(numpy.bincount(vertices, minlength = numberOfPoints), out = self.indptr[1:])
+        self.numberOfPoints = numberOfPoints
+        if numberOfPoints:
+            points = numpy_support.vtk_to_numpy(polyData.GetPoints().GetData())
+            edges = points[self.indices] - points[vertices]
+            self.edgeLengths = numpy.sqrt((edges * edges).sum(axis = 1))
+        else:
+            self.edgeLengths = numpy.zeros(0)
+
+    def getCellsPoints(self, cellArray):
+        # Return a list of arrays (numberOfCells, numberOfPointsByCell), one by size of cell.
+        # Meshes only made of triangles are read without any loop.
+        data = numpy_support.vtk_to_numpy(cellArray.GetData())
+        numberOfCells = cellArray.GetNumberOfCells()
+        cellSize = data[0]
+        if data.size == numberOfCells * (cellSize + 1):
+            cells = data.reshape(numberOfCells, cellSize + 1)
+            if (cells[:, 0] == cellSize).all():
+                return [cells[:, 1:]]
+        cellsPoints = list()
+        position = 0
+        while position < data.size:
+            cellSize = data[position]
+            cellsPoints.append(data[position + 1:position + 1 + cellSize].reshape(1, cellSize))
+            position += cellSize + 1
+        return cellsPoints
+
+    def getNeighbors(self, pointID):
+        return self.indices[self.indptr[pointID]:self.indptr[pointID + 1]]
+
+    def getRings(self, pointID, numberOfRings):
+        # Vertices at most numberOfRings edges away from pointID, in the order they are reached.
+        # Only the vertices added by the last ring are expanded.
+        visited = numpy.zeros(self.numberOfPoints, dtype = bool)
+        visited[pointID] = True
+        rings = [numpy.array([pointID], dtype = numpy.int64)]
+        frontier = rings[0]
+        for ring in range(numberOfRings):
+            starts = self.indptr[frontier]
+            lengths = self.indptr[frontier + 1] - starts
+            if lengths.sum() == 0:
+                break
+            # positions in indices of the neighbors of all the frontier vertices, in order
+            offsets = numpy.repeat(starts - numpy.cumsum(lengths) + lengths, lengths)
+            candidates = self.indices[offsets + numpy.arange(lengths.sum())]
+            candidates = candidates[~visited[candidates]]
+            unusedCandidates, firstOccurrences = numpy.unique(candidates, return_index = True)
+            frontier = candidates[numpy.sort(firstOccurrences)]
+            if frontier.size == 0:
+                break
+            visited[frontier] = True
+            rings.append(frontier)
+        return numpy.concatenate(rings)
+
+    def getGeodesicNeighborhood(self, pointID, radius):
+        # Vertices whose distance to pointID along the edges of the mesh is lower than radius,
+        # sorted by distance. Dijkstra is stopped as soon as the closest vertex left is too far.
+        distances = {pointID: 0.0}
+        reached = list()
+        heap = [(0.0, pointID)]
+        while heap:
+            distance, vertex = heapq.heappop(heap)
+            if distance > distances[vertex]:
+                # this vertex has been reached by a shorter path since it was pushed
+                continue
+            reached.append(vertex)
+            start = self.indptr[vertex]
+            end = self.indptr[vertex + 1]
+            for neighbor, length in zip(self.indices[start:end].tolist(), self.edgeLengths[start:end].tolist()):
+                newDistance = distance + length
+                if newDistance <= radius and newDistance < distances.get(neighbor, float('inf')):
+                    distances[neighbor] = newDistance
+                    heapq.heappush(heap, (newDistance, neighbor))
+        return numpy.array(reached, dtype = numpy.int64)
+
+
+class ROIState(object):
+    # Vertices of the ROI of each landmark of a fiducial list and, for each vertex of the mesh,
+    # the number of landmark ROIs containing it. When a landmark moves or its radius changes,
+    # only its ROI is recomputed and the vertices entering or leaving the union are returned.
+
+    def __init__(self, polyData, mode):
+        self.polyData = polyData
+        self.geometryKey = getGeometryKey(polyData)
+        self.mode = mode
+        # markupID -> (closestPointIndex, ROIradius, IDs of the vertices)
+        self.landmarkROIs = dict()
+        self.counts = numpy.zeros(polyData.GetNumberOfPoints(), dtype = numpy.int32)
+
+    def isValid(self, polyData, mode):
+        return self.polyData is polyData and self.geometryKey == getGeometryKey(polyData) and self.mode == mode
+
+    def removeLandmark(self, markupID):
+        IDs = self.landmarkROIs.pop(markupID)[2]
+        self.counts[IDs] -= 1
+        return IDs
+
+    def update(self, landmarkDescription, getNeighborIDs):
+        # getNeighborIDs(closestPointIndex, ROIradius) computes the ROI of a landmark
+        changedIDs = [numpy.zeros(0, dtype = numpy.int64)]
+        for markupID in self.landmarkROIs.keys():
+            if markupID not in landmarkDescription or landmarkDescription[markupID].ROIradius == 0:
+                changedIDs.append(self.removeLandmark(markupID))
+        for markupID, landmarkState in landmarkDescription.iteritems():
+            if landmarkState.ROIradius == 0 or landmarkState.closestPointIndex is None:
+                continue
+            landmarkROI = self.landmarkROIs.get(markupID)
+            if landmarkROI:
+                if landmarkROI[0] == landmarkState.closestPointIndex and landmarkROI[1] == landmarkState.ROIradius:
+                    continue
+                changedIDs.append(self.removeLandmark(markupID))
+            IDs = getNeighborIDs(landmarkState.closestPointIndex, landmarkState.ROIradius)
+            # the IDs of a landmark ROI are unique
+            self.counts[IDs] += 1
+            self.landmarkROIs[markupID] = (landmarkState.closestPointIndex, landmarkState.ROIradius, IDs)
+            changedIDs.append(IDs)
+        return numpy.unique(numpy.concatenate(changedIDs))
+
+    def getROIIDs(self):
+        return numpy.flatnonzero(self.counts)
+
+
+class ROILabelLayer(object):
+    # All the ROIs of a mesh are stored in a single point data array of unsigned int:
+    # the bit n of the label of a vertex is set if the vertex belongs to the ROI n.
+    # The name of the ROI n is the value n of a string array stored in the field data
+    # (an empty name marks a free bit). Both arrays are saved with the model.
+    # The ROI arrays written by the previous versions ("<model>_ROI" point data arrays)
+    # are still read as ROIs.
+    labelsArrayName = "ROILabels"
+    namesArrayName = "ROINames"
+    # the ROI displayed on the mesh is copied in this array, colored with a 2 values lookup table
+    displayArrayName = "ROIDisplay"
+    maxNumberOfROIs = 32
+    legacyExpression = '_ROI'
+    # the masks are computed from the labels by chunks of maskChunkSize vertices
+    maskChunkSize = 65536
+
+    def __init__(self, polyData):
+        self.polyData = polyData
+        self.labelsArray = None
+        self.namesArray = None
+        labelsArray = polyData.GetPointData().GetArray(self.labelsArrayName)
+        namesArray = polyData.GetFieldData().GetAbstractArray(self.namesArrayName)
+        # the labels are dropped if the number of points changed (e.g. the mesh was cleaned)
+        if labelsArray and namesArray and labelsArray.GetNumberOfTuples() == polyData.GetNumberOfPoints():
+            self.labelsArray = labelsArray
+            self.namesArray = namesArray
+
+    def isLayerArray(self, arrayName):
+        return arrayName in (self.labelsArrayName, self.displayArrayName)
+
+    def createArrays(self):
+        pointData = self.polyData.GetPointData()
+        fieldData = self.polyData.GetFieldData()
+        pointData.RemoveArray(self.labelsArrayName)
+        fieldData.RemoveArray(self.namesArrayName)
+        self.labelsArray = vtk.vtkUnsignedIntArray()
+        self.labelsArray.SetName(self.labelsArrayName)
+        self.labelsArray.SetNumberOfTuples(self.polyData.GetNumberOfPoints())
+        self.getLabels()[:] = 0
+        pointData.AddArray(self.labelsArray)
+        self.namesArray = vtk.vtkStringArray()
+        self.namesArray.SetName(self.namesArrayName)
+        fieldData.AddArray(self.namesArray)
+
+    def getLabels(self):
+        # NumPy view on the VTK buffer
+        return numpy_support.vtk_to_numpy(self.labelsArray)
+
+    def getBit(self, ROIName):
+        if self.namesArray and ROIName:
+            for bit in range(self.namesArray.GetNumberOfValues()):
+                if self.namesArray.GetValue(bit) == ROIName:
+                    return bit
+        return None
+
+    def getBitValue(self, bit):
+        return numpy.uint32(1 << bit)
+
+    def hasROI(self, ROIName):
+        return self.getBit(ROIName) is not None
+
+    def getLegacyArrayNames(self):
+        pointData = self.polyData.GetPointData()
+        legacyArrayNames = list()
+        for i in range(pointData.GetNumberOfArrays()):
+            array = pointData.GetArray(i)
+            if array and array.GetName() and re.search(self.legacyExpression, array.GetName()):
+                legacyArrayNames.append(array.GetName())
+        return legacyArrayNames
+
+    def getROINames(self):
+        ROINames = list()
+        if self.namesArray:
+            for bit in range(self.namesArray.GetNumberOfValues()):
+                if self.namesArray.GetValue(bit):
+                    ROINames.append(self.namesArray.GetValue(bit))
+        for arrayName in self.getLegacyArrayNames():
+            if arrayName not in ROINames:
+                ROINames.append(arrayName)
+        return ROINames
+
+    def registerROI(self, ROIName):
+        # return the bit of the ROI, raise a ValueError if all the bits are already used
+        bit = self.getBit(ROIName)
+        if bit is not None:
+            return bit
+        if not self.labelsArray:
+            self.createArrays()
+        for freeBit in range(self.namesArray.GetNumberOfValues()):
+            if not self.namesArray.GetValue(freeBit):
+                self.namesArray.SetValue(freeBit, ROIName)
+                return freeBit
+        if self.namesArray.GetNumberOfValues() == self.maxNumberOfROIs:
+            raise ValueError("No more than " + str(self.maxNumberOfROIs) + " ROIs can be defined on a mesh")
+        self.namesArray.InsertNextValue(ROIName)
+        self.namesArray.Modified()
+        return self.namesArray.GetNumberOfValues() - 1
+
+    def unregisterROI(self, ROIName):
+        bit = self.getBit(ROIName)
+        if bit is None:
+            return
+        labels = self.getLabels()
+        labels &= ~self.getBitValue(bit)
+        self.labelsArray.Modified()
+        self.namesArray.SetValue(bit, "")
+        self.namesArray.Modified()
+
+    def setROI(self, ROIName, IDs):
+        # the ROI is made of the vertices IDs
+        bit = self.registerROI(ROIName)
+        # the ROI is now stored in the labels
+        self.polyData.GetPointData().RemoveArray(ROIName)
+        bitValue = self.getBitValue(bit)
+        labels = self.getLabels()
+        labels &= ~bitValue
+        labels[IDs] |= bitValue
+        self.labelsArray.Modified()
+
+    def patchROI(self, ROIName, IDs, isInROI):
+        # only the vertices IDs are updated: isInROI[i] tells if IDs[i] belongs to the ROI
+        bit = self.getBit(ROIName)
+        if bit is None:
+            return False
+        bitValue = self.getBitValue(bit)
+        labels = self.getLabels()
+        labels[IDs] = numpy.where(isInROI, labels[IDs] | bitValue, labels[IDs] & ~bitValue)
+        self.labelsArray.Modified()
+        return True
+
+    def getLabelsAndBitValue(self, ROIName):
+        # NumPy view on the labels and value of the bit of the ROI, None if the ROI is not in the
+        # labels. The vertex n belongs to the ROI if labels[n] & bitValue is not 0.
+        bit = self.getBit(ROIName)
+        if bit is None:
+            return None
+        return self.getLabels(), self.getBitValue(bit)
+
+    def getMask(self, ROIName):
+        # boolean mask of the ROI computed from the labels, None if the ROI does not exist.
+        # The mask is a new array: modifying it does not change the ROI, use setROI or patchROI.
+        labelsAndBitValue = self.getLabelsAndBitValue(ROIName)
+        if labelsAndBitValue is not None:
+            labels, bitValue = labelsAndBitValue
+            mask = numpy.empty(labels.size, dtype = bool)
+            # the temporary arrays are the size of a chunk, not of the mesh
+            for start in range(0, labels.size, self.maskChunkSize):
+                stop = start + self.maskChunkSize
+                numpy.not_equal(labels[start:stop] & bitValue, 0, out = mask[start:stop])
+            return mask
+        legacyArray = self.polyData.GetPointData().GetArray(ROIName)
+        if legacyArray and legacyArray.GetNumberOfTuples() == self.polyData.GetNumberOfPoints():
+            return numpy_support.vtk_to_numpy(legacyArray) != 0
+        return None
+
+    def getMTime(self, ROIName):
+        # modification time of the arrays the mask of the ROI is read from, None if the ROI does not exist
+        if self.getBit(ROIName) is not None:
+            return max(self.labelsArray.GetMTime(), self.namesArray.GetMTime())
+        legacyArray = self.polyData.GetPointData().GetArray(ROIName)
+        if legacyArray:
+            return legacyArray.GetMTime()
+        return None
+
+    def iterROIs(self):
+        for ROIName in self.getROINames():
+            yield ROIName, self.getMask(ROIName)
+
+
+def getPointCoordinates(polyData):
+    # NumPy view (N,3) on the points of polyData
+    return numpy_support.vtk_to_numpy(polyData.GetPoints().GetData())
+
+
+def buildPointLocator(polyData):
+    pointLocator = vtk.vtkPointLocator()
+    pointLocator.SetDataSet(polyData)
+    pointLocator.AutomaticOn()
+    pointLocator.BuildLocator()
+    # rough estimation of the memory used: the point ids and about one bucket for 3 points
+    return pointLocator, 40 * polyData.GetNumberOfPoints()
+
+
+def buildKDTree(polyData):
+    return cKDTree(getPointCoordinates(polyData)), 40 * polyData.GetNumberOfPoints()
+
+
+def buildMeshAdjacency(polyData):
+    adjacency = MeshAdjacency(polyData)
+    return adjacency, adjacency.indptr.nbytes + adjacency.indices.nbytes + adjacency.edgeLengths.nbytes
+
+
+def getFromCache(cache, polyData, builder):
+    # the search structures are built without cache when no cache is given
+    if cache is None:
+        return builder(polyData)[0]
+    return cache.get(polyData, builder)
+
+
+def getClosestPointIndex(polyData, coord, pointLocatorCache = None):
+    return getFromCache(pointLocatorCache, polyData, buildPointLocator).FindClosestPoint(coord)
+
+
+def getClosestPointIndexes(polyData, coords, kdTreeCache = None, pointLocatorCache = None):
+    # closest point of the mesh for each row of the array coords (N,3)
+    if len(coords) == 0:
+        return []
+    if cKDTree:
+        kdTree = getFromCache(kdTreeCache, polyData, buildKDTree)
+        distances, indexesClosestPoint = kdTree.query(coords)
+        return [int(index) for index in indexesClosestPoint]
+    pointLocator = getFromCache(pointLocatorCache, polyData, buildPointLocator)
+    return [pointLocator.FindClosestPoint(coord) for coord in coords]
+
+
+def projectOnSurface(polyData, coords, kdTreeCache = None, pointLocatorCache = None):
+    # return the closest point index of each row of coords (N,3) and the coordinates of these points
+    closestPointIndexes = getClosestPointIndexes(polyData, coords, kdTreeCache, pointLocatorCache)
+    projectedCoords = getPointCoordinates(polyData)[closestPointIndexes].reshape(-1, 3)
+    return closestPointIndexes, projectedCoords
+
+
+def getROINeighborIDs(adjacency, pointID, radius, mode):
+    # IDs of the vertices of the ROI centered on pointID: radius is a number of rings
+    # (at least one) or a distance along the surface in mm if mode is "geodesic"
+    if mode == "geodesic":
+        return adjacency.getGeodesicNeighborhood(pointID, radius)
+    return adjacency.getRings(pointID, max(1, int(radius)))
+
+
+def calculateMidPointCoord(coord1, coord2):
+    return [(coord1[0] + coord2[0])/2, (coord1[1] + coord2[1])/2, (coord1[2] + coord2[2])/2]
+
+
+def getMidPointLevels(landmarkDescription, landmarkIDs = None, markupIndexes = None):
+    # Midpoints depending (directly or not) on the landmarks landmarkIDs (all the midpoints if
+    # None), grouped by levels of the dependency graph: the parents of a midpoint of a level are
+    # in the previous levels or are not changed. Each midpoint appears once.
+    # If markupIndexes is given, the midpoints which are not in it or whose parents are not in it
+    # (removed markups) are skipped.
+    # Raise a ValueError if the midpoints definitions have a cycle.
+    if landmarkIDs is None:
+        landmarkIDs = list(landmarkDescription.iterkeys())
+    dependents = set()
+    stack = [markupID for markupID in landmarkIDs if markupID in landmarkDescription]
+    while stack:
+        markupID = stack.pop()
+        for midPointID in landmarkDescription[markupID].definedByThisMarkup:
+            if midPointID not in dependents and midPointID in landmarkDescription \
+                    and landmarkDescription[midPointID].isMidPoint \
+                    and (markupIndexes is None or isMidPointIndexed(landmarkDescription, midPointID, markupIndexes)):
+                dependents.add(midPointID)
+                stack.append(midPointID)
+    # number of parents of each midpoint which have to be computed before it
+    numberOfParents = dict()
+    for midPointID in dependents:
+        midPointState = landmarkDescription[midPointID]
+        numberOfParents[midPointID] = len(set([midPointState.Point1, midPointState.Point2]) & dependents)
+    levels = list()
+    level = sorted(midPointID for midPointID in dependents if numberOfParents[midPointID] == 0)
+    numberOfSortedMidPoints = 0
+    while level:
+        levels.append(level)
+        numberOfSortedMidPoints += len(level)
+        nextLevel = list()
+        for markupID in level:
+            for midPointID in set(landmarkDescription[markupID].definedByThisMarkup) & dependents:
+                numberOfParents[midPointID] -= 1
+                if numberOfParents[midPointID] == 0:
+                    nextLevel.append(midPointID)
+        level = sorted(nextLevel)
+    if numberOfSortedMidPoints != len(dependents):
+        cycle = sorted(midPointID for midPointID in dependents if numberOfParents[midPointID] > 0)
+        raise ValueError("Cycle in the definition of the midpoints: " + ", ".join(cycle))
+    return levels
+
+
+def isMidPointIndexed(landmarkDescription, midPointID, markupIndexes):
+    midPointState = landmarkDescription[midPointID]
+    return midPointID in markupIndexes and midPointState.Point1 in markupIndexes and midPointState.Point2 in markupIndexes
+
+
+def computeMidPointCoords(coords, indexes1, indexes2):
+    # midpoints of the rows indexes1 and indexes2 of the array coords (N,3)
+    return (coords[indexes1] + coords[indexes2]) / 2.0
+
+
+def computeMidPointUpdates(landmarkDescription, coords, markupIndexes, landmarkIDs = None, polyData = None,
+                           kdTreeCache = None, pointLocatorCache = None):
+    # New positions of the midpoints depending (directly or not) on landmarkIDs (all the midpoints
+    # if None). coords (N,3) are the positions of all the landmarks of the list and markupIndexes
+    # gives the row of each markup ID. Each level of the dependency graph is computed with one
+    # indexed average, the projected midpoints of a level are moved on the closest point of polyData
+    # with one query. Return the rows of the moved midpoints, their new positions (M,3) and their
+    # closest point indexes (None if not projected). Each midpoint is computed once.
+    # The midpoints defined from markups missing from markupIndexes are not moved.
+    coords = numpy.array(coords, dtype = float).reshape(-1, 3)
+    rows = list()
+    closestPointIndexes = list()
+    for level in getMidPointLevels(landmarkDescription, landmarkIDs, markupIndexes):
+        levelRows = numpy.array([markupIndexes[midPointID] for midPointID in level], dtype = int)
+        indexes1 = [markupIndexes[landmarkDescription[midPointID].Point1] for midPointID in level]
+        indexes2 = [markupIndexes[landmarkDescription[midPointID].Point2] for midPointID in level]
+        coords[levelRows] = computeMidPointCoords(coords, indexes1, indexes2)
+        levelClosestPointIndexes = [None] * len(level)
+        projected = [n for n, midPointID in enumerate(level) if landmarkDescription[midPointID].isProjected]
+        if projected and polyData:
+            projectedRows = levelRows[projected]
+            indexes = getClosestPointIndexes(polyData, coords[projectedRows], kdTreeCache, pointLocatorCache)
+            points = numpy_support.vtk_to_numpy(polyData.GetPoints().GetData())
+            coords[projectedRows] = points[indexes]
+            for n, indexClosestPoint in zip(projected, indexes):
+                levelClosestPointIndexes[n] = indexClosestPoint
+        rows.extend(levelRows.tolist())
+        closestPointIndexes.extend(levelClosestPointIndexes)
+    return rows, coords[rows].reshape(-1, 3), closestPointIndexes
@@ -2,15 +2,669 @@ import vtk, qt, ctk, slicer
 from slicer.ScriptedLoadableModule import *
 import numpy
 import json
-import time
+import collections
+import contextlib
+import logging
+from vtk.util import numpy_support
+# computations without widgets nor scene, the classes are also reachable from this module
+import ShapeQuantifierComputation
+from ShapeQuantifierComputation import PolyDataCache, MeshAdjacency, ROIState, ROILabelLayer, getGeometryKey
 
 #
 # CalculateDisplacement
 #
 
 
+class LandmarkState(object):
+    # Description of one landmark of a fiducial list
+    __slots__ = ('landmarkLabel', 'ROIradius', 'isProjected', 'closestPointIndex',
+                 'definedByThisMarkup', 'isMidPoint', 'Point1', 'Point2')
+
+    def __init__(self, landmarkLabel, isProjected = False):
+        self.landmarkLabel = landmarkLabel
+        self.ROIradius = 0
+        self.isProjected = isProjected
+        self.closestPointIndex = None
+        # midpoints computed from this landmark
+        self.definedByThisMarkup = list()
+        self.isMidPoint = False
+        self.Point1 = None
+        self.Point2 = None
+
+    def copy(self):
+        landmarkState = LandmarkState(self.landmarkLabel, self.isProjected)
+        landmarkState.ROIradius = self.ROIradius
+        landmarkState.closestPointIndex = self.closestPointIndex
+        landmarkState.definedByThisMarkup = list(self.definedByThisMarkup)
+        landmarkState.isMidPoint = self.isMidPoint
+        landmarkState.Point1 = self.Point1
+        landmarkState.Point2 = self.Point2
+        return landmarkState
+
+    def toDict(self):
+        return {"landmarkLabel": self.landmarkLabel,
+                "ROIradius": self.ROIradius,
+                "projection": {"isProjected": self.isProjected,
+                               "closestPointIndex": self.closestPointIndex},
+                "midPoint": {"definedByThisMarkup": self.definedByThisMarkup,
+                             "isMidPoint": self.isMidPoint,
+                             "Point1": self.Point1,
+                             "Point2": self.Point2}}
+
+    @staticmethod
+    def fromDict(landmarkDict):
+        landmarkState = LandmarkState(landmarkDict["landmarkLabel"], landmarkDict["projection"]["isProjected"])
+        landmarkState.ROIradius = landmarkDict["ROIradius"]
+        landmarkState.closestPointIndex = landmarkDict["projection"]["closestPointIndex"]
+        landmarkState.definedByThisMarkup = landmarkDict["midPoint"]["definedByThisMarkup"]
+        landmarkState.isMidPoint = landmarkDict["midPoint"]["isMidPoint"]
+        landmarkState.Point1 = landmarkDict["midPoint"]["Point1"]
+        landmarkState.Point2 = landmarkDict["midPoint"]["Point2"]
+        return landmarkState
+
+
+class LandmarkDescription(object):
+    # Description of all the landmarks of a fiducial list, the LandmarkStates are stored by markup ID.
+    # While Slicer is running it is kept in memory, it is written in the attribute
+    # "landmarkDescription" of the fiducial list only when the scene is saved.
+
+    def __init__(self):
+        self.landmarks = dict()
+        # indexes kept up to date with the landmarks: label -> markup ID and markup ID -> markup index
+        self.labelToID = dict()
+        self.IDToIndex = dict()
+        # ROI of each landmark computed by findROI, not saved
+        self.ROIState = None
+        # positions of the landmarks when their moves were last processed, not saved
+        self.positions = dict()
+
+    def __getitem__(self, markupID):
+        return self.landmarks[markupID]
+
+    def __setitem__(self, markupID, landmarkState):
+        self.landmarks[markupID] = landmarkState
+        self.labelToID[landmarkState.landmarkLabel] = markupID
+
+    def __contains__(self, markupID):
+        return markupID in self.landmarks
+
+    def __len__(self):
+        return len(self.landmarks)
+
+    def __iter__(self):
+        return iter(self.landmarks)
+
+    def keys(self):
+        return self.landmarks.keys()
+
+    def iterkeys(self):
+        return self.landmarks.iterkeys()
+
+    def iteritems(self):
+        return self.landmarks.iteritems()
+
+    def pop(self, markupID, default = None):
+        landmarkState = self.landmarks.pop(markupID, None)
+        if landmarkState is None:
+            return default
+        if self.labelToID.get(landmarkState.landmarkLabel) == markupID:
+            del self.labelToID[landmarkState.landmarkLabel]
+        self.IDToIndex.pop(markupID, None)
+        self.positions.pop(markupID, None)
+        return landmarkState
+
+    def removeLandmark(self, markupID):
+        # remove the landmark and its references: a midpoint defined from it becomes a landmark
+        landmarkState = self.pop(markupID)
+        if landmarkState is None:
+            return None
+        if landmarkState.isMidPoint:
+            for parentID in [landmarkState.Point1, landmarkState.Point2]:
+                if parentID in self.landmarks and markupID in self.landmarks[parentID].definedByThisMarkup:
+                    self.landmarks[parentID].definedByThisMarkup.remove(markupID)
+        for midPointID in landmarkState.definedByThisMarkup:
+            midPointState = self.landmarks.get(midPointID)
+            if midPointState is None:
+                continue
+            for parentID in [midPointState.Point1, midPointState.Point2]:
+                if parentID != markupID and parentID in self.landmarks \
+                        and midPointID in self.landmarks[parentID].definedByThisMarkup:
+                    self.landmarks[parentID].definedByThisMarkup.remove(midPointID)
+            midPointState.isMidPoint = False
+            midPointState.Point1 = None
+            midPointState.Point2 = None
+        return landmarkState
+
+    def setLabel(self, markupID, landmarkLabel):
+        landmarkState = self.landmarks[markupID]
+        if self.labelToID.get(landmarkState.landmarkLabel) == markupID:
+            del self.labelToID[landmarkState.landmarkLabel]
+        landmarkState.landmarkLabel = landmarkLabel
+        self.labelToID[landmarkLabel] = markupID
+
+    def findIDFromLabel(self, landmarkLabel):
+        return self.labelToID.get(landmarkLabel)
+
+    def setMarkupIndex(self, markupID, index):
+        self.IDToIndex[markupID] = index
+
+    def getMarkupIndex(self, fidList, markupID):
+        index = self.IDToIndex.get(markupID)
+        # the index is checked because markups can be added or removed without our observers
+        if index is None or index >= fidList.GetNumberOfMarkups() or fidList.GetNthMarkupID(index) != markupID:
+            self.updateIndexes(fidList)
+            index = self.IDToIndex.get(markupID, -1)
+        return index
+
+    def checkIndexes(self, fidList):
+        # The indexes are kept up to date by the markup added and removed events, they are only
+        # rebuilt if markups were added or removed without our observers
+        if len(self.IDToIndex) != fidList.GetNumberOfMarkups():
+            self.updateIndexes(fidList)
+
+    def removeMarkupIndexes(self, fidList):
+        # Called after markups were removed from fidList: return the IDs of the removed markups and
+        # shift the indexes of the following ones. A single removed markup is found by a binary search
+        # on the markups, the indexes are rebuilt in the other cases.
+        orderedIDs = [None] * len(self.IDToIndex)
+        for markupID, index in self.IDToIndex.iteritems():
+            if index < len(orderedIDs):
+                orderedIDs[index] = markupID
+        if len(orderedIDs) == fidList.GetNumberOfMarkups() + 1 and None not in orderedIDs:
+            # the markups before the removed one are at the same index, the following ones are shifted
+            start = 0
+            end = len(orderedIDs) - 1
+            while start < end:
+                middle = (start + end) // 2
+                if fidList.GetNthMarkupID(middle) == orderedIDs[middle]:
+                    start = middle + 1
+                else:
+                    end = middle
+            removedIndex = start
+            if (removedIndex == 0 or fidList.GetNthMarkupID(removedIndex - 1) == orderedIDs[removedIndex - 1]) and \
+                    (removedIndex == len(orderedIDs) - 1 or
+                     fidList.GetNthMarkupID(removedIndex) == orderedIDs[removedIndex + 1]):
+                del self.IDToIndex[orderedIDs[removedIndex]]
+                for markupID in orderedIDs[removedIndex + 1:]:
+                    self.IDToIndex[markupID] -= 1
+                return [orderedIDs[removedIndex]]
+        previousIDs = set(self.IDToIndex)
+        self.updateIndexes(fidList)
+        return [markupID for markupID in previousIDs if markupID not in self.IDToIndex]
+
+    def updateIndexes(self, fidList):
+        # full rebuild, only needed when markups were added or removed without our observers
+        self.IDToIndex = {fidList.GetNthMarkupID(n): n for n in range(fidList.GetNumberOfMarkups())}
+        self.labelToID = {landmarkState.landmarkLabel: markupID
+                          for markupID, landmarkState in self.landmarks.iteritems() if markupID in self.IDToIndex}
+
+    def getMovedMarkupIDs(self, fidList, coords):
+        # markups whose position in coords (N,3) differs from the one given to setPositions,
+        # and the markups added since, in the order of the markups
+        self.checkIndexes(fidList)
+        movedMarkupIDs = list()
+        for markupID, index in sorted(self.IDToIndex.iteritems(), key = lambda item: item[1]):
+            if markupID in self.landmarks and not numpy.array_equal(self.positions.get(markupID), coords[index]):
+                movedMarkupIDs.append(markupID)
+        return movedMarkupIDs
+
+    def setPositions(self, fidList, coords):
+        self.positions = {fidList.GetNthMarkupID(n): coords[n].copy() for n in range(len(coords))}
+
+    def copy(self):
+        landmarkDescription = LandmarkDescription()
+        for markupID, landmarkState in self.landmarks.iteritems():
+            landmarkDescription[markupID] = landmarkState.copy()
+        return landmarkDescription
+
+    def toJSON(self):
+        # same format as ShapeQuantifierCore.encodeJSON
+        landmarkDict = {markupID: landmarkState.toDict() for markupID, landmarkState in self.landmarks.iteritems()}
+        return json.dumps(landmarkDict).replace('\"', '\'')
+
+    @staticmethod
+    def fromJSON(input):
+        landmarkDescription = LandmarkDescription()
+        landmarkDict = json.loads(input.replace('\'', '\"'), object_hook = LandmarkDescription.byteifyDict)
+        for markupID, value in landmarkDict.iteritems():
+            landmarkDescription[markupID] = LandmarkState.fromDict(value)
+        return landmarkDescription
+
+    @staticmethod
+    def byteifyDict(input):
+        byteify = lambda value: value.encode('utf-8') if isinstance(value, unicode) else value
+        return {byteify(key): [byteify(element) for element in value] if isinstance(value, list) else byteify(value)
+                for key, value in input.iteritems()}
+
+
+class LandmarkDescriptionRegistry(object):
+    # LandmarkDescription of every fiducial list of the scene, stored by node ID.
+    # A description is read from the attribute of the fiducial list the first time it is needed
+    # (scene loaded from a file) and all the descriptions are written back when the scene is saved.
+
+    def __init__(self):
+        self.landmarkDescriptions = dict()
+        # observers keeping the labels of the descriptions up to date
+        self.labelObserverTags = dict()
+        slicer.mrmlScene.AddObserver(slicer.mrmlScene.StartSaveEvent, self.onStartSaveScene)
+        slicer.mrmlScene.AddObserver(slicer.mrmlScene.NodeRemovedEvent, self.onNodeRemoved)
+        slicer.mrmlScene.AddObserver(slicer.mrmlScene.EndCloseEvent, self.onCloseScene)
+
+    def get(self, fidList):
+        landmarkDescription = self.landmarkDescriptions.get(fidList.GetID())
+        if landmarkDescription is None:
+            attribute = fidList.GetAttribute("landmarkDescription")
+            if not attribute:
+                return None
+            landmarkDescription = LandmarkDescription.fromJSON(attribute)
+            self.set(fidList, landmarkDescription)
+        return landmarkDescription
+
+    def set(self, fidList, landmarkDescription):
+        self.landmarkDescriptions[fidList.GetID()] = landmarkDescription
+        landmarkDescription.updateIndexes(fidList)
+        if fidList.GetID() not in self.labelObserverTags:
+            self.labelObserverTags[fidList.GetID()] = \
+                fidList.AddObserver(fidList.NthMarkupModifiedEvent, self.onNthMarkupModified)
+
+    def save(self, fidList):
+        landmarkDescription = self.landmarkDescriptions.get(fidList.GetID())
+        if landmarkDescription is not None:
+            fidList.SetAttribute("landmarkDescription", landmarkDescription.toJSON())
+
+    def saveAll(self):
+        for fidListID in self.landmarkDescriptions.keys():
+            fidList = slicer.mrmlScene.GetNodeByID(fidListID)
+            if fidList:
+                self.save(fidList)
+
+    def onStartSaveScene(self, obj, event):
+        self.saveAll()
+
+    @vtk.calldata_type(vtk.VTK_INT)
+    def onNthMarkupModified(self, obj, event, n):
+        # the label of a markup may have changed
+        landmarkDescription = self.landmarkDescriptions.get(obj.GetID())
+        if landmarkDescription is None:
+            return
+        markupID = obj.GetNthMarkupID(n)
+        if markupID in landmarkDescription:
+            landmarkLabel = obj.GetNthMarkupLabel(n)
+            if landmarkDescription[markupID].landmarkLabel != landmarkLabel:
+                landmarkDescription.setLabel(markupID, landmarkLabel)
+
+    @vtk.calldata_type(vtk.VTK_OBJECT)
+    def onNodeRemoved(self, obj, event, node):
+        if isinstance(node, slicer.vtkMRMLMarkupsFiducialNode):
+            self.landmarkDescriptions.pop(node.GetID(), None)
+            tag = self.labelObserverTags.pop(node.GetID(), None)
+            if tag is not None:
+                node.RemoveObserver(tag)
+
+    def onCloseScene(self, obj, event):
+        self.landmarkDescriptions.clear()
+        self.labelObserverTags.clear()
+
+
+class ObserverRegistry(object):
+    # Observers added by the DCBIA modules on the nodes of the scene, one per (node, event, module).
+    # Adding an observer for a key already registered replaces the previous one, this way
+    # reconnecting a node never accumulates observers. An observer can be suspended: it stays
+    # attached to the node but its callback is not called until it is resumed.
+    # The module of an observer is the name of the module owning it, the observers shared by all
+    # the modules (landmarks processing) are registered under "ShapeQuantifierCore".
+    # The modules can also register one callback called with each node removed from the scene.
+
+    class ObserverEntry(object):
+        def __init__(self, node, event, callback):
+            self.node = node
+            self.event = event
+            self.callback = callback
+            self.suspendCount = 0
+            self.tag = node.AddObserver(event, self.onEvent)
+
+        def onEvent(self, obj, event):
+            if not self.suspendCount:
+                self.callback(obj, event)
+
+    def __init__(self):
+        # (node ID, event, module) -> ObserverEntry
+        self.entries = dict()
+        # module -> callback(node)
+        self.nodeRemovedCallbacks = dict()
+        slicer.mrmlScene.AddObserver(slicer.mrmlScene.NodeRemovedEvent, self.onNodeRemoved)
+        slicer.mrmlScene.AddObserver(slicer.mrmlScene.EndCloseEvent, self.onCloseScene)
+
+    def add(self, node, event, callback, module):
+        self.remove(node, event, module)
+        self.entries[(node.GetID(), event, module)] = self.ObserverEntry(node, event, callback)
+
+    def remove(self, node, event, module):
+        entry = self.entries.pop((node.GetID(), event, module), None)
+        if entry:
+            entry.node.RemoveObserver(entry.tag)
+
+    def removeAll(self, node, module = None):
+        # remove the observers of node registered by module (by all the modules if module is None)
+        for key in self.entries.keys():
+            if key[0] == node.GetID() and (module is None or key[2] == module):
+                entry = self.entries.pop(key)
+                entry.node.RemoveObserver(entry.tag)
+
+    def setNodeRemovedCallback(self, module, callback):
+        # the callback of a module replaces the previous one (e.g. after a reload of the module)
+        self.nodeRemovedCallbacks[module] = callback
+
+    def has(self, node, event, module):
+        return (node.GetID(), event, module) in self.entries
+
+    def suspend(self, node, event, module):
+        entry = self.entries.get((node.GetID(), event, module))
+        if entry:
+            entry.suspendCount += 1
+
+    def resume(self, node, event, module):
+        entry = self.entries.get((node.GetID(), event, module))
+        if entry and entry.suspendCount:
+            entry.suspendCount -= 1
+
+    def isSuspended(self, node, event, module):
+        entry = self.entries.get((node.GetID(), event, module))
+        return bool(entry and entry.suspendCount)
+
+    def getLeakedObservers(self):
+        # keys of the observers whose node is not in the scene anymore
+        leakedObservers = list()
+        for key, entry in self.entries.iteritems():
+            if entry.node.GetScene() is None or slicer.mrmlScene.GetNodeByID(key[0]) is not entry.node:
+                leakedObservers.append(key)
+        return leakedObservers
+
+    def reportLeakedObservers(self):
+        leakedObservers = self.getLeakedObservers()
+        for nodeID, event, module in leakedObservers:
+            logging.debug("Observer leaked: node " + str(nodeID) + ", event " + str(event) + ", module " + str(module))
+        return leakedObservers
+
+    @vtk.calldata_type(vtk.VTK_OBJECT)
+    def onNodeRemoved(self, obj, event, node):
+        self.removeAll(node)
+        for callback in self.nodeRemovedCallbacks.values():
+            callback(node)
+
+    def onCloseScene(self, obj, event):
+        self.reportLeakedObservers()
+        for entry in self.entries.values():
+            entry.node.RemoveObserver(entry.tag)
+        self.entries.clear()
+
+
+class ConnectedModelIndex(object):
+    # Fiducial lists connected to each model of the scene (reverse of the attribute "connectedModelID").
+    # The attribute has to be changed through connect() and disconnect(), the fiducial lists loaded
+    # with a scene are indexed when they are added.
+
+    def __init__(self):
+        # model ID -> set of fiducial list IDs
+        self.fidListIDs = dict()
+        # fiducial list ID -> model ID
+        self.modelIDs = dict()
+        fidLists = slicer.mrmlScene.GetNodesByClass("vtkMRMLMarkupsFiducialNode")
+        for i in range(fidLists.GetNumberOfItems()):
+            self.index(fidLists.GetItemAsObject(i))
+        slicer.mrmlScene.AddObserver(slicer.mrmlScene.NodeAddedEvent, self.onNodeAdded)
+        slicer.mrmlScene.AddObserver(slicer.mrmlScene.NodeRemovedEvent, self.onNodeRemoved)
+        slicer.mrmlScene.AddObserver(slicer.mrmlScene.EndCloseEvent, self.onCloseScene)
+
+    def index(self, fidList):
+        self.remove(fidList.GetID())
+        modelID = fidList.GetAttribute("connectedModelID")
+        if modelID:
+            self.modelIDs[fidList.GetID()] = modelID
+            self.fidListIDs.setdefault(modelID, set()).add(fidList.GetID())
+
+    def remove(self, fidListID):
+        modelID = self.modelIDs.pop(fidListID, None)
+        if modelID is not None:
+            self.fidListIDs[modelID].discard(fidListID)
+            if not self.fidListIDs[modelID]:
+                del self.fidListIDs[modelID]
+
+    def connect(self, fidList, modelID):
+        fidList.SetAttribute("connectedModelID", modelID)
+        self.index(fidList)
+
+    def disconnect(self, fidList):
+        fidList.SetAttribute("connectedModelID", None)
+        self.remove(fidList.GetID())
+
+    def getFiducialLists(self, modelID):
+        fidLists = list()
+        for fidListID in sorted(self.fidListIDs.get(modelID, ())):
+            fidList = slicer.mrmlScene.GetNodeByID(fidListID)
+            if fidList:
+                fidLists.append(fidList)
+        return fidLists
+
+    @vtk.calldata_type(vtk.VTK_OBJECT)
+    def onNodeAdded(self, obj, event, node):
+        if isinstance(node, slicer.vtkMRMLMarkupsFiducialNode):
+            self.index(node)
+
+    @vtk.calldata_type(vtk.VTK_OBJECT)
+    def onNodeRemoved(self, obj, event, node):
+        if isinstance(node, slicer.vtkMRMLMarkupsFiducialNode):
+            self.remove(node.GetID())
+        elif isinstance(node, slicer.vtkMRMLModelNode):
+            for fidListID in self.fidListIDs.pop(node.GetID(), ()):
+                self.modelIDs.pop(fidListID, None)
+
+    def onCloseScene(self, obj, event):
+        self.fidListIDs.clear()
+        self.modelIDs.clear()
+
+
+def getTransformKey(model):
+    # identify the state of all the parent transforms of a model
+    transformKey = list()
+    transformNode = model.GetParentTransformNode()
+    while transformNode:
+        transformKey.append((transformNode.GetID(), transformNode.GetMTime(),
+                             transformNode.GetTransformToParent().GetMTime()))
+        transformNode = transformNode.GetParentTransformNode()
+    return tuple(transformKey)
+
+
+class HardenModelCache(object):
+    # The harden copy of a model is rebuilt only when the points or the cells of the model or
+    # one of its parent transforms have been modified. Linear transforms are applied on the points
+    # with NumPy, the copy shares the cells and the point data of the model.
+
+    def __init__(self):
+        # model ID -> (harden model ID, polydata of the model, key of the harden copy)
+        self.entries = dict()
+
+    def getKey(self, model):
+        # the point data is shared with the copy, modifying it does not make the copy out of date
+        return getGeometryKey(model.GetPolyData()), getTransformKey(model)
+
+    def get(self, model):
+        # return the harden model if it is up to date, None otherwise
+        entry = self.entries.get(model.GetID())
+        if entry is None:
+            return None
+        hardenModelID, polyData, key = entry
+        hardenModel = slicer.mrmlScene.GetNodeByID(hardenModelID)
+        if hardenModel is None or polyData is not model.GetPolyData() or key != self.getKey(model):
+            return None
+        return hardenModel
+
+    def set(self, model, hardenModel):
+        self.entries[model.GetID()] = (hardenModel.GetID(), model.GetPolyData(), self.getKey(model))
+
+    def clear(self):
+        self.entries.clear()
+
+    def onCloseScene(self, obj, event):
+        self.clear()
+
+
+class BoundsCache(object):
+    # Bounds of the models in world coordinates, kept until the points or the cells or a parent
+    # transform of the model are modified
+
+    def __init__(self):
+        # model ID -> (polydata of the model, key, bounds)
+        self.entries = dict()
+
+    def get(self, model, builder):
+        polyData = model.GetPolyData()
+        key = (getGeometryKey(polyData), getTransformKey(model))
+        entry = self.entries.get(model.GetID())
+        if entry and entry[0] is polyData and entry[1] == key:
+            return entry[2]
+        bounds = builder(model)
+        self.entries[model.GetID()] = (polyData, key, bounds)
+        return bounds
+
+    def clear(self):
+        self.entries.clear()
+
+    def onCloseScene(self, obj, event):
+        self.clear()
+
+
+class CoalescingTimer(object):
+    # Collapse a burst of schedule(node) into a single callback(node) per node, called at most
+    # latency ms after the first call of the burst. Nothing is queued: the callback works on the
+    # latest state of the node, and the GUI thread never waits.
+    # This is a throttle, not a debounce: the timer is not restarted by the following calls, so a
+    # continuous burst is processed every latency ms instead of only once it stops.
+    # cancel(node) has to be called when a node is removed from the scene.
+
+    def __init__(self, callback, latency):
+        self.callback = callback
+        self.pendingNodes = collections.OrderedDict()
+        self.timer = qt.QTimer()
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(latency)
+        self.timer.connect('timeout()', self.flush)
+
+    def setLatency(self, latency):
+        self.timer.setInterval(latency)
+
+    def getLatency(self):
+        return self.timer.interval
+
+    def schedule(self, node):
+        self.pendingNodes[node.GetID()] = node
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def cancel(self, node):
+        self.pendingNodes.pop(node.GetID(), None)
+        if not self.pendingNodes:
+            self.timer.stop()
+
+    def flush(self):
+        self.timer.stop()
+        while self.pendingNodes:
+            nodeID, node = self.pendingNodes.popitem(last = False)
+            self.callback(node)
+
+
+class WidgetIndex(object):
+    # objectName -> object of a widget tree (widgets and layouts), built by a single walk of
+    # the tree. The index is dropped when one of its objects is destroyed. A name not found is
+    # searched once more in a new walk, since widgets can be added to the tree after the setup(),
+    # then the miss is kept until the index is dropped: invalidate() has to be called when a
+    # widget looked up before being added to the tree is added.
+
+    def __init__(self, root):
+        self.root = root
+        self.objects = None
+        # names not found in the tree since the index was built
+        self.missingNames = set()
+
+    def build(self):
+        self.objects = dict()
+        # same order as the recursive search: the first object with a name is kept
+        stack = [self.root]
+        while stack:
+            obj = stack.pop()
+            if obj.objectName and obj.objectName not in self.objects:
+                self.objects[obj.objectName] = obj
+                obj.connect('destroyed()', self.invalidate)
+            stack.extend(reversed(obj.children()))
+
+    def invalidate(self):
+        self.missingNames = set()
+        if self.objects is None:
+            return
+        objects = self.objects
+        self.objects = None
+        for obj in objects.itervalues():
+            obj.disconnect('destroyed()', self.invalidate)
+
+    def get(self, objectName):
+        if self.objects is None:
+            self.build()
+        obj = self.objects.get(objectName)
+        if obj is None and objectName not in self.missingNames:
+            # the other misses are kept if the new walk does not find them either
+            missingNames = self.missingNames
+            self.invalidate()
+            self.build()
+            self.missingNames = set(name for name in missingNames if name not in self.objects)
+            obj = self.objects.get(objectName)
+            if obj is None:
+                self.missingNames.add(objectName)
+        return obj
+
+
+# The caches and the landmark descriptions are created only once and kept through
+# the reload() of this module, this way all the DCBIA modules share them
+try:
+    pointLocatorCache
+except NameError:
+    pointLocatorCache = PolyDataCache(memoryBudget = 512 * 1024 * 1024)
+    slicer.mrmlScene.AddObserver(slicer.mrmlScene.EndCloseEvent, pointLocatorCache.onCloseScene)
+try:
+    landmarkDescriptionRegistry
+except NameError:
+    landmarkDescriptionRegistry = LandmarkDescriptionRegistry()
+try:
+    observerRegistry
+except NameError:
+    observerRegistry = ObserverRegistry()
+try:
+    connectedModelIndex
+except NameError:
+    connectedModelIndex = ConnectedModelIndex()
+try:
+    adjacencyCache
+except NameError:
+    adjacencyCache = PolyDataCache(memoryBudget = 512 * 1024 * 1024)
+    slicer.mrmlScene.AddObserver(slicer.mrmlScene.EndCloseEvent, adjacencyCache.onCloseScene)
+try:
+    kdTreeCache
+except NameError:
+    kdTreeCache = PolyDataCache(memoryBudget = 512 * 1024 * 1024)
+    slicer.mrmlScene.AddObserver(slicer.mrmlScene.EndCloseEvent, kdTreeCache.onCloseScene)
+try:
+    hardenModelCache
+except NameError:
+    hardenModelCache = HardenModelCache()
+    slicer.mrmlScene.AddObserver(slicer.mrmlScene.EndCloseEvent, hardenModelCache.onCloseScene)
+try:
+    boundsCache
+except NameError:
+    boundsCache = BoundsCache()
+    slicer.mrmlScene.AddObserver(slicer.mrmlScene.EndCloseEvent, boundsCache.onCloseScene)
+
 
 class ShapeQuantifierCore():
+    pointModifiedLatency = 50
 
     def __init__(self, parent = None, interface = None):
 
@@ -20,9 +674,22 @@ class ShapeQuantifierCore():
         self.selectedFidList = None
         self.selectedModel = None
         self.interface = interface
+        # the PointModified events of a fiducial list are processed at most pointModifiedLatency ms later
+        self.pointModifiedTimer = CoalescingTimer(self.processPointModified, self.pointModifiedLatency)
+        # a fiducial list removed before the timer fires is not processed
+        if interface:
+            observerRegistry.setNodeRemovedCallback(interface.moduleName, self.pointModifiedTimer.cancel)
+        # fiducial list ID -> depth of the nested batchModify
+        self.batchDepths = dict()
+        # index of the widgets of the interface, built at the first get()
+        self.widgetIndex = None
 
     def get(self, objectName):
-        return self.findWidget(self.interface.widget, objectName)
+        if self.widgetIndex is None or self.widgetIndex.root is not self.interface.widget:
+            if self.widgetIndex:
+                self.widgetIndex.invalidate()
+            self.widgetIndex = WidgetIndex(self.interface.widget)
+        return self.widgetIndex.get(objectName)
 
     def findWidget(self, widget, objectName):
         if widget.objectName == objectName:
@@ -48,9 +715,9 @@ class ShapeQuantifierCore():
         selectedFidReflID = self.findIDFromLabel(active,landmarkLabel)
         for i in range(0,end):
             fidList = list.GetItemAsObject(i)
-            landmarkDescription = self.decodeJSON(fidList.GetAttribute("landmarkDescription"))
+            landmarkDescription = self.getLandmarkDescription(fidList)
             for key in landmarkDescription.iterkeys():
-                markupsIndex = fidList.GetMarkupIndexByID(key)
+                markupsIndex = self.getMarkupIndex(fidList, key)
                 if key != selectedFidReflID:
                     fidList.SetNthMarkupLocked(markupsIndex, True)
                 else:
@@ -61,47 +728,111 @@ class ShapeQuantifierCore():
             displayNode.SetScalarVisibility(True)
 
     def createIntermediateHardenModel(self, model):
+        # the harden copy is reused as long as the model and its transforms are not modified
+        hardenModel = hardenModelCache.get(model)
+        if hardenModel:
+            return hardenModel
         hardenModel = slicer.mrmlScene.GetNodesByName("SurfaceRegistration_" + model.GetName() + "_hardenCopy_" + str(
             slicer.app.applicationPid())).GetItemAsObject(0)
         if hardenModel is None:
             hardenModel = slicer.vtkMRMLModelNode()
-        hardenPolyData = vtk.vtkPolyData()
-        hardenPolyData.DeepCopy(model.GetPolyData())
-        hardenModel.SetAndObservePolyData(hardenPolyData)
+        elif hardenModel.GetPolyData():
+            # the search structures of the previous copy would keep it alive
+            self.releasePolyData(hardenModel.GetPolyData())
+        transformNode = model.GetParentTransformNode()
+        if transformNode is None or transformNode.IsTransformToWorldLinear():
+            hardenModel.SetAndObserveTransformNodeID(None)
+            hardenModel.SetAndObservePolyData(self.applyLinearTransform(model.GetPolyData(), transformNode))
+        else:
+            # non linear transforms are hardened by Slicer on a full copy
+            hardenPolyData = vtk.vtkPolyData()
+            hardenPolyData.DeepCopy(model.GetPolyData())
+            hardenModel.SetAndObservePolyData(hardenPolyData)
+            hardenModel.SetAndObserveTransformNodeID(transformNode.GetID())
         hardenModel.SetName(
             "SurfaceRegistration_" + model.GetName() + "_hardenCopy_" + str(slicer.app.applicationPid()))
-        if model.GetParentTransformNode():
-            hardenModel.SetAndObserveTransformNodeID(model.GetParentTransformNode().GetID())
         hardenModel.HideFromEditorsOn()
         slicer.mrmlScene.AddNode(hardenModel)
-        logic = slicer.vtkSlicerTransformLogic()
-        logic.hardenTransform(hardenModel)
+        if hardenModel.GetParentTransformNode():
+            logic = slicer.vtkSlicerTransformLogic()
+            logic.hardenTransform(hardenModel)
+        hardenModelCache.set(model, hardenModel)
         return hardenModel
 
+    def releasePolyData(self, polyData):
+        # drop the cached search structures built on polyData
+        for cache in (pointLocatorCache, kdTreeCache, adjacencyCache):
+            cache.remove(polyData)
+
+    def computeTransformedBounds(self, model):
+        polyData = model.GetPolyData()
+        transformNode = model.GetParentTransformNode()
+        if transformNode is None:
+            return polyData.GetBounds()
+        if not transformNode.IsTransformToWorldLinear():
+            return self.createIntermediateHardenModel(model).GetPolyData().GetBounds()
+        # the 8 corners of the local bounding box are transformed, the mesh is not copied
+        localBounds = polyData.GetBounds()
+        matrix = vtk.vtkMatrix4x4()
+        transformNode.GetMatrixTransformToWorld(matrix)
+        matrix = numpy.array([[matrix.GetElement(i, j) for j in range(4)] for i in range(4)])
+        corners = numpy.array([[x, y, z] for x in localBounds[0:2] for y in localBounds[2:4] for z in localBounds[4:6]])
+        corners = corners.dot(matrix[:3, :3].T) + matrix[:3, 3]
+        minimum = corners.min(axis = 0)
+        maximum = corners.max(axis = 0)
+        return (minimum[0], maximum[0], minimum[1], maximum[1], minimum[2], maximum[2])
+
+    def getTransformedBounds(self, model):
+        # bounds of the model in world coordinates, None if the model has no point
+        polyData = model.GetPolyData()
+        if polyData is None or polyData.GetNumberOfPoints() == 0:
+            return None
+        return boundsCache.get(model, self.computeTransformedBounds)
+
+    def applyLinearTransform(self, polyData, transformNode):
+        # new polydata sharing the cells and the point data of polyData, with transformed points and normals
+        hardenPolyData = vtk.vtkPolyData()
+        hardenPolyData.ShallowCopy(polyData)
+        if transformNode is None or polyData.GetPoints() is None:
+            return hardenPolyData
+        matrix = vtk.vtkMatrix4x4()
+        transformNode.GetMatrixTransformToWorld(matrix)
+        matrix = numpy.array([[matrix.GetElement(i, j) for j in range(4)] for i in range(4)])
+        points = numpy_support.vtk_to_numpy(polyData.GetPoints().GetData())
+        transformedPoints = vtk.vtkPoints()
+        transformedPoints.SetData(numpy_support.numpy_to_vtk(points.dot(matrix[:3, :3].T) + matrix[:3, 3], deep = 1))
+        hardenPolyData.SetPoints(transformedPoints)
+        normals = polyData.GetPointData().GetNormals()
+        if normals:
+            # normals are transformed by the inverse transpose of the linear part
+            transformedNormals = numpy_support.vtk_to_numpy(normals).dot(numpy.linalg.inv(matrix[:3, :3]))
+            norms = numpy.linalg.norm(transformedNormals, axis = 1)
+            norms[norms == 0] = 1
+            transformedNormals /= norms[:, numpy.newaxis]
+            normalsArray = numpy_support.numpy_to_vtk(transformedNormals, deep = 1)
+            normalsArray.SetName(normals.GetName())
+            # the point data of the copy is a different object, the normals of polyData are kept
+            hardenPolyData.GetPointData().SetNormals(normalsArray)
+        return hardenPolyData
+
     def onModelModified(self, obj, event):
         #recompute the harden model
         hardenModel = self.createIntermediateHardenModel(obj)
         obj.SetAttribute("hardenModelID",hardenModel.GetID())
-        # for each fiducial list
-        list = slicer.mrmlScene.GetNodesByClass("vtkMRMLMarkupsFiducialNode")
-        end = list.GetNumberOfItems()
-        for i in range(0,end):
-            # If landmarks are projected on the modified model
-            fidList = list.GetItemAsObject(i)
-            if fidList.GetAttribute("connectedModelID"):
-                if fidList.GetAttribute("connectedModelID") == obj.GetID():
-                    #replace the harden model with the new one
-                    fidList.SetAttribute("hardenModelID",hardenModel.GetID())
-                    #reproject the fiducials on the new model
-                    landmarkDescription = self.decodeJSON(fidList.GetAttribute("landmarkDescription"))
-                    for n in range(fidList.GetNumberOfMarkups()):
-                        markupID = fidList.GetNthMarkupID(n)
-                        if landmarkDescription[markupID]["projection"]["isProjected"] == True:
-                            hardenModel = slicer.app.mrmlScene().GetNodeByID(fidList.GetAttribute("hardenModelID"))
-                            markupsIndex = fidList.GetMarkupIndexByID(markupID)
-                            self.replaceLandmark(hardenModel.GetPolyData(), fidList, markupsIndex,
-                                                 landmarkDescription[markupID]["projection"]["closestPointIndex"])
-                        fidList.SetAttribute("landmarkDescription",self.encodeJSON(landmarkDescription))
+        # for each fiducial list connected to the modified model
+        for fidList in self.getConnectedFiducialLists(obj):
+            with self.batchModify(fidList) as landmarkDescription:
+                #replace the harden model with the new one
+                fidList.SetAttribute("hardenModelID",hardenModel.GetID())
+                #reproject the fiducials on the new model
+                markupIDs = list()
+                closestPointIndexes = list()
+                for n in range(fidList.GetNumberOfMarkups()):
+                    markupID = fidList.GetNthMarkupID(n)
+                    if landmarkDescription[markupID].isProjected:
+                        markupIDs.append(markupID)
+                        closestPointIndexes.append(landmarkDescription[markupID].closestPointIndex)
+                self.replaceAllLandmarks(hardenModel.GetPolyData(), fidList, markupIDs, closestPointIndexes)
 
     def ModelChanged(self, inputModelSelector, inputLandmarksSelector):
         inputModel = inputModelSelector.currentNode()
@@ -110,8 +841,7 @@ class ShapeQuantifierCore():
             self.selectedModel = inputModel
             hardenModel = self.createIntermediateHardenModel(inputModel)
             inputModel.SetAttribute("hardenModelID",hardenModel.GetID())
-            modelModifieTagEvent = inputModel.AddObserver(inputModel.TransformModifiedEvent, self.onModelModified)
-            inputModel.SetAttribute("modelModifieTagEvent",self.encodeJSON({'modelModifieTagEvent':modelModifieTagEvent}))
+            self.addObserver(inputModel, inputModel.TransformModifiedEvent, self.onModelModified)
             inputLandmarksSelector.setEnabled(True)
         # if no model is selected
         else:
@@ -163,52 +893,51 @@ class ShapeQuantifierCore():
             return False
 
     def createNewDataStructure(self,landmarks, model, onSurface):
-        landmarks.SetAttribute("connectedModelID",model.GetID())
-        landmarks.SetAttribute("hardenModelID",model.GetAttribute("hardenModelID"))
-        landmarkDescription = dict()
-        for n in range(landmarks.GetNumberOfMarkups()):
-            markupID = landmarks.GetNthMarkupID(n)
-            landmarkDescription[markupID] = dict()
-            landmarkLabel = landmarks.GetNthMarkupLabel(n)
-            landmarkDescription[markupID]["landmarkLabel"] = landmarkLabel
-            landmarkDescription[markupID]["ROIradius"] = 0
-            landmarkDescription[markupID]["projection"] = dict()
+        # the attributes and the positions are modified in one batch
+        with self.batchModify(landmarks):
+            self.setConnectedModel(landmarks, model)
+            landmarks.SetAttribute("hardenModelID",model.GetAttribute("hardenModelID"))
+            landmarkDescription = LandmarkDescription()
+            for n in range(landmarks.GetNumberOfMarkups()):
+                markupID = landmarks.GetNthMarkupID(n)
+                landmarkLabel = landmarks.GetNthMarkupLabel(n)
+                landmarkDescription[markupID] = LandmarkState(landmarkLabel, onSurface)
             if onSurface:
-                landmarkDescription[markupID]["projection"]["isProjected"] = True
+                # all the landmarks are projected in one pass
                 hardenModel = slicer.app.mrmlScene().GetNodeByID(landmarks.GetAttribute("hardenModelID"))
-                landmarkDescription[markupID]["projection"]["closestPointIndex"] = \
-                    self.projectOnSurface(hardenModel, landmarks, markupID)
-            else:
-                landmarkDescription[markupID]["projection"]["isProjected"] = False
-                landmarkDescription[markupID]["projection"]["closestPointIndex"] = None
-            landmarkDescription[markupID]["midPoint"] = dict()
-            landmarkDescription[markupID]["midPoint"]["definedByThisMarkup"] = list()
-            landmarkDescription[markupID]["midPoint"]["isMidPoint"] = False
-            landmarkDescription[markupID]["midPoint"]["Point1"] = None
-            landmarkDescription[markupID]["midPoint"]["Point2"] = None
-        landmarks.SetAttribute("landmarkDescription",self.encodeJSON(landmarkDescription))
-        planeDescription = dict()
-        landmarks.SetAttribute("planeDescription",self.encodeJSON(planeDescription))
-        landmarks.SetAttribute("isClean",self.encodeJSON({"isClean":False}))
-        landmarks.SetAttribute("lastTransformID",None)
-        landmarks.SetAttribute("arrayName",model.GetName() + "_ROI")
+                markupIDs = landmarkDescription.keys()
+                closestPointIndexes = self.projectAllOnSurface(hardenModel, landmarks, markupIDs)
+                for markupID, indexClosestPoint in zip(markupIDs, closestPointIndexes):
+                    landmarkDescription[markupID].closestPointIndex = indexClosestPoint
+            self.setLandmarkDescription(landmarks, landmarkDescription)
+            landmarkDescription.setPositions(landmarks, self.getLandmarkCoords(landmarks))
+            planeDescription = dict()
+            landmarks.SetAttribute("planeDescription",self.encodeJSON(planeDescription))
+            landmarks.SetAttribute("isClean",self.encodeJSON({"isClean":False}))
+            landmarks.SetAttribute("lastTransformID",None)
+            # the ID of the fiducial list keeps apart the ROIs of two lists connected to the same model
+            landmarks.SetAttribute("arrayName",model.GetName() + "_" + landmarks.GetID() + "_ROI")
 
     def changementOfConnectedModel(self,landmarks, model, onSurface):
-        landmarks.SetAttribute("connectedModelID",model.GetID())
-        landmarks.SetAttribute("hardenModelID",model.GetAttribute("hardenModelID"))
-        landmarkDescription = self.decodeJSON(landmarks.GetAttribute("landmarkDescription"))
-        for n in range(landmarks.GetNumberOfMarkups()):
-            markupID = landmarks.GetNthMarkupID(n)
-            if onSurface:
-                if landmarkDescription[markupID]["projection"]["isProjected"] == True:
-                    hardenModel = slicer.app.mrmlScene().GetNodeByID(landmarks.GetAttribute("hardenModelID"))
-                    landmarkDescription[markupID]["projection"]["closestPointIndex"] = \
-                        self.projectOnSurface(hardenModel, landmarks, markupID)
-            else:
-                landmarkDescription[markupID]["projection"]["isProjected"] = False
-                landmarkDescription[markupID]["projection"]["closestPointIndex"] = None
-            landmarks.SetAttribute("landmarkDescription",self.encodeJSON(landmarkDescription))
-        landmarks.SetAttribute("isClean",self.encodeJSON({"isClean":False}))
+        with self.batchModify(landmarks):
+            self.setConnectedModel(landmarks, model)
+            landmarks.SetAttribute("hardenModelID",model.GetAttribute("hardenModelID"))
+            landmarkDescription = self.getLandmarkDescription(landmarks)
+            markupIDs = list()
+            for n in range(landmarks.GetNumberOfMarkups()):
+                markupID = landmarks.GetNthMarkupID(n)
+                if onSurface:
+                    if landmarkDescription[markupID].isProjected:
+                        markupIDs.append(markupID)
+                else:
+                    landmarkDescription[markupID].isProjected = False
+                    landmarkDescription[markupID].closestPointIndex = None
+            if markupIDs:
+                hardenModel = slicer.app.mrmlScene().GetNodeByID(landmarks.GetAttribute("hardenModelID"))
+                closestPointIndexes = self.projectAllOnSurface(hardenModel, landmarks, markupIDs)
+                for markupID, indexClosestPoint in zip(markupIDs, closestPointIndexes):
+                    landmarkDescription[markupID].closestPointIndex = indexClosestPoint
+            landmarks.SetAttribute("isClean",self.encodeJSON({"isClean":False}))
 
     def connectLandmarks(self, modelSelector, landmarkSelector, onSurface):
         model = modelSelector.currentNode()
@@ -222,38 +951,8 @@ class ShapeQuantifierCore():
             landmarkSelector.setCurrentNode(None)
             return
         connectedModelID = landmarks.GetAttribute("connectedModelID")
-        try:
-            tag = self.decodeJSON(landmarks.GetAttribute("MarkupAddedEventTag"))
-            landmarks.RemoveObserver(tag["MarkupAddedEventTag"])
-            print "Markups adding observer removed!"
-        except:
-            pass
-        try:
-            tag = self.decodeJSON(landmarks.GetAttribute("PointModifiedEventTag"))
-            landmarks.RemoveObserver(tag["PointModifiedEventTag"])
-            print "Markups moving observer removed!"
-        except:
-            pass
-        try:
-            tag = self.decodeJSON(landmarks.GetAttribute("MarkupRemovedEventTag"))
-            landmarks.RemoveObserver(tag["MarkupRemovedEventTag"])
-            print "Markups removing observers removed!"
-        except:
-            pass
-        if self.interface.moduleName is 'AnglePlanes':
-            try:
-                tag = self.decodeJSON(landmarks.GetAttribute("UpdatesPlanesEventTag"))
-                landmarks.RemoveObserver(tag["UpdatesPlanesEventTag"])
-                print "Planes modification observers removed!"
-            except:
-                pass
-        if self.interface.moduleName is 'Q3DC':
-            try:
-                tag = self.decodeJSON(landmarks.GetAttribute("UpdatesLinesEventTag"))
-                landmarks.RemoveObserver(tag["UpdatesLinesEventTag"])
-                print "Lines modification observers removed!"
-            except:
-                pass
+        # the observers are added again at the end of the connection
+        self.removeLandmarksObservers(landmarks)
         if connectedModelID:
             if connectedModelID != model.GetID():
                 if self.connectedModelChangement():
@@ -269,152 +968,147 @@ class ShapeQuantifierCore():
         #update of the landmark Combo Box
         self.resetAllLandmarkComboboxes(landmarks)
         #adding of listeners
-        MarkupAddedEventTag = landmarks.AddObserver(landmarks.MarkupAddedEvent, self.onMarkupAddedEvent)
-        landmarks.SetAttribute("MarkupAddedEventTag",self.encodeJSON({"MarkupAddedEventTag":MarkupAddedEventTag}))
-        PointModifiedEventTag = landmarks.AddObserver(landmarks.PointModifiedEvent, self.onPointModifiedEvent)
-        landmarks.SetAttribute("PointModifiedEventTag",self.encodeJSON({"PointModifiedEventTag":PointModifiedEventTag}))
-        MarkupRemovedEventTag = landmarks.AddObserver(landmarks.MarkupRemovedEvent, self.onMarkupRemovedEvent)
-        landmarks.SetAttribute("MarkupRemovedEventTag",self.encodeJSON({"MarkupRemovedEventTag":MarkupRemovedEventTag}))
+        self.addObserver(landmarks, landmarks.MarkupAddedEvent, self.onMarkupAddedEvent)
+        self.addObserver(landmarks, landmarks.PointModifiedEvent, self.onPointModifiedEvent)
+        self.addObserver(landmarks, landmarks.MarkupRemovedEvent, self.onMarkupRemovedEvent)
         if self.interface.moduleName is 'AnglePlanes':
-            UpdatesPlanesEventTag = landmarks.AddObserver(landmarks.PointModifiedEvent, self.updatePlanesEvent)
-            landmarks.SetAttribute("UpdatesPlanesEventTag",self.encodeJSON({"UpdatesPlanesEventTag":UpdatesPlanesEventTag}))
+            self.addObserver(landmarks, landmarks.PointModifiedEvent, self.interface.updatePlanesEvent, self.interface.moduleName)
         if self.interface.moduleName is 'Q3DC':
-            UpdatesLinesEventTag = landmarks.AddObserver(landmarks.PointModifiedEvent, self.updateLinesEvent)
-            landmarks.SetAttribute("UpdatesLinesEventTag",self.encodeJSON({"UpdatesLinesEventTag":UpdatesLinesEventTag}))
+            self.addObserver(landmarks, landmarks.PointModifiedEvent, self.interface.updateLinesEvent, self.interface.moduleName)
 
     # Called when a landmark is added on a model
     def onMarkupAddedEvent(self, obj, event):
         print "------markup adding-------"
-        landmarkDescription = self.decodeJSON(obj.GetAttribute("landmarkDescription"))
+        landmarkDescription = self.getLandmarkDescription(obj)
         numOfMarkups = obj.GetNumberOfMarkups()
         markupID = obj.GetNthMarkupID(numOfMarkups - 1)
-        landmarkDescription[markupID] = dict()
         landmarkLabel = obj.GetNthMarkupLabel(numOfMarkups - 1)
-        landmarkDescription[markupID]["landmarkLabel"] = landmarkLabel
-        landmarkDescription[markupID]["ROIradius"] = 0
-        landmarkDescription[markupID]["projection"] = dict()
-        landmarkDescription[markupID]["projection"]["isProjected"] = True
-        # The landmark will be projected by onPointModifiedEvent
-        landmarkDescription[markupID]["midPoint"] = dict()
-        landmarkDescription[markupID]["midPoint"]["definedByThisMarkup"] = list()
-        landmarkDescription[markupID]["midPoint"]["isMidPoint"] = False
-        landmarkDescription[markupID]["midPoint"]["Point1"] = None
-        landmarkDescription[markupID]["midPoint"]["Point2"] = None
-        obj.SetAttribute("landmarkDescription",self.encodeJSON(landmarkDescription))
+        # The landmark will be projected by processPointModified
+        landmarkDescription[markupID] = LandmarkState(landmarkLabel, True)
+        landmarkDescription.setMarkupIndex(markupID, numOfMarkups - 1)
         self.updateAllLandmarkComboBox(obj, markupID)
         self.interface.UpdateInterface()
-        qt.QTimer.singleShot(0, lambda : self.onPointModifiedEvent(obj,None))
+        self.pointModifiedTimer.schedule(obj)
+
+    def setPointModifiedLatency(self, latency):
+        # latency in ms between a landmark move and its processing
+        self.pointModifiedTimer.setLatency(latency)
 
     def updateMidPoint(self, fidList, landmarkID):
-        landmarkDescription = self.decodeJSON(fidList.GetAttribute("landmarkDescription"))
-        for midPointID in landmarkDescription[landmarkID]["midPoint"]["definedByThisMarkup"]:
-            if landmarkDescription[midPointID]["midPoint"]["isMidPoint"]:
-                landmark1ID = landmarkDescription[midPointID]["midPoint"]["Point1"]
-                landmark2ID = landmarkDescription[midPointID]["midPoint"]["Point2"]
-                coord = self.calculateMidPointCoord(fidList, landmark1ID, landmark2ID)
-                index = fidList.GetMarkupIndexByID(midPointID)
-                fidList.SetNthFiducialPositionFromArray(index, coord)
-                if landmarkDescription[midPointID]["projection"]["isProjected"]:
-                    hardenModel = slicer.app.mrmlScene().GetNodeByID(fidList.GetAttribute("hardenModelID"))
-                    landmarkDescription[midPointID]["projection"]["closestPointIndex"] = \
-                        self.projectOnSurface(hardenModel, fidList, midPointID)
-                    fidList.SetAttribute("landmarkDescription",self.encodeJSON(landmarkDescription))
-                self.updateMidPoint(fidList, midPointID)
+        self.updateMidPoints(fidList, [landmarkID])
+
+    def updateMidPoints(self, fidList, landmarkIDs = None):
+        # move the midpoints depending on landmarkIDs, all the midpoints of the list if None
+        landmarkDescription = self.getLandmarkDescription(fidList)
+        hardenModel = slicer.app.mrmlScene().GetNodeByID(fidList.GetAttribute("hardenModelID"))
+        polyData = hardenModel.GetPolyData() if hardenModel else None
+        landmarkDescription.checkIndexes(fidList)
+        try:
+            rows, coords, closestPointIndexes = \
+                ShapeQuantifierComputation.computeMidPointUpdates(landmarkDescription, self.getLandmarkCoords(fidList),
+                                                                  landmarkDescription.IDToIndex, landmarkIDs, polyData,
+                                                                  kdTreeCache, pointLocatorCache)
+        except ValueError as error:
+            # the midpoints are left where they are instead of being moved forever, the error is
+            # logged rather than displayed since it is raised again by each move of the landmarks
+            logging.warning(str(error))
+            return
+        # all the midpoints are moved in a single modification of the fiducial list
+        with self.batchModify(fidList):
+            for row, coord, indexClosestPoint in zip(rows, coords, closestPointIndexes):
+                fidList.SetNthFiducialPositionFromArray(row, coord)
+                if indexClosestPoint is not None:
+                    landmarkDescription[fidList.GetNthMarkupID(row)].closestPointIndex = indexClosestPoint
 
     # Called when a landmarks is moved
     def onPointModifiedEvent(self, obj, event):
-        print "----onPointModifiedEvent-----"
-        landmarkDescription = self.decodeJSON(obj.GetAttribute("landmarkDescription"))
+        if self.isInBatch(obj):
+            return
+        self.pointModifiedTimer.schedule(obj)
+
+    def processPointModified(self, fidList):
+        self.pointModifiedTimer.cancel(fidList)
+        landmarkDescription = self.getLandmarkDescription(fidList)
         if not landmarkDescription:
             return
-        selectedLandmarkID = self.findIDFromLabel(obj, self.interface.landmarkComboBox.currentText)
-        # remove observer to make sure, the callback function won't work..
-        tag = self.decodeJSON(obj.GetAttribute("PointModifiedEventTag"))
-        obj.RemoveObserver(tag["PointModifiedEventTag"])
-        if selectedLandmarkID:
-            activeLandmarkState = landmarkDescription[selectedLandmarkID]
-            if activeLandmarkState["projection"]["isProjected"]:
-                hardenModel = slicer.app.mrmlScene().GetNodeByID(obj.GetAttribute("hardenModelID"))
-                activeLandmarkState["projection"]["closestPointIndex"] = \
-                    self.projectOnSurface(hardenModel, obj, selectedLandmarkID)
-                obj.SetAttribute("landmarkDescription",self.encodeJSON(landmarkDescription))
-            self.updateMidPoint(obj,selectedLandmarkID)
-            self.findROI(obj)
-        time.sleep(0.08)
-        # Add the observer again
-        PointModifiedEventTag = obj.AddObserver(obj.PointModifiedEvent, self.onPointModifiedEvent)
-        obj.SetAttribute("PointModifiedEventTag",self.encodeJSON({"PointModifiedEventTag":PointModifiedEventTag}))
+        # the landmarks to process are the ones whose position changed since the last processing,
+        # the landmarks added since are processed too
+        movedLandmarkIDs = landmarkDescription.getMovedMarkupIDs(fidList, self.getLandmarkCoords(fidList))
+        if movedLandmarkIDs:
+            self.updateLandmarks(fidList, movedLandmarkIDs)
+        landmarkDescription.setPositions(fidList, self.getLandmarkCoords(fidList))
+
+    def updateLandmark(self, fidList, landmarkID):
+        self.updateLandmarks(fidList, [landmarkID])
+
+    def updateLandmarks(self, fidList, landmarkIDs):
+        # projection of the landmarks, update of the midpoints depending on them and of the ROI
+        landmarkDescription = self.getLandmarkDescription(fidList)
+        # the events sent while the landmarks are projected are ignored
+        observerRegistry.suspend(fidList, fidList.PointModifiedEvent, "ShapeQuantifierCore")
+        try:
+            # the landmarks and the midpoints depending on them are moved in one batch
+            with self.batchModify(fidList):
+                projectedIDs = [landmarkID for landmarkID in landmarkIDs if landmarkDescription[landmarkID].isProjected]
+                if projectedIDs:
+                    hardenModel = slicer.app.mrmlScene().GetNodeByID(fidList.GetAttribute("hardenModelID"))
+                    closestPointIndexes = self.projectAllOnSurface(hardenModel, fidList, projectedIDs)
+                    for landmarkID, indexClosestPoint in zip(projectedIDs, closestPointIndexes):
+                        landmarkDescription[landmarkID].closestPointIndex = indexClosestPoint
+                self.updateMidPoints(fidList, landmarkIDs)
+            self.findROI(fidList)
+        finally:
+            observerRegistry.resume(fidList, fidList.PointModifiedEvent, "ShapeQuantifierCore")
 
     def onMarkupRemovedEvent(self, obj, event):
         print "------markup deleting-------"
-        landmarkDescription = self.decodeJSON(obj.GetAttribute("landmarkDescription"))
-        IDs = []
-        for ID, value in landmarkDescription.iteritems():
-            isFound = False
-            for n in range(obj.GetNumberOfMarkups()):
-                markupID = obj.GetNthMarkupID(n)
-                if ID == markupID:
-                    isFound = True
-            if not isFound:
-                IDs.append(ID)
+        landmarkDescription = self.getLandmarkDescription(obj)
+        if landmarkDescription is None:
+            return
+        # the indexes of the markups following the removed ones are shifted
+        for markupID in landmarkDescription.removeMarkupIndexes(obj):
+            landmarkDescription.removeLandmark(markupID)
         self.resetAllLandmarkComboboxes(obj)
-        # for ID in IDs:
-        #     self.deleteLandmark(obj, landmarkDescription[ID]["landmarkLabel"])
-        #     landmarkDescription.pop(ID,None)
-        # obj.SetAttribute("landmarkDescription",self.encodeJSON(landmarkDescription))
-
-    def updatePlanesEvent(self, obj, event):
-        for planeControls in self.interface.planeControlsDictionary.values():
-            if planeControls.fidlist is obj:
-                planeControls.update()
-
-    def updateLinesEvent(self, obj, event):
-        if self.interface.line1LAComboBox.currentText != '' and self.interface.line1LBComboBox.currentText != '' \
-                and self.interface.line1LAComboBox.currentText != self.interface.line1LBComboBox.currentText :
-            # Clear Lines, then define new ones
-            if self.interface.renderer1 :
-                self.interface.renderer1.RemoveActor(self.interface.actor1)
-            self.interface.renderer1, self.interface.actor1 = \
-                self.interface.logic.drawLineBetween2Landmark(self.interface.line1LAComboBox.currentText,
-                                              self.interface.line1LBComboBox.currentText,
-                                              self.interface.fidListComboBoxline1LA.currentNode(),
-                                              self.interface.fidListComboBoxline1LB.currentNode())
-        if self.interface.line2LAComboBox.currentText != '' and self.interface.line2LBComboBox.currentText != '' \
-                and self.interface.line2LAComboBox.currentText != self.interface.line2LBComboBox.currentText :
-            if self.interface.renderer2 :
-                self.interface.renderer2.RemoveActor(self.interface.actor2)
-            self.interface.renderer2, self.interface.actor2 = \
-                self.interface.logic.drawLineBetween2Landmark(self.interface.line2LAComboBox.currentText,
-                                              self.interface.line2LBComboBox.currentText,
-                                              self.interface.fidListComboBoxline2LA.currentNode(),
-                                              self.interface.fidListComboBoxline2LB.currentNode())
-        if self.interface.lineLAComboBox.currentText != '' and self.interface.lineLBComboBox.currentText != '' \
-                and self.interface.lineLAComboBox.currentText != self.interface.lineLBComboBox.currentText :
-            if self.interface.renderer3 :
-                self.interface.renderer3.RemoveActor(self.interface.actor3)
-            self.interface.renderer3, self.interface.actor3 = \
-                self.interface.logic.drawLineBetween2Landmark(self.interface.lineLAComboBox.currentText,
-                                              self.interface.lineLBComboBox.currentText,
-                                              self.interface.fidListComboBoxlineLA.currentNode(),
-                                              self.interface.fidListComboBoxlineLB.currentNode())
+        # the ROI of the removed landmarks is removed from the mesh
+        if slicer.mrmlScene.GetNodeByID(obj.GetAttribute("hardenModelID")) \
+                and slicer.mrmlScene.GetNodeByID(obj.GetAttribute("connectedModelID")):
+            self.findROI(obj)
 
     def findIDFromLabel(self, fidList, landmarkLabel):
         # find the ID of the markupsNode from the label of a landmark!
-        landmarkDescription = self.decodeJSON(fidList.GetAttribute("landmarkDescription"))
-        for ID, value in landmarkDescription.iteritems():
-            if value["landmarkLabel"] == landmarkLabel:
-                return ID
-        return None
+        landmarkDescription = self.getLandmarkDescription(fidList)
+        if landmarkDescription is None:
+            return None
+        return landmarkDescription.findIDFromLabel(landmarkLabel)
+
+    def getMarkupIndex(self, fidList, markupID):
+        landmarkDescription = self.getLandmarkDescription(fidList)
+        if landmarkDescription is None:
+            return fidList.GetMarkupIndexByID(markupID)
+        return landmarkDescription.getMarkupIndex(fidList, markupID)
+
+    def getPointLocator(self, polyData):
+        # The locator is built only once for each version of the mesh
+        return pointLocatorCache.get(polyData, ShapeQuantifierComputation.buildPointLocator)
+
+    def getLandmarkCoord(self, fidList, markupID):
+        landmarkCoord = [-1, -1, -1]
+        fidList.GetNthFiducialPosition(self.getMarkupIndex(fidList, markupID), landmarkCoord)
+        return landmarkCoord
+
+    def getLandmarkCoords(self, fidList):
+        # positions of all the landmarks of the list in an array (N,3), in the order of the markups
+        coords = numpy.zeros((fidList.GetNumberOfMarkups(), 3))
+        landmarkCoord = [-1, -1, -1]
+        for n in range(fidList.GetNumberOfMarkups()):
+            fidList.GetNthFiducialPosition(n, landmarkCoord)
+            coords[n] = landmarkCoord
+        return coords
 
     def getClosestPointIndex(self, fidNode, inputPolyData, landmarkID):
         landmarkCoord = numpy.zeros(3)
         fidNode.GetNthFiducialPosition(landmarkID, landmarkCoord)
-        pointLocator = vtk.vtkPointLocator()
-        pointLocator.SetDataSet(inputPolyData)
-        pointLocator.AutomaticOn()
-        pointLocator.BuildLocator()
-        indexClosestPoint = pointLocator.FindClosestPoint(landmarkCoord)
-        return indexClosestPoint
+        return ShapeQuantifierComputation.getClosestPointIndex(inputPolyData, landmarkCoord, pointLocatorCache)
 
     def replaceLandmark(self, inputModelPolyData, fidNode, landmarkID, indexClosestPoint):
         landmarkCoord = [-1, -1, -1]
@@ -423,43 +1117,54 @@ class ShapeQuantifierCore():
 
     def projectOnSurface(self, modelOnProject, fidNode, selectedFidReflID):
         if selectedFidReflID:
-            markupsIndex = fidNode.GetMarkupIndexByID(selectedFidReflID)
+            markupsIndex = self.getMarkupIndex(fidNode, selectedFidReflID)
             indexClosestPoint = self.getClosestPointIndex(fidNode, modelOnProject.GetPolyData(), markupsIndex)
             self.replaceLandmark(modelOnProject.GetPolyData(), fidNode, markupsIndex, indexClosestPoint)
             return indexClosestPoint
 
+    def getClosestPointIndexes(self, inputPolyData, coords):
+        # closest point of the mesh for each row of the array coords (N,3)
+        return ShapeQuantifierComputation.getClosestPointIndexes(inputPolyData, coords, kdTreeCache, pointLocatorCache)
+
+    def replaceAllLandmarks(self, inputModelPolyData, fidNode, markupIDs, closestPointIndexes):
+        # all the positions are set before the modified events are sent
+        with self.batchModify(fidNode):
+            for markupID, indexClosestPoint in zip(markupIDs, closestPointIndexes):
+                markupsIndex = self.getMarkupIndex(fidNode, markupID)
+                fidNode.SetNthFiducialPositionFromArray(markupsIndex, inputModelPolyData.GetPoint(indexClosestPoint))
+
+    def projectAllOnSurface(self, modelOnProject, fidNode, markupIDs):
+        # project a list of landmarks at once, return the closest point index of each landmark
+        if not markupIDs:
+            return []
+        coords = numpy.array([self.getLandmarkCoord(fidNode, markupID) for markupID in markupIDs])
+        closestPointIndexes = self.getClosestPointIndexes(modelOnProject.GetPolyData(), coords)
+        self.replaceAllLandmarks(modelOnProject.GetPolyData(), fidNode, markupIDs, closestPointIndexes)
+        return closestPointIndexes
+
     def calculateMidPointCoord(self, fidList, landmark1ID, landmark2ID):
         """Set the midpoint when you know the the mrml nodes"""
-        landmark1Index = fidList.GetMarkupIndexByID(landmark1ID)
-        landmark2Index = fidList.GetMarkupIndexByID(landmark2ID)
-        coord1 = [-1, -1, -1]
-        coord2 = [-1, -1, -1]
-        fidList.GetNthFiducialPosition(landmark1Index, coord1)
-        fidList.GetNthFiducialPosition(landmark2Index, coord2)
-        midCoord = [-1, -1, -1]
-        midCoord[0] = (coord1[0] + coord2[0])/2
-        midCoord[1] = (coord1[1] + coord2[1])/2
-        midCoord[2] = (coord1[2] + coord2[2])/2
-        return midCoord
+        return ShapeQuantifierComputation.calculateMidPointCoord(self.getLandmarkCoord(fidList, landmark1ID),
+                                                                 self.getLandmarkCoord(fidList, landmark2ID))
 
     def addLandmarkToCombox(self, fidList, combobox, markupID):
         if not fidList:
             return
-        landmarkDescription = self.decodeJSON(fidList.GetAttribute("landmarkDescription"))
-        combobox.addItem(landmarkDescription[markupID]["landmarkLabel"])
+        landmarkDescription = self.getLandmarkDescription(fidList)
+        combobox.addItem(landmarkDescription[markupID].landmarkLabel)
 
     def updateLandmarkComboBox(self, fidList, combobox, displayMidPoint = True):
         combobox.blockSignals(True)
         combobox.clear()
         if not fidList:
             return
-        landmarkDescription = self.decodeJSON(fidList.GetAttribute("landmarkDescription"))
+        landmarkDescription = self.getLandmarkDescription(fidList)
         numOfFid = fidList.GetNumberOfMarkups()
         if numOfFid > 0:
             for i in range(0, numOfFid):
                 if displayMidPoint is False:
                     ID = fidList.GetNthMarkupID(i)
-                    if not landmarkDescription[ID]["midPoint"]["isMidPoint"]:
+                    if not landmarkDescription[ID].isMidPoint:
                         landmarkLabel = fidList.GetNthMarkupLabel(i)
                         combobox.addItem(landmarkLabel)
                 else:
@@ -492,89 +1197,177 @@ class ShapeQuantifierCore():
             for combobox in comboboxesToUpdate:
                 self.updateLandmarkComboBox(fidList, combobox)
 
+    def getMeshAdjacency(self, polyData):
+        # The adjacency is computed only once for each version of the mesh
+        return adjacencyCache.get(polyData, ShapeQuantifierComputation.buildMeshAdjacency)
+
     def GetConnectedVertices(self, connectedVerticesIDList, polyData, pointID):
         # Return IDs of all the vertices that compose the first neighbor.
-        cellList = vtk.vtkIdList()
         connectedVerticesIDList.InsertUniqueId(pointID)
-        # Get cells that vertex 'pointID' belongs to
-        polyData.GetPointCells(pointID, cellList)
-        numberOfIds = cellList.GetNumberOfIds()
-        for i in range(0, numberOfIds):
-            # Get points which compose all cells
-            pointIdList = vtk.vtkIdList()
-            polyData.GetCellPoints(cellList.GetId(i), pointIdList)
-            for j in range(0, pointIdList.GetNumberOfIds()):
-                connectedVerticesIDList.InsertUniqueId(pointIdList.GetId(j))
+        for neighborID in self.getMeshAdjacency(polyData).getNeighbors(pointID).tolist():
+            connectedVerticesIDList.InsertUniqueId(neighborID)
         return connectedVerticesIDList
 
+    def getROILabelLayer(self, polyData):
+        return ROILabelLayer(polyData)
+
     def addArrayFromIdList(self, connectedIdList, inputModelNode, arrayName):
+        IDs = numpy.array([connectedIdList.GetId(i) for i in range(connectedIdList.GetNumberOfIds())], dtype = numpy.int64)
+        return self.addArrayFromIDs(IDs, inputModelNode, arrayName)
+
+    def addArrayFromIDs(self, IDs, inputModelNode, arrayName):
+        # the ROI arrayName is stored in the label layer of the mesh
         if not inputModelNode:
             return
+        try:
+            self.getROILabelLayer(inputModelNode.GetPolyData()).setROI(arrayName, IDs)
+        except ValueError as error:
+            self.warningMessage(str(error))
+            return False
+        inputModelNode.GetPolyData().Modified()
+        return True
+
+    def updateDisplayArray(self, inputModelNode, ROIName):
+        # copy the mask of the ROI in the display array of the mesh
         inputModelNodePolydata = inputModelNode.GetPolyData()
         pointData = inputModelNodePolydata.GetPointData()
-        numberofIds = connectedIdList.GetNumberOfIds()
-        hasArrayInt = pointData.HasArray(arrayName)
-        if hasArrayInt == 1:  # ROI Array found
-            pointData.RemoveArray(arrayName)
-        arrayToAdd = vtk.vtkDoubleArray()
-        arrayToAdd.SetName(arrayName)
-        for i in range(0, inputModelNodePolydata.GetNumberOfPoints()):
-            arrayToAdd.InsertNextValue(0.0)
-        for i in range(0, numberofIds):
-            arrayToAdd.SetValue(connectedIdList.GetId(i), 1.0)
+        numberOfPoints = inputModelNodePolydata.GetNumberOfPoints()
+        mask = self.getROILabelLayer(inputModelNodePolydata).getMask(ROIName)
+        if mask is None:
+            return False
+        displayArray = pointData.GetArray(ROILabelLayer.displayArrayName)
+        # the buffer of the display array is reused as long as the number of points does not change
+        if not (displayArray and displayArray.IsA("vtkUnsignedCharArray") and displayArray.GetNumberOfTuples() == numberOfPoints):
+            if displayArray:
+                pointData.RemoveArray(ROILabelLayer.displayArrayName)
+            displayArray = vtk.vtkUnsignedCharArray()
+            displayArray.SetName(ROILabelLayer.displayArrayName)
+            displayArray.SetNumberOfTuples(numberOfPoints)
+            pointData.AddArray(displayArray)
+        # NumPy view on the VTK buffer: the mask is written without copy
+        numpy_support.vtk_to_numpy(displayArray)[:] = mask
+        displayArray.Modified()
         lut = vtk.vtkLookupTable()
         tableSize = 2
         lut.SetNumberOfTableValues(tableSize)
         lut.Build()
-        ID = inputModelNode.GetDisplayNodeID()
-        slicer.app.mrmlScene().GetNodeByID(ID)
-        displayNode = slicer.app.mrmlScene().GetNodeByID(ID)
+        displayNode = inputModelNode.GetModelDisplayNode()
         rgb = displayNode.GetColor()
         lut.SetTableValue(0, rgb[0], rgb[1], rgb[2], 1)
         lut.SetTableValue(1, 1.0, 0.0, 0.0, 1)
-        arrayToAdd.SetLookupTable(lut)
-        pointData.AddArray(arrayToAdd)
-        inputModelNodePolydata.Modified()
+        displayArray.SetLookupTable(lut)
         return True
 
-    def displayROI(self, inputModelNode, scalarName):
+    def displayROI(self, inputModelNode, ROIName):
+        if not self.updateDisplayArray(inputModelNode, ROIName):
+            return
         PolyData = inputModelNode.GetPolyData()
         PolyData.Modified()
         displayNode = inputModelNode.GetModelDisplayNode()
         displayNode.SetScalarVisibility(False)
         disabledModify = displayNode.StartModify()
-        displayNode.SetActiveScalarName(scalarName)
+        displayNode.SetActiveScalarName(ROILabelLayer.displayArrayName)
         displayNode.SetScalarVisibility(True)
         displayNode.EndModify(disabledModify)
 
+    def getNeighborIDs(self, inputModelNodePolyData, indexClosestPoint, distance):
+        # IDs of the vertices at most 'distance' rings away from indexClosestPoint (at least one ring)
+        adjacency = self.getMeshAdjacency(inputModelNodePolyData)
+        return ShapeQuantifierComputation.getROINeighborIDs(adjacency, indexClosestPoint, distance, "rings")
+
+    def getGeodesicNeighborIDs(self, inputModelNodePolyData, indexClosestPoint, distance):
+        # IDs of the vertices at most 'distance' mm away from indexClosestPoint on the surface
+        adjacency = self.getMeshAdjacency(inputModelNodePolyData)
+        return ShapeQuantifierComputation.getROINeighborIDs(adjacency, indexClosestPoint, distance, "geodesic")
+
+    def getROINeighborIDs(self, fidList, inputModelNodePolyData, indexClosestPoint, distance):
+        # The ROI radius of the landmarks of fidList is either a number of rings or a distance in mm
+        adjacency = self.getMeshAdjacency(inputModelNodePolyData)
+        return ShapeQuantifierComputation.getROINeighborIDs(adjacency, indexClosestPoint, distance,
+                                                            fidList.GetAttribute("ROIMode"))
+
     def defineNeighbor(self, connectedVerticesList, inputModelNodePolyData, indexClosestPoint, distance):
-        self.GetConnectedVertices(connectedVerticesList, inputModelNodePolyData, indexClosestPoint)
-        if distance > 1:
-            for dist in range(1, int(distance)):
-                for i in range(0, connectedVerticesList.GetNumberOfIds()):
-                    self.GetConnectedVertices(connectedVerticesList, inputModelNodePolyData,
-                                              connectedVerticesList.GetId(i))
+        for ID in self.getNeighborIDs(inputModelNodePolyData, indexClosestPoint, distance).tolist():
+            connectedVerticesList.InsertNextId(ID)
         return connectedVerticesList
 
     def findROI(self, fidList):
         hardenModel = slicer.app.mrmlScene().GetNodeByID(fidList.GetAttribute("hardenModelID"))
         connectedModel = slicer.app.mrmlScene().GetNodeByID(fidList.GetAttribute("connectedModelID"))
-        landmarkDescription = self.decodeJSON(fidList.GetAttribute("landmarkDescription"))
+        landmarkDescription = self.getLandmarkDescription(fidList)
         arrayName = fidList.GetAttribute("arrayName")
-        ROIPointListID = vtk.vtkIdList()
-        for key,activeLandmarkState in landmarkDescription.iteritems():
-            tempROIPointListID = vtk.vtkIdList()
-            if activeLandmarkState["ROIradius"] != 0:
-                self.defineNeighbor(tempROIPointListID,
-                                    hardenModel.GetPolyData(),
-                                    activeLandmarkState["projection"]["closestPointIndex"],
-                                    activeLandmarkState["ROIradius"])
-            for j in range(0, tempROIPointListID.GetNumberOfIds()):
-                ROIPointListID.InsertUniqueId(tempROIPointListID.GetId(j))
-        listID = ROIPointListID
-        self.addArrayFromIdList(listID, connectedModel, arrayName)
+        polyData = hardenModel.GetPolyData()
+        mode = fidList.GetAttribute("ROIMode")
+        currentROIState = landmarkDescription.ROIState
+        isNewState = currentROIState is None or not currentROIState.isValid(polyData, mode)
+        if isNewState:
+            currentROIState = ROIState(polyData, mode)
+            landmarkDescription.ROIState = currentROIState
+        # only the ROIs of the landmarks that moved or whose radius changed are computed
+        changedIDs = currentROIState.update(landmarkDescription,
+                                            lambda index, radius: self.getROINeighborIDs(fidList, polyData, index, radius))
+        labelLayer = self.getROILabelLayer(connectedModel.GetPolyData())
+        if not isNewState and labelLayer.hasROI(arrayName):
+            # only the labels of the vertices entering or leaving the ROI are patched
+            labelLayer.patchROI(arrayName, changedIDs, currentROIState.counts[changedIDs] > 0)
+        else:
+            self.addArrayFromIDs(currentROIState.getROIIDs(), connectedModel, arrayName)
         self.displayROI(connectedModel, arrayName)
-        return ROIPointListID
+
+    def addObserver(self, node, event, callback, module = "ShapeQuantifierCore"):
+        # The observers shared by all the modules are replaced by the ones of the module connecting
+        # the node last. The module specific ones are registered with the name of the module.
+        observerRegistry.add(node, event, callback, module)
+
+    def removeObserver(self, node, event, module = "ShapeQuantifierCore"):
+        observerRegistry.remove(node, event, module)
+
+    def removeLandmarksObservers(self, landmarks):
+        self.removeObserver(landmarks, landmarks.MarkupAddedEvent)
+        self.removeObserver(landmarks, landmarks.PointModifiedEvent)
+        self.removeObserver(landmarks, landmarks.MarkupRemovedEvent)
+        self.removeObserver(landmarks, landmarks.PointModifiedEvent, self.interface.moduleName)
+
+    @contextlib.contextmanager
+    def batchModify(self, fidList):
+        # with self.batchModify(fidList): ...
+        # The modified events of fidList (attributes, positions) are held until the end of the
+        # batch and sent once, and the landmark moves are not processed one by one. Batches can
+        # be nested, the events are sent at the end of the outermost one.
+        fidListID = fidList.GetID()
+        disabledModify = fidList.StartModify()
+        self.batchDepths[fidListID] = self.batchDepths.get(fidListID, 0) + 1
+        try:
+            yield self.getLandmarkDescription(fidList)
+        finally:
+            self.batchDepths[fidListID] -= 1
+            if not self.batchDepths[fidListID]:
+                del self.batchDepths[fidListID]
+            fidList.EndModify(disabledModify)
+
+    def isInBatch(self, fidList):
+        return fidList.GetID() in self.batchDepths
+
+    def setConnectedModel(self, fidList, model):
+        # keep the model -> fiducial lists index up to date with the attribute "connectedModelID"
+        if model:
+            connectedModelIndex.connect(fidList, model.GetID())
+        else:
+            connectedModelIndex.disconnect(fidList)
+
+    def getConnectedFiducialLists(self, model):
+        return connectedModelIndex.getFiducialLists(model.GetID())
+
+    def getLandmarkDescription(self, fidList):
+        # return None if no description has been created for this fiducial list
+        return landmarkDescriptionRegistry.get(fidList)
+
+    def setLandmarkDescription(self, fidList, landmarkDescription):
+        landmarkDescriptionRegistry.set(fidList, landmarkDescription)
+
+    def saveLandmarkDescription(self, fidList):
+        # write the description in the attribute "landmarkDescription" of the fiducial list
+        landmarkDescriptionRegistry.save(fidList)
 
     def warningMessage(self, message):
         messageBox = ctk.ctkMessageBox()
@@ -0,0 +1,100 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy
+import vtk
+import ShapeQuantifierBatchProjection
+
+#
+# Tests of the headless projection of landmarks: they only need vtk and numpy
+#
+
+fcsvHeaderLines = ['# Markups fiducial file version = 4.5',
+                   '# CoordinateSystem = 0',
+                   '# columns = id,x,y,z,ow,ox,oy,oz,vis,sel,lock,label,desc,associatedNodeID']
+
+
+class ShapeQuantifierBatchProjectionTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def writeSphere(self, name):
+        sphereSource = vtk.vtkSphereSource()
+        sphereSource.SetRadius(100.0)
+        sphereSource.Update()
+        writer = vtk.vtkPolyDataWriter()
+        writer.SetFileName(os.path.join(self.directory, name))
+        writer.SetInputData(sphereSource.GetOutput())
+        writer.Write()
+        return sphereSource.GetOutput()
+
+    def writeLandmarks(self, name, coords):
+        rows = list()
+        for i, coord in enumerate(coords):
+            rows.append(['vtkMRMLMarkupsFiducialNode_' + str(i)] + [repr(value) for value in coord] +
+                        ['0', '0', '0', '1', '1', '1', '0', 'F-' + str(i + 1), '', ''])
+        ShapeQuantifierBatchProjection.writeFCSV(os.path.join(self.directory, name), fcsvHeaderLines, rows)
+        return rows
+
+    def writeManifest(self, lines):
+        filename = os.path.join(self.directory, 'manifest.csv')
+        with open(filename, 'wb') as manifestFile:
+            for line in lines:
+                manifestFile.write(line + '\n')
+        return filename
+
+    def test_ReadManifest(self):
+        filename = self.writeManifest(['# mesh,fcsv', '', 'sphere.vtk, landmarks.fcsv', 'other/sphere.vtk,other.fcsv'])
+        pairs = ShapeQuantifierBatchProjection.readManifest(filename)
+        # the comments and the empty lines are skipped, the paths are relative to the manifest
+        self.assertEqual(pairs, [(os.path.join(self.directory, 'sphere.vtk'), os.path.join(self.directory, 'landmarks.fcsv')),
+                                 (os.path.join(self.directory, 'other', 'sphere.vtk'), os.path.join(self.directory, 'other.fcsv'))])
+        filename = self.writeManifest(['sphere.vtk'])
+        self.assertRaises(ValueError, ShapeQuantifierBatchProjection.readManifest, filename)
+
+    def test_FCSVRoundTrip(self):
+        rows = self.writeLandmarks('landmarks.fcsv', [[1.5, -2.25, 3.0], [0.1, 0.2, 0.3]])
+        headerLines, readRows = ShapeQuantifierBatchProjection.readFCSV(os.path.join(self.directory, 'landmarks.fcsv'))
+        self.assertEqual(headerLines, fcsvHeaderLines)
+        self.assertEqual(readRows, rows)
+
+    def test_ProjectLandmarks(self):
+        polyData = self.writeSphere('sphere.vtk')
+        coords = numpy.array([[58.602, 41.692, 62.569], [-59.713, -67.347, -19.529], [-10.573, -3.036, -93.381]])
+        self.writeLandmarks('landmarks.fcsv', coords)
+        projectedFilename, indexesFilename = \
+            ShapeQuantifierBatchProjection.projectLandmarks(os.path.join(self.directory, 'sphere.vtk'),
+                                                            os.path.join(self.directory, 'landmarks.fcsv'),
+                                                            self.directory)
+        headerLines, rows = ShapeQuantifierBatchProjection.readFCSV(projectedFilename)
+        self.assertEqual(headerLines, fcsvHeaderLines)
+        # each landmark is moved on the closest vertex of the mesh
+        points = numpy.array([polyData.GetPoint(i) for i in range(polyData.GetNumberOfPoints())])
+        for coord, row in zip(coords, rows):
+            closestPointIndex = ((points - coord) ** 2).sum(axis = 1).argmin()
+            numpy.testing.assert_allclose([float(value) for value in row[1:4]], points[closestPointIndex])
+        with open(indexesFilename, 'rb') as indexesFile:
+            lines = indexesFile.read().splitlines()
+        self.assertEqual(lines[0], 'label,markupID,closestPointIndex')
+        self.assertEqual(len(lines), len(coords) + 1)
+        self.assertTrue(lines[1].startswith('F-1,vtkMRMLMarkupsFiducialNode_0,'))
+
+    def test_WorkerFailure(self):
+        self.writeSphere('sphere.vtk')
+        self.writeLandmarks('landmarks.fcsv', [[58.602, 41.692, 62.569]])
+        self.writeLandmarks('failing.fcsv', [[58.602, 41.692, 62.569]])
+        manifest = self.writeManifest(['sphere.vtk,landmarks.fcsv', 'missing.vtk,failing.fcsv'])
+        outputDirectory = os.path.join(self.directory, 'output')
+        # the error of a worker does not stop the other pairs, it makes the batch fail
+        self.assertEqual(ShapeQuantifierBatchProjection.main([manifest, '-o', outputDirectory, '-p', '2']), 1)
+        self.assertTrue(os.path.exists(os.path.join(outputDirectory, 'landmarks_projected.fcsv')))
+        self.assertFalse(os.path.exists(os.path.join(outputDirectory, 'failing_projected.fcsv')))
+        fcsvFilename, error = ShapeQuantifierBatchProjection.projectPair((os.path.join(self.directory, 'missing.vtk'),
+                                                                          os.path.join(self.directory, 'failing.fcsv'),
+                                                                          outputDirectory))
+        self.assertTrue(error)
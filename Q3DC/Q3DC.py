@@ -282,13 +282,12 @@ class Q3DCWidget(ScriptedLoadableModuleWidget):
         end = list.GetNumberOfItems()
         for i in range(0,end):
             fidList = list.GetItemAsObject(i)
-            landmarkDescription = self.ShapeQuantifierCore.decodeJSON(fidList.GetAttribute("landmarkDescription"))
+            landmarkDescription = self.ShapeQuantifierCore.getLandmarkDescription(fidList)
             if landmarkDescription:
                 for n in range(fidList.GetNumberOfMarkups()):
                     markupID = fidList.GetNthMarkupID(n)
                     markupLabel = fidList.GetNthMarkupLabel(n)
-                    landmarkDescription[markupID]["landmarkLabel"] = markupLabel
-                fidList.SetAttribute("landmarkDescription",self.ShapeQuantifierCore.encodeJSON(landmarkDescription))
+                    landmarkDescription.setLabel(markupID, markupLabel)
 
         onSurface = self.loadLandmarksOnSurfacCheckBox.isChecked()
         self.ShapeQuantifierCore.connectLandmarks(self.inputModelSelector,
@@ -359,14 +358,41 @@ class Q3DCWidget(ScriptedLoadableModuleWidget):
                                                     self.fidListComboBoxlineLB.currentNode())
         self.ShapeQuantifierCore.UpdateThreeDView(self.landmarkComboBox.currentText)
 
+    def updateLinesEvent(self, obj, event):
+        if self.line1LAComboBox.currentText != '' and self.line1LBComboBox.currentText != '' \
+                and self.line1LAComboBox.currentText != self.line1LBComboBox.currentText :
+            # Clear Lines, then define new ones
+            if self.renderer1 :
+                self.renderer1.RemoveActor(self.actor1)
+            self.renderer1, self.actor1 = \
+                self.logic.drawLineBetween2Landmark(self.line1LAComboBox.currentText,
+                                                    self.line1LBComboBox.currentText,
+                                                    self.fidListComboBoxline1LA.currentNode(),
+                                                    self.fidListComboBoxline1LB.currentNode())
+        if self.line2LAComboBox.currentText != '' and self.line2LBComboBox.currentText != '' \
+                and self.line2LAComboBox.currentText != self.line2LBComboBox.currentText :
+            if self.renderer2 :
+                self.renderer2.RemoveActor(self.actor2)
+            self.renderer2, self.actor2 = \
+                self.logic.drawLineBetween2Landmark(self.line2LAComboBox.currentText,
+                                                    self.line2LBComboBox.currentText,
+                                                    self.fidListComboBoxline2LA.currentNode(),
+                                                    self.fidListComboBoxline2LB.currentNode())
+        if self.lineLAComboBox.currentText != '' and self.lineLBComboBox.currentText != '' \
+                and self.lineLAComboBox.currentText != self.lineLBComboBox.currentText :
+            if self.renderer3 :
+                self.renderer3.RemoveActor(self.actor3)
+            self.renderer3, self.actor3 = \
+                self.logic.drawLineBetween2Landmark(self.lineLAComboBox.currentText,
+                                                    self.lineLBComboBox.currentText,
+                                                    self.fidListComboBoxlineLA.currentNode(),
+                                                    self.fidListComboBoxlineLB.currentNode())
+
     def onModelChanged(self):
         print "-------Model Changed--------"
         if self.ShapeQuantifierCore.selectedModel:
             Model = self.ShapeQuantifierCore.selectedModel
-            try:
-                Model.RemoveObserver(self.ShapeQuantifierCore.decodeJSON(self.ShapeQuantifierCore.selectedModel.GetAttribute("modelModifieTagEvent")))
-            except:
-                pass
+            self.ShapeQuantifierCore.removeObserver(Model, Model.TransformModifiedEvent)
         self.ShapeQuantifierCore.selectedModel = self.inputModelSelector.currentNode()
         self.ShapeQuantifierCore.ModelChanged(self.inputModelSelector, self.inputLandmarksSelector)
         self.inputLandmarksSelector.setCurrentNode(None)
@@ -407,17 +433,16 @@ class Q3DCWidget(ScriptedLoadableModuleWidget):
             return
         selectedFidReflID = self.ShapeQuantifierCore.findIDFromLabel(fidList, self.landmarkComboBox.currentText)
         isOnSurface = self.surfaceDeplacementCheckBox.isChecked()
-        landmarkDescription = self.ShapeQuantifierCore.decodeJSON(fidList.GetAttribute("landmarkDescription"))
+        landmarkDescription = self.ShapeQuantifierCore.getLandmarkDescription(fidList)
         if isOnSurface:
             hardenModel = slicer.app.mrmlScene().GetNodeByID(fidList.GetAttribute("hardenModelID"))
-            landmarkDescription[selectedFidReflID]["projection"]["isProjected"] = True
-            landmarkDescription[selectedFidReflID]["projection"]["closestPointIndex"] =\
+            landmarkDescription[selectedFidReflID].isProjected = True
+            landmarkDescription[selectedFidReflID].closestPointIndex =\
                 self.ShapeQuantifierCore.projectOnSurface(hardenModel, fidList, selectedFidReflID)
         else:
-            landmarkDescription[selectedFidReflID]["projection"]["isProjected"] = False
-            landmarkDescription[selectedFidReflID]["projection"]["closestPointIndex"] = None
-            landmarkDescription[selectedFidReflID]["ROIradius"] = 0
-        fidList.SetAttribute("landmarkDescription",self.ShapeQuantifierCore.encodeJSON(landmarkDescription))
+            landmarkDescription[selectedFidReflID].isProjected = False
+            landmarkDescription[selectedFidReflID].closestPointIndex = None
+            landmarkDescription[selectedFidReflID].ROIradius = 0
 
     def onDefineMidPointClicked(self):
         fidList = self.ShapeQuantifierCore.selectedFidList
@@ -429,25 +454,24 @@ class Q3DCWidget(ScriptedLoadableModuleWidget):
         fidList.AddFiducial(coord[0],coord[1],coord[2])
         fidList.SetNthFiducialSelected(fidList.GetNumberOfMarkups() - 1, False)
         # update of the data structure
-        landmarkDescription = self.ShapeQuantifierCore.decodeJSON(fidList.GetAttribute("landmarkDescription"))
+        landmarkDescription = self.ShapeQuantifierCore.getLandmarkDescription(fidList)
         numOfMarkups = fidList.GetNumberOfMarkups()
         markupID = fidList.GetNthMarkupID(numOfMarkups - 1)
-        landmarkDescription[landmark1ID]["midPoint"]["definedByThisMarkup"].append(markupID)
-        landmarkDescription[landmark2ID]["midPoint"]["definedByThisMarkup"].append(markupID)
-        landmarkDescription[markupID]["midPoint"]["isMidPoint"] = True
-        landmarkDescription[markupID]["midPoint"]["Point1"] = landmark1ID
-        landmarkDescription[markupID]["midPoint"]["Point2"] = landmark2ID
-        landmarkDescription[markupID]["projection"]["isProjected"] = False
-        landmarkDescription[markupID]["projection"]["closestPointIndex"] = None
+        landmarkDescription[landmark1ID].definedByThisMarkup.append(markupID)
+        landmarkDescription[landmark2ID].definedByThisMarkup.append(markupID)
+        landmarkDescription[markupID].isMidPoint = True
+        landmarkDescription[markupID].Point1 = landmark1ID
+        landmarkDescription[markupID].Point2 = landmark2ID
+        landmarkDescription[markupID].isProjected = False
+        landmarkDescription[markupID].closestPointIndex = None
 
         if self.midPointOnSurfaceCheckBox.isChecked():
-            landmarkDescription[markupID]["projection"]["isProjected"] = True
+            landmarkDescription[markupID].isProjected = True
             hardenModel = slicer.app.mrmlScene().GetNodeByID(fidList.GetAttribute("hardenModelID"))
-            landmarkDescription[markupID]["projection"]["closestPointIndex"] = \
+            landmarkDescription[markupID].closestPointIndex = \
                 self.ShapeQuantifierCore.projectOnSurface(hardenModel, fidList, markupID)
         else:
-            landmarkDescription[markupID]["projection"]["isProjected"] = False
-        fidList.SetAttribute("landmarkDescription",self.ShapeQuantifierCore.encodeJSON(landmarkDescription))
+            landmarkDescription[markupID].isProjected = False
         self.UpdateInterface()
         self.ShapeQuantifierCore.updateLandmarkComboBox(fidList, self.landmarkComboBox, False)
         fidList.SetNthFiducialPositionFromArray(numOfMarkups - 1, coord)
@@ -613,8 +637,8 @@ class Q3DCLogic(ScriptedLoadableModuleLogic):
     def addOnDistanceList(self, distanceList, fidLabel1, fidLabel2, fidlist1, fidlist2):
         fidID1 = self.ShapeQuantifierCore.findIDFromLabel(fidlist1,fidLabel1)
         fidID2 = self.ShapeQuantifierCore.findIDFromLabel(fidlist2,fidLabel2)
-        landmark1Index = fidlist1.GetMarkupIndexByID(fidID1)
-        landmark2Index = fidlist2.GetMarkupIndexByID(fidID2)
+        landmark1Index = self.ShapeQuantifierCore.getMarkupIndex(fidlist1, fidID1)
+        landmark2Index = self.ShapeQuantifierCore.getMarkupIndex(fidlist2, fidID2)
         elementToAdd = self.distanceValuesStorage()
         # if this distance has already been computed before -> replace values
         for element in distanceList:
@@ -787,10 +811,10 @@ class Q3DCLogic(ScriptedLoadableModuleLogic):
         fidID1B= self.ShapeQuantifierCore.findIDFromLabel(fidlist1B,fidLabel1B)
         fidID2A = self.ShapeQuantifierCore.findIDFromLabel(fidlist2A,fidLabel2A)
         fidID2B = self.ShapeQuantifierCore.findIDFromLabel(fidlist2B,fidLabel2B)
-        landmark1Index = fidlist1A.GetMarkupIndexByID(fidID1A)
-        landmark2Index = fidlist1B.GetMarkupIndexByID(fidID1B)
-        landmark3Index = fidlist2A.GetMarkupIndexByID(fidID2A)
-        landmark4Index = fidlist2B.GetMarkupIndexByID(fidID2B)
+        landmark1Index = self.ShapeQuantifierCore.getMarkupIndex(fidlist1A, fidID1A)
+        landmark2Index = self.ShapeQuantifierCore.getMarkupIndex(fidlist1B, fidID1B)
+        landmark3Index = self.ShapeQuantifierCore.getMarkupIndex(fidlist2A, fidID2A)
+        landmark4Index = self.ShapeQuantifierCore.getMarkupIndex(fidlist2B, fidID2B)
         # if angles has already been computed before -> replace values
         elementToAdd = self.angleValuesStorage()
         for element in angleList:
@@ -923,11 +947,11 @@ class Q3DCLogic(ScriptedLoadableModuleLogic):
                            fidListLineLA, fidListLineLB,
                            fidLabelPoint, fidListPoint):
         lineLAID = self.ShapeQuantifierCore.findIDFromLabel(fidListLineLA, fidLabelLineA)
-        lineLAIndex = fidListLineLA.GetMarkupIndexByID(lineLAID)
+        lineLAIndex = self.ShapeQuantifierCore.getMarkupIndex(fidListLineLA, lineLAID)
         lineLBID = self.ShapeQuantifierCore.findIDFromLabel(fidListLineLB, fidLabelLineB)
-        lineLBIndex = fidListLineLB.GetMarkupIndexByID(lineLBID)
+        lineLBIndex = self.ShapeQuantifierCore.getMarkupIndex(fidListLineLB, lineLBID)
         PointID = self.ShapeQuantifierCore.findIDFromLabel(fidListPoint, fidLabelPoint)
-        PointIndex = fidListPoint.GetMarkupIndexByID(PointID)
+        PointIndex = self.ShapeQuantifierCore.getMarkupIndex(fidListPoint, PointID)
         elementToAdd = self.distanceLinePointStorage()
         # if this distance has already been computed before -> replace values
         for element in linePointList:
@@ -1021,8 +1045,8 @@ class Q3DCLogic(ScriptedLoadableModuleLogic):
 
         if not fidList1 or not fidList2:
             return None, None
-        landmark1Index = fidList1.GetMarkupIndexByID(landmark1ID)
-        landmark2Index = fidList2.GetMarkupIndexByID(landmark2ID)
+        landmark1Index = self.ShapeQuantifierCore.getMarkupIndex(fidList1, landmark1ID)
+        landmark2Index = self.ShapeQuantifierCore.getMarkupIndex(fidList2, landmark2ID)
 
         coord1 = [-1, -1, -1]
         coord2 = [-1, -1, -1]
@@ -1304,7 +1328,7 @@ class Q3DCTest(ScriptedLoadableModuleTest):
         self.widget.inputLandmarksSelector.setCurrentNode(inputMarkupsFiducial)
         for point in PlanePointsCoords:
             inputMarkupsFiducial.AddFiducial(point[0], point[1], point[2])
-            self.widget.ShapeQuantifierCore.onPointModifiedEvent(inputMarkupsFiducial,None)
+            self.widget.ShapeQuantifierCore.processPointModified(inputMarkupsFiducial)
 
         return True
 
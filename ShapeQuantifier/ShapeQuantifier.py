@@ -2,6 +2,7 @@ from __main__ import vtk, qt, ctk, slicer
 import os
 import sys
 import logging
+import numpy
 
 # ********************************************** #
 # **************** Useful class **************** #
@@ -475,12 +476,66 @@ class ShapeQuantifierTest(slicer.ScriptedLoadableModule.ScriptedLoadableModuleTe
         self.delayDisplay(' Test replaceLandmark Function ')
         self.assertTrue( self.testReplaceLandmarkFunction() )
 
+        self.delayDisplay(' Test projectAllOnSurface Function ')
+        self.assertTrue( self.testProjectAllOnSurfaceFunction() )
+
         self.delayDisplay(' Test DefineNeighbors Function ')
         self.assertTrue( self.testDefineNeighborsFunction() )
 
+        self.delayDisplay(' Test getGeodesicNeighborIDs Function ')
+        self.assertTrue( self.testGeodesicNeighborsFunction() )
+
         self.delayDisplay(' Test addArrayFromIdList Function ')
         self.assertTrue( self.testAddArrayFromIdListFunction() )
 
+        self.delayDisplay(' Test PolyDataCache ')
+        self.assertTrue( self.testPolyDataCacheFunction() )
+
+        self.delayDisplay(' Test ROILabelLayer ')
+        self.assertTrue( self.testROILabelLayerFunction() )
+
+        self.delayDisplay(' Test CoalescingTimer ')
+        self.assertTrue( self.testCoalescingTimerFunction() )
+
+        self.delayDisplay(' Test getMovedMarkupIDs Function ')
+        self.assertTrue( self.testGetMovedMarkupIDsFunction() )
+
+        self.delayDisplay(' Test WidgetIndex ')
+        self.assertTrue( self.testWidgetIndexFunction() )
+
+        self.delayDisplay(' Test computeMidPointUpdates Function ')
+        self.assertTrue( self.testMidPointUpdatesFunction() )
+
+        self.delayDisplay(' Test LandmarkDescriptionRegistry ')
+        self.assertTrue( self.testLandmarkDescriptionRegistryFunction() )
+
+        self.delayDisplay(' Test findIDFromLabel Function ')
+        self.assertTrue( self.testFindIDFromLabelFunction() )
+
+        self.delayDisplay(' Test ROIState ')
+        self.assertTrue( self.testROIStateFunction() )
+
+        self.delayDisplay(' Test getTransformedBounds Function ')
+        self.assertTrue( self.testTransformedBoundsFunction() )
+
+        self.delayDisplay(' Test ConnectedModelIndex ')
+        self.assertTrue( self.testConnectedModelIndexFunction() )
+
+        self.delayDisplay(' Test batchModify Function ')
+        self.assertTrue( self.testBatchModifyFunction() )
+
+        self.delayDisplay(' Test ObserverRegistry ')
+        self.assertTrue( self.testObserverRegistryFunction() )
+
+        self.delayDisplay(' Test updateMidPoints Function ')
+        self.assertTrue( self.testUpdateMidPointsFunction() )
+
+        self.delayDisplay(' Test removeMarkupIndexes Function ')
+        self.assertTrue( self.testRemoveMarkupIndexesFunction() )
+
+        self.delayDisplay(' Test updateMidPoints Function after a removal ')
+        self.assertTrue( self.testUpdateMidPointsAfterRemovalFunction() )
+
         self.delayDisplay(' Tests Passed! ')
 
 
@@ -529,6 +584,24 @@ class ShapeQuantifierTest(slicer.ScriptedLoadableModule.ScriptedLoadableModuleTe
                 print i, ' - Passed! '
         return True
 
+    def testProjectAllOnSurfaceFunction(self):
+        sphereModel = self.defineSphere()
+        markupsLogic = self.defineMarkupsLogic()
+        fidList = slicer.mrmlScene.GetNodeByID(markupsLogic.GetActiveListID())
+        markupIDs = [fidList.GetNthMarkupID(i) for i in range(fidList.GetNumberOfMarkups())]
+        closestPointIndexList = self.ShapeQuantifierCore.projectAllOnSurface(sphereModel, fidList, markupIDs)
+        if list(closestPointIndexList) != [9, 35, 1]:
+            print "test projectAllOnSurface: failed"
+            return False
+        # the landmarks have to be moved on the closest points
+        coord = [-1, -1, -1]
+        for i in range(0, fidList.GetNumberOfMarkups()):
+            fidList.GetNthFiducialPosition(i, coord)
+            if coord != list(sphereModel.GetPolyData().GetPoint(closestPointIndexList[i])):
+                print i, ' - Failed '
+                return False
+        return True
+
     def testDefineNeighborsFunction(self):
         sphereModel = self.defineSphere()
         polyData = sphereModel.GetPolyData()
@@ -559,6 +632,31 @@ class ShapeQuantifierTest(slicer.ScriptedLoadableModule.ScriptedLoadableModuleTe
                 print "test ",i ," AddArrayFromIdList: succeed"
         return True
 
+    def testGeodesicNeighborsFunction(self):
+        sphereModel = self.defineSphere()
+        polyData = sphereModel.GetPolyData()
+        closestPointIndexList = [9, 35, 1]
+        for i in range(0, 3):
+            seed = closestPointIndexList[i]
+            # no edge is shorter than 1mm on this sphere
+            IDs = self.ShapeQuantifierCore.getGeodesicNeighborIDs(polyData, seed, 1.0).tolist()
+            if IDs != [seed]:
+                print "test ",i ," getGeodesicNeighborIDs: failed"
+                return False
+            # the whole sphere is reached
+            IDs = self.ShapeQuantifierCore.getGeodesicNeighborIDs(polyData, seed, 1000.0).tolist()
+            if sorted(IDs) != range(polyData.GetNumberOfPoints()):
+                print "test ",i ," getGeodesicNeighborIDs: failed"
+                return False
+            # the distance along the surface is longer than the straight line
+            seedCoord = polyData.GetPoint(seed)
+            for ID in self.ShapeQuantifierCore.getGeodesicNeighborIDs(polyData, seed, 80.0).tolist():
+                if vtk.vtkMath.Distance2BetweenPoints(seedCoord, polyData.GetPoint(ID)) > 80.0 * 80.0:
+                    print "test ",i ," getGeodesicNeighborIDs: failed"
+                    return False
+            print "test ",i ," getGeodesicNeighborIDs: succeed"
+        return True
+
     def testAddArrayFromIdListFunction(self):
         sphereModel = self.defineSphere()
         polyData = sphereModel.GetPolyData()
@@ -569,13 +667,470 @@ class ShapeQuantifierTest(slicer.ScriptedLoadableModule.ScriptedLoadableModuleTe
             self.ShapeQuantifierCore.addArrayFromIdList(inter,
                                      sphereModel,
                                      'Test_' + str(i + 1))
-            if polyData.GetPointData().HasArray('Test_' + str(i + 1)) != 1:
+            # the ROI is stored in the label layer of the mesh
+            ROIMask = self.ShapeQuantifierCore.getROILabelLayer(polyData).getMask('Test_' + str(i + 1))
+            if ROIMask is None or sorted(numpy.flatnonzero(ROIMask).tolist()) != sorted(set(inter.GetId(n) for n in range(inter.GetNumberOfIds()))):
                 print "test ",i ," AddArrayFromIdList: failed"
                 return False
             else:
                 print "test ",i ," AddArrayFromIdList: succeed"
         return True
 
+    def testPolyDataCacheFunction(self):
+        import ShapeQuantifierComputation
+        sphereSource = vtk.vtkSphereSource()
+        sphereSource.Update()
+        polyData = sphereSource.GetOutput()
+        cache = ShapeQuantifierComputation.PolyDataCache(memoryBudget = 1024 * 1024 * 1024)
+        pointLocator = cache.get(polyData, ShapeQuantifierComputation.buildPointLocator)
+        if cache.get(polyData, ShapeQuantifierComputation.buildPointLocator) is not pointLocator:
+            print "test PolyDataCache: the locator is built again"
+            return False
+        # writing a ROI in the point data does not make the locator out of date
+        ShapeQuantifierComputation.ROILabelLayer(polyData).setROI('Test_1', numpy.array([0, 1, 2]))
+        if cache.get(polyData, ShapeQuantifierComputation.buildPointLocator) is not pointLocator:
+            print "test PolyDataCache: the locator is rebuilt after a modification of the point data"
+            return False
+        polyData.GetPoints().Modified()
+        if cache.get(polyData, ShapeQuantifierComputation.buildPointLocator) is pointLocator:
+            print "test PolyDataCache: the locator is not rebuilt after a modification of the points"
+            return False
+        # the polydata kept alive by the entry is counted in the budget
+        if cache.usedMemory < 1024 * polyData.GetActualMemorySize():
+            print "test PolyDataCache: the size of the polydata is not counted"
+            return False
+        cache.remove(polyData)
+        if cache.entries or cache.usedMemory != 0:
+            print "test PolyDataCache: the entry is not removed"
+            return False
+        return True
+
+    def testROILabelLayerFunction(self):
+        import ShapeQuantifierComputation
+        sphereSource = vtk.vtkSphereSource()
+        sphereSource.Update()
+        polyData = sphereSource.GetOutput()
+        labelLayer = ShapeQuantifierComputation.ROILabelLayer(polyData)
+        labelLayer.setROI('Test_1', numpy.array([0, 1, 2]))
+        mask = labelLayer.getMask('Test_1')
+        # the mask is a copy of the labels
+        mask[:] = False
+        if labelLayer.getMask('Test_1').sum() != 3:
+            print "test ROILabelLayer: the mask is a view on the labels"
+            return False
+        for i in range(2, ShapeQuantifierComputation.ROILabelLayer.maxNumberOfROIs + 1):
+            labelLayer.setROI('Test_' + str(i), numpy.array([i]))
+        try:
+            labelLayer.setROI('Test_33', numpy.array([0]))
+        except ValueError:
+            return True
+        print "test ROILabelLayer: no error past " + str(ShapeQuantifierComputation.ROILabelLayer.maxNumberOfROIs) + " ROIs"
+        return False
+
+    def testCoalescingTimerFunction(self):
+        import ShapeQuantifierCore
+        processedNodes = list()
+        timer = ShapeQuantifierCore.CoalescingTimer(processedNodes.append, 1000)
+        ShapeQuantifierCore.observerRegistry.setNodeRemovedCallback('TestCoalescingTimer', timer.cancel)
+        try:
+            fidList = slicer.vtkMRMLMarkupsFiducialNode()
+            slicer.mrmlScene.AddNode(fidList)
+            for i in range(10):
+                timer.schedule(fidList)
+            if len(timer.pendingNodes) != 1:
+                print "test CoalescingTimer: the burst is not collapsed"
+                return False
+            # the node removed from the scene is dropped from the pending nodes
+            slicer.mrmlScene.RemoveNode(fidList)
+            if timer.pendingNodes or timer.timer.isActive():
+                print "test CoalescingTimer: the removed node is still pending"
+                return False
+            timer.flush()
+            if processedNodes:
+                print "test CoalescingTimer: the removed node is processed"
+                return False
+        finally:
+            del ShapeQuantifierCore.observerRegistry.nodeRemovedCallbacks['TestCoalescingTimer']
+        return True
+
+    def testGetMovedMarkupIDsFunction(self):
+        import ShapeQuantifierCore
+        markupsLogic = self.defineMarkupsLogic()
+        fidList = slicer.mrmlScene.GetNodeByID(markupsLogic.GetActiveListID())
+        landmarkDescription = ShapeQuantifierCore.LandmarkDescription()
+        for n in range(fidList.GetNumberOfMarkups()):
+            landmarkDescription[fidList.GetNthMarkupID(n)] = ShapeQuantifierCore.LandmarkState(fidList.GetNthMarkupLabel(n))
+        logic = self.ShapeQuantifierCore
+        landmarkDescription.setPositions(fidList, logic.getLandmarkCoords(fidList))
+        # the moved landmark is found from the positions, without the interface
+        fidList.SetNthFiducialPositionFromArray(1, [0.0, 0.0, 100.0])
+        fidList.AddFiducial(1.0, 2.0, 3.0)
+        landmarkDescription[fidList.GetNthMarkupID(3)] = ShapeQuantifierCore.LandmarkState(fidList.GetNthMarkupLabel(3))
+        movedMarkupIDs = landmarkDescription.getMovedMarkupIDs(fidList, logic.getLandmarkCoords(fidList))
+        if movedMarkupIDs != [fidList.GetNthMarkupID(1), fidList.GetNthMarkupID(3)]:
+            print "test getMovedMarkupIDs: wrong moved landmarks " + str(movedMarkupIDs)
+            return False
+        landmarkDescription.setPositions(fidList, logic.getLandmarkCoords(fidList))
+        if landmarkDescription.getMovedMarkupIDs(fidList, logic.getLandmarkCoords(fidList)):
+            print "test getMovedMarkupIDs: landmarks moved after setPositions"
+            return False
+        return True
+
+    def testWidgetIndexFunction(self):
+        import ShapeQuantifierCore
+        root = qt.QWidget()
+        button = qt.QPushButton(root)
+        button.objectName = "testButton"
+        widgetIndex = ShapeQuantifierCore.WidgetIndex(root)
+        if widgetIndex.get("testButton") is not button:
+            print "test WidgetIndex: the button is not found"
+            return False
+        widgetIndex.get("missingWidget")
+        # the second miss does not walk the tree again
+        objects = widgetIndex.objects
+        if widgetIndex.get("missingWidget") is not None or widgetIndex.objects is not objects:
+            print "test WidgetIndex: the index is rebuilt for a name already missing"
+            return False
+        widget = qt.QLabel(root)
+        widget.objectName = "missingWidget"
+        widgetIndex.invalidate()
+        if widgetIndex.get("missingWidget") is not widget:
+            print "test WidgetIndex: the widget added is not found after invalidate"
+            return False
+        return True
+
+    def defineMidPoint(self, landmarkDescription, midPointID, point1ID, point2ID):
+        import ShapeQuantifierCore
+        # the label of a landmark already described is kept
+        landmarkLabel = landmarkDescription[midPointID].landmarkLabel if midPointID in landmarkDescription else midPointID
+        midPointState = ShapeQuantifierCore.LandmarkState(landmarkLabel)
+        midPointState.isMidPoint = True
+        midPointState.Point1 = point1ID
+        midPointState.Point2 = point2ID
+        landmarkDescription[midPointID] = midPointState
+        landmarkDescription[point1ID].definedByThisMarkup.append(midPointID)
+        landmarkDescription[point2ID].definedByThisMarkup.append(midPointID)
+
+    def testMidPointUpdatesFunction(self):
+        import ShapeQuantifierCore
+        import ShapeQuantifierComputation
+        # M2 is the midpoint of the midpoint M1 and of C
+        landmarkDescription = ShapeQuantifierCore.LandmarkDescription()
+        for markupID in ['A', 'B', 'C']:
+            landmarkDescription[markupID] = ShapeQuantifierCore.LandmarkState(markupID)
+        self.defineMidPoint(landmarkDescription, 'M1', 'A', 'B')
+        self.defineMidPoint(landmarkDescription, 'M2', 'M1', 'C')
+        markupIndexes = {'A': 0, 'B': 1, 'C': 2, 'M1': 3, 'M2': 4}
+        coords = numpy.array([[0.0, 0.0, 0.0], [4.0, 0.0, 0.0], [0.0, 8.0, 0.0], [0.0, 0.0, 0.0], [0.0, 0.0, 0.0]])
+        rows, midPointCoords, closestPointIndexes = \
+            ShapeQuantifierComputation.computeMidPointUpdates(landmarkDescription, coords, markupIndexes, ['A'])
+        # M1 is computed before M2, which uses its new position
+        if rows != [3, 4] or not numpy.allclose(midPointCoords, [[2.0, 0.0, 0.0], [1.0, 4.0, 0.0]]):
+            print "test computeMidPointUpdates: wrong chained midpoints " + str(rows) + " " + str(midPointCoords)
+            return False
+        # moving C only changes M2
+        rows, midPointCoords, closestPointIndexes = \
+            ShapeQuantifierComputation.computeMidPointUpdates(landmarkDescription, coords, markupIndexes, ['C'])
+        if rows != [4]:
+            print "test computeMidPointUpdates: wrong midpoints depending on C " + str(rows)
+            return False
+        # M3 and M4 are defined from each other
+        self.defineMidPoint(landmarkDescription, 'M3', 'A', 'B')
+        self.defineMidPoint(landmarkDescription, 'M4', 'M3', 'C')
+        landmarkDescription['M3'].Point2 = 'M4'
+        landmarkDescription['M4'].definedByThisMarkup.append('M3')
+        markupIndexes.update({'M3': 5, 'M4': 6})
+        coords = numpy.vstack([coords, numpy.zeros((2, 3))])
+        try:
+            ShapeQuantifierComputation.computeMidPointUpdates(landmarkDescription, coords, markupIndexes, ['A'])
+        except ValueError:
+            return True
+        print "test computeMidPointUpdates: no error for a cycle"
+        return False
+
+    def defineLandmarkDescription(self, fidList):
+        import ShapeQuantifierCore
+        landmarkDescription = ShapeQuantifierCore.LandmarkDescription()
+        for n in range(fidList.GetNumberOfMarkups()):
+            landmarkDescription[fidList.GetNthMarkupID(n)] = ShapeQuantifierCore.LandmarkState(fidList.GetNthMarkupLabel(n))
+        return landmarkDescription
+
+    def testLandmarkDescriptionRegistryFunction(self):
+        import ShapeQuantifierCore
+        markupsLogic = self.defineMarkupsLogic()
+        fidList = slicer.mrmlScene.GetNodeByID(markupsLogic.GetActiveListID())
+        landmarkDescription = self.defineLandmarkDescription(fidList)
+        landmarkDescription[fidList.GetNthMarkupID(0)].ROIradius = 3
+        landmarkDescription[fidList.GetNthMarkupID(1)].closestPointIndex = 35
+        self.ShapeQuantifierCore.setLandmarkDescription(fidList, landmarkDescription)
+        # the description is kept in memory, the attribute is only written when saving
+        if self.ShapeQuantifierCore.getLandmarkDescription(fidList) is not landmarkDescription \
+                or fidList.GetAttribute("landmarkDescription"):
+            print "test LandmarkDescriptionRegistry: the description is not kept in memory"
+            return False
+        self.ShapeQuantifierCore.saveLandmarkDescription(fidList)
+        savedDescription = ShapeQuantifierCore.LandmarkDescription.fromJSON(fidList.GetAttribute("landmarkDescription"))
+        for markupID, landmarkState in landmarkDescription.iteritems():
+            if savedDescription[markupID].toDict() != landmarkState.toDict():
+                print "test LandmarkDescriptionRegistry: the saved description is different"
+                return False
+        # the description of a removed fiducial list is dropped
+        fidListID = fidList.GetID()
+        slicer.mrmlScene.RemoveNode(fidList)
+        if fidListID in ShapeQuantifierCore.landmarkDescriptionRegistry.landmarkDescriptions:
+            print "test LandmarkDescriptionRegistry: the description of the removed list is kept"
+            return False
+        return True
+
+    def testFindIDFromLabelFunction(self):
+        markupsLogic = self.defineMarkupsLogic()
+        fidList = slicer.mrmlScene.GetNodeByID(markupsLogic.GetActiveListID())
+        self.ShapeQuantifierCore.setLandmarkDescription(fidList, self.defineLandmarkDescription(fidList))
+        markupIDs = [fidList.GetNthMarkupID(n) for n in range(fidList.GetNumberOfMarkups())]
+        if self.ShapeQuantifierCore.findIDFromLabel(fidList, fidList.GetNthMarkupLabel(1)) != markupIDs[1]:
+            print "test findIDFromLabel: the landmark is not found from its label"
+            return False
+        # the index follows the labels renamed in the fiducial list
+        oldLabel = fidList.GetNthMarkupLabel(1)
+        fidList.SetNthMarkupLabel(1, "renamedLandmark")
+        if self.ShapeQuantifierCore.findIDFromLabel(fidList, "renamedLandmark") != markupIDs[1] \
+                or self.ShapeQuantifierCore.findIDFromLabel(fidList, oldLabel) is not None:
+            print "test findIDFromLabel: the renamed landmark is not found from its new label"
+            return False
+        # the indexes of the following markups are shifted when a markup is removed
+        fidList.RemoveMarkup(0)
+        if self.ShapeQuantifierCore.getMarkupIndex(fidList, markupIDs[2]) != 1:
+            print "test findIDFromLabel: wrong index after the removal of a markup"
+            return False
+        return True
+
+    def testROIStateFunction(self):
+        import ShapeQuantifierCore
+        import ShapeQuantifierComputation
+        sphereSource = vtk.vtkSphereSource()
+        sphereSource.Update()
+        landmarkDescription = ShapeQuantifierCore.LandmarkDescription()
+        for markupID, indexClosestPoint, ROIradius in [('A', 0, 5), ('B', 3, 4)]:
+            landmarkDescription[markupID] = ShapeQuantifierCore.LandmarkState(markupID, True)
+            landmarkDescription[markupID].closestPointIndex = indexClosestPoint
+            landmarkDescription[markupID].ROIradius = ROIradius
+        computedROIs = list()
+        def getNeighborIDs(indexClosestPoint, ROIradius):
+            computedROIs.append(indexClosestPoint)
+            return numpy.arange(indexClosestPoint, indexClosestPoint + ROIradius)
+        ROIState = ShapeQuantifierComputation.ROIState(sphereSource.GetOutput(), "rings")
+        changedIDs = ROIState.update(landmarkDescription, getNeighborIDs)
+        if not numpy.array_equal(changedIDs, numpy.arange(7)) or ROIState.counts[3] != 2:
+            print "test ROIState: wrong first ROI " + str(changedIDs)
+            return False
+        # only the ROI of the landmark which moved is computed again
+        del computedROIs[:]
+        landmarkDescription['B'].closestPointIndex = 10
+        changedIDs = ROIState.update(landmarkDescription, getNeighborIDs)
+        if computedROIs != [10] or not numpy.array_equal(changedIDs, [3, 4, 5, 6, 10, 11, 12, 13]):
+            print "test ROIState: wrong vertices changed by the move " + str(changedIDs)
+            return False
+        # the vertices still in the ROI of A stay in the union
+        isInROI = ROIState.counts[changedIDs] > 0
+        if not numpy.array_equal(isInROI, [True, True, False, False, True, True, True, True]) \
+                or not numpy.array_equal(ROIState.getROIIDs(), [0, 1, 2, 3, 4, 10, 11, 12, 13]):
+            print "test ROIState: wrong union of the ROIs " + str(ROIState.getROIIDs())
+            return False
+        # a radius of 0 removes the ROI of the landmark
+        landmarkDescription['A'].ROIradius = 0
+        changedIDs = ROIState.update(landmarkDescription, getNeighborIDs)
+        if not numpy.array_equal(changedIDs, numpy.arange(5)) or ROIState.counts[:5].any():
+            print "test ROIState: the ROI of a landmark without radius is kept"
+            return False
+        return True
+
+    def testTransformedBoundsFunction(self):
+        slicer.mrmlScene.Clear(0)
+        sphereSource = vtk.vtkSphereSource()
+        sphereSource.SetRadius(100.0)
+        sphereSource.Update()
+        model = slicer.vtkMRMLModelNode()
+        model.SetName("TestBoundsModel")
+        model.SetAndObservePolyData(sphereSource.GetOutput())
+        slicer.mrmlScene.AddNode(model)
+        transformNode = slicer.vtkMRMLLinearTransformNode()
+        slicer.mrmlScene.AddNode(transformNode)
+        model.SetAndObserveTransformNodeID(transformNode.GetID())
+        transform = vtk.vtkTransform()
+        transform.Translate(10.0, 20.0, 30.0)
+        transform.Scale(2.0, 1.0, 0.5)
+        transformNode.SetMatrixTransformToParent(transform.GetMatrix())
+        # without rotation the bounds are the ones of the harden model
+        bounds = self.ShapeQuantifierCore.getTransformedBounds(model)
+        hardenBounds = self.ShapeQuantifierCore.createIntermediateHardenModel(model).GetPolyData().GetBounds()
+        if not numpy.allclose(bounds, hardenBounds):
+            print "test getTransformedBounds: " + str(bounds) + " instead of " + str(hardenBounds)
+            return False
+        # the bounds are computed again when the transform is modified, with a rotation they contain the model
+        transform.RotateZ(30.0)
+        transformNode.SetMatrixTransformToParent(transform.GetMatrix())
+        rotatedBounds = self.ShapeQuantifierCore.getTransformedBounds(model)
+        hardenBounds = self.ShapeQuantifierCore.createIntermediateHardenModel(model).GetPolyData().GetBounds()
+        if numpy.allclose(rotatedBounds, bounds) \
+                or (numpy.array(rotatedBounds[0::2]) > numpy.array(hardenBounds[0::2]) + 1e-6).any() \
+                or (numpy.array(rotatedBounds[1::2]) < numpy.array(hardenBounds[1::2]) - 1e-6).any():
+            print "test getTransformedBounds: " + str(rotatedBounds) + " does not contain " + str(hardenBounds)
+            return False
+        return True
+
+    def testConnectedModelIndexFunction(self):
+        slicer.mrmlScene.Clear(0)
+        model = slicer.vtkMRMLModelNode()
+        slicer.mrmlScene.AddNode(model)
+        fidLists = list()
+        for i in range(2):
+            fidList = slicer.vtkMRMLMarkupsFiducialNode()
+            slicer.mrmlScene.AddNode(fidList)
+            self.ShapeQuantifierCore.setConnectedModel(fidList, model)
+            fidLists.append(fidList)
+        if self.ShapeQuantifierCore.getConnectedFiducialLists(model) != fidLists \
+                or fidLists[0].GetAttribute("connectedModelID") != model.GetID():
+            print "test ConnectedModelIndex: the connected lists are not indexed"
+            return False
+        # a list added with the attribute (scene loaded from a file) is indexed
+        loadedFidList = slicer.vtkMRMLMarkupsFiducialNode()
+        loadedFidList.SetAttribute("connectedModelID", model.GetID())
+        slicer.mrmlScene.AddNode(loadedFidList)
+        if loadedFidList not in self.ShapeQuantifierCore.getConnectedFiducialLists(model):
+            print "test ConnectedModelIndex: the list added to the scene is not indexed"
+            return False
+        # disconnected and removed lists are dropped from the index
+        self.ShapeQuantifierCore.setConnectedModel(fidLists[0], None)
+        slicer.mrmlScene.RemoveNode(loadedFidList)
+        if self.ShapeQuantifierCore.getConnectedFiducialLists(model) != [fidLists[1]]:
+            print "test ConnectedModelIndex: the disconnected lists are still indexed"
+            return False
+        slicer.mrmlScene.RemoveNode(model)
+        if self.ShapeQuantifierCore.getConnectedFiducialLists(model):
+            print "test ConnectedModelIndex: the lists of the removed model are still indexed"
+            return False
+        return True
+
+    def testBatchModifyFunction(self):
+        markupsLogic = self.defineMarkupsLogic()
+        fidList = slicer.mrmlScene.GetNodeByID(markupsLogic.GetActiveListID())
+        self.ShapeQuantifierCore.setLandmarkDescription(fidList, self.defineLandmarkDescription(fidList))
+        events = list()
+        tag = fidList.AddObserver(fidList.PointModifiedEvent, lambda obj, event: events.append(event))
+        try:
+            with self.ShapeQuantifierCore.batchModify(fidList):
+                with self.ShapeQuantifierCore.batchModify(fidList):
+                    for n in range(fidList.GetNumberOfMarkups()):
+                        fidList.SetNthFiducialPositionFromArray(n, [n, n, n])
+                # the events are held until the end of the outermost batch
+                if events or not self.ShapeQuantifierCore.isInBatch(fidList):
+                    print "test batchModify: the events are sent at the end of the nested batch"
+                    return False
+            if not events or self.ShapeQuantifierCore.isInBatch(fidList):
+                print "test batchModify: the events are not sent at the end of the batch"
+                return False
+            if len(events) >= fidList.GetNumberOfMarkups():
+                print "test batchModify: the events are sent for each move"
+                return False
+        finally:
+            fidList.RemoveObserver(tag)
+        return True
+
+    def testObserverRegistryFunction(self):
+        import ShapeQuantifierCore
+        registry = ShapeQuantifierCore.observerRegistry
+        fidList = slicer.vtkMRMLMarkupsFiducialNode()
+        slicer.mrmlScene.AddNode(fidList)
+        calls = list()
+        registry.add(fidList, vtk.vtkCommand.ModifiedEvent, lambda obj, event: calls.append("first"), "TestModule")
+        # adding an observer for the same key replaces the previous one
+        registry.add(fidList, vtk.vtkCommand.ModifiedEvent, lambda obj, event: calls.append("second"), "TestModule")
+        fidList.Modified()
+        if calls != ["second"]:
+            print "test ObserverRegistry: the observers are accumulated " + str(calls)
+            return False
+        registry.suspend(fidList, vtk.vtkCommand.ModifiedEvent, "TestModule")
+        fidList.Modified()
+        registry.resume(fidList, vtk.vtkCommand.ModifiedEvent, "TestModule")
+        fidList.Modified()
+        if calls != ["second", "second"]:
+            print "test ObserverRegistry: the suspended observer is called " + str(calls)
+            return False
+        # the observers of a node removed from the scene are removed
+        slicer.mrmlScene.RemoveNode(fidList)
+        if registry.has(fidList, vtk.vtkCommand.ModifiedEvent, "TestModule"):
+            print "test ObserverRegistry: the observers of the removed node are kept"
+            return False
+        return True
+
+    def testUpdateMidPointsFunction(self):
+        markupsLogic = self.defineMarkupsLogic()
+        fidList = slicer.mrmlScene.GetNodeByID(markupsLogic.GetActiveListID())
+        landmarkDescription = self.defineLandmarkDescription(fidList)
+        markupIDs = [fidList.GetNthMarkupID(n) for n in range(fidList.GetNumberOfMarkups())]
+        # the third landmark is the midpoint of the two first ones
+        self.defineMidPoint(landmarkDescription, markupIDs[2], markupIDs[0], markupIDs[1])
+        self.ShapeQuantifierCore.setLandmarkDescription(fidList, landmarkDescription)
+        fidList.SetNthFiducialPositionFromArray(0, [10.0, 20.0, 30.0])
+        self.ShapeQuantifierCore.updateMidPoints(fidList, [markupIDs[0]])
+        coords = self.ShapeQuantifierCore.getLandmarkCoords(fidList)
+        if not numpy.allclose(coords[2], (coords[0] + coords[1]) / 2.0):
+            print "test updateMidPoints: the midpoint is not moved with the landmark " + str(coords[2])
+            return False
+        return True
+
+    def testRemoveMarkupIndexesFunction(self):
+        markupsLogic = self.defineMarkupsLogic()
+        fidList = slicer.mrmlScene.GetNodeByID(markupsLogic.GetActiveListID())
+        fidList.AddFiducial(1.0, 2.0, 3.0)
+        landmarkDescription = self.defineLandmarkDescription(fidList)
+        landmarkDescription.updateIndexes(fidList)
+        markupIDs = [fidList.GetNthMarkupID(n) for n in range(fidList.GetNumberOfMarkups())]
+        # the third landmark is the midpoint of the two first ones
+        self.defineMidPoint(landmarkDescription, markupIDs[2], markupIDs[0], markupIDs[1])
+        fidList.RemoveMarkup(1)
+        removedIDs = landmarkDescription.removeMarkupIndexes(fidList)
+        if removedIDs != [markupIDs[1]] or \
+                landmarkDescription.IDToIndex != {markupIDs[0]: 0, markupIDs[2]: 1, markupIDs[3]: 2}:
+            print "test removeMarkupIndexes: wrong indexes after a removal " + str(landmarkDescription.IDToIndex)
+            return False
+        # the midpoint loses its parent, it becomes a landmark
+        landmarkDescription.removeLandmark(markupIDs[1])
+        if markupIDs[1] in landmarkDescription or landmarkDescription[markupIDs[2]].isMidPoint \
+                or landmarkDescription[markupIDs[0]].definedByThisMarkup:
+            print "test removeMarkupIndexes: the removed landmark is still referenced"
+            return False
+        # two markups removed at once: the indexes are rebuilt
+        fidList.RemoveMarkup(2)
+        fidList.RemoveMarkup(0)
+        removedIDs = landmarkDescription.removeMarkupIndexes(fidList)
+        if sorted(removedIDs) != sorted([markupIDs[0], markupIDs[3]]) or landmarkDescription.IDToIndex != {markupIDs[2]: 0}:
+            print "test removeMarkupIndexes: wrong indexes after two removals " + str(landmarkDescription.IDToIndex)
+            return False
+        return True
+
+    def testUpdateMidPointsAfterRemovalFunction(self):
+        markupsLogic = self.defineMarkupsLogic()
+        fidList = slicer.mrmlScene.GetNodeByID(markupsLogic.GetActiveListID())
+        landmarkDescription = self.defineLandmarkDescription(fidList)
+        landmarkDescription.updateIndexes(fidList)
+        markupIDs = [fidList.GetNthMarkupID(n) for n in range(fidList.GetNumberOfMarkups())]
+        self.defineMidPoint(landmarkDescription, markupIDs[2], markupIDs[0], markupIDs[1])
+        self.ShapeQuantifierCore.setLandmarkDescription(fidList, landmarkDescription)
+        # the midpoint is removed without our observers: it is still in the description
+        fidList.RemoveMarkup(2)
+        fidList.SetNthFiducialPositionFromArray(0, [10.0, 20.0, 30.0])
+        try:
+            self.ShapeQuantifierCore.updateMidPoints(fidList, [markupIDs[0]])
+        except KeyError as error:
+            print "test updateMidPoints: error after the removal of a midpoint " + str(error)
+            return False
+        coords = self.ShapeQuantifierCore.getLandmarkCoords(fidList)
+        if len(coords) != 2 or not numpy.allclose(coords[0], [10.0, 20.0, 30.0]):
+            print "test updateMidPoints: the landmarks are changed after the removal of a midpoint"
+            return False
+        return True
+
     def defineSphere(self):
         sphereSource = vtk.vtkSphereSource()
         sphereSource.SetRadius(100.0)